@@ -2,139 +2,466 @@
 import requests
 import time
 import logging
-from typing import Dict, Any, Optional
+import threading
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Dict, Any, Optional, Iterator, List
 from config import Config
+from rate_limiter import TokenBucket, AdaptiveConcurrency
+from retry import backoff_delay
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from metrics import MigrationMetrics
 
 logger = logging.getLogger(__name__)
 
+def build_qr_code_url(nota: Dict[str, Any]) -> Optional[str]:
+    """Constrói URL do QR Code baseada nos dados da nota (usada pelos dois clientes)"""
+    try:
+        # Remove espaços e caracteres especiais
+        chave = str(nota.get('chave', '')).strip()
+        versao = str(nota.get('versao', '')).strip()
+        ambiente = str(nota.get('ambiente', '')).strip()
+        cIdToken = str(nota.get('cIdToken', '')).strip()
+        vSig = str(nota.get('vSig', '')).strip()
+        
+        # Constrói URL baseada na sua query SQL
+        qr_url = f"https://www.sefaz.mt.gov.br/nfce/consultanfce?p={chave}|{versao}|{ambiente}|{cIdToken}|{vSig}"
+        
+        logger.debug("🔗 QR Code gerado: %s", qr_url)
+        return qr_url
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao construir QR Code: {e}")
+        return None
+
+def build_circuit_breaker(probe: Callable[[], bool], config: Config) -> CircuitBreaker:
+    """Disjuntor com os parâmetros CIRCUIT_* de `config` (clientes síncrono e assíncrono)"""
+    return CircuitBreaker(
+        probe=probe,
+        window=config.CIRCUIT_WINDOW,
+        min_requests=config.CIRCUIT_MIN_REQUESTS,
+        error_rate=config.CIRCUIT_ERROR_RATE,
+        open_seconds=config.CIRCUIT_OPEN_SECONDS,
+        half_open_requests=config.CIRCUIT_HALF_OPEN_REQUESTS
+    )
+
+def json_value(value: Any) -> Any:
+    """Valor do banco antigo em tipo serializável por JSON
+    
+    MySQL e PostgreSQL devolvem as colunas DECIMAL como Decimal e as de data
+    como datetime (e o snapshot preserva esses tipos); o json do requests
+    recusa os dois. Decimal vira float (o servidor converte com parseFloat)
+    e datas viram ISO 8601.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):  # inclui datetime
+        return value.isoformat()
+    return value
+
 class APIClient:
     """Cliente para API do sistema novo"""
     
-    def __init__(self):
-        self.config = Config()
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'User-Agent': 'NFC-e-Migration/1.0'
-        })
+    def __init__(self, max_concurrency: int = None, metrics: MigrationMetrics = None,
+                 config: Config = None):
+        # Mesma instância do motor: ajustes por execução (URL, DRY_RUN) valem aqui também
+        self.config = config or Config()
+        # requests.Session não é garantidamente thread-safe: cada worker usa a sua
+        self._local = threading.local()
+        
+        # Controle de carga: teto fixo de taxa + concorrência adaptativa (AIMD)
+        self.rate_limiter = TokenBucket(self.config.RATE_LIMIT, self.config.RATE_BURST or None)
+        max_concurrency = max_concurrency or self.config.MIGRATION_WORKERS
+        self.concurrency = None
+        if self.config.ADAPTIVE_CONCURRENCY and max_concurrency > 1:
+            self.concurrency = AdaptiveConcurrency(
+                initial=self.config.CONCURRENCY_INITIAL,
+                minimum=self.config.CONCURRENCY_MIN,
+                maximum=max_concurrency,
+                latency_tolerance=self.config.LATENCY_TOLERANCE
+            )
+        
+        # Disjuntor: com a API fora do ar o envio pausa em vez de gastar tentativas
+        self.circuit_breaker = None
+        if self.config.CIRCUIT_BREAKER:
+            self.circuit_breaker = self.create_circuit_breaker(self.test_connection)
+        
+        # Latência por status, requisições em andamento e novas tentativas
+        self.metrics = metrics
+    
+    def create_circuit_breaker(self, probe) -> CircuitBreaker:
+        """Disjuntor com os parâmetros CIRCUIT_* da configuração deste cliente"""
+        return build_circuit_breaker(probe, self.config)
+    
+    @property
+    def session(self) -> requests.Session:
+        """Sessão HTTP da thread atual (criada sob demanda, com keep-alive)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({
+                'Content-Type': 'application/json',
+                'User-Agent': 'NFC-e-Migration/1.0'
+            })
+            self._local.session = session
+        return session
     
-    def build_qr_code_url(self, nota: Dict[str, Any]) -> str:
+    def build_qr_code_url(self, nota: Dict[str, Any]) -> Optional[str]:
         """Constrói URL do QR Code baseada nos dados da nota"""
+        return build_qr_code_url(nota)
+    
+    @staticmethod
+    def is_overload_status(status_code: int) -> bool:
+        """Indica se o status HTTP sinaliza sobrecarga do servidor"""
+        return status_code == 429 or status_code >= 500
+    
+    @classmethod
+    def is_retryable_failure(cls, result: Dict[str, Any]) -> bool:
+        """Indica se vale tentar de novo (timeout, conexão, 408, 429, 5xx)
+        
+        400, 409 e demais 4xx são rejeições definitivas: repetir só gasta
+        requisições.
+        """
+        status_code = result.get('status_code')
+        if status_code is not None:
+            return status_code == 408 or cls.is_overload_status(status_code)
+        return result.get('retryable', False)
+    
+    def _post(self, url: str, payload: Dict[str, Any], timeout: float = 30) -> requests.Response:
+        """POST respeitando o disjuntor, o limite de taxa e a concorrência adaptativa"""
+        if self.circuit_breaker is not None:
+            # API fora do ar: a thread espera aqui até o disjuntor liberar
+            self.circuit_breaker.acquire()
+        self.rate_limiter.acquire()
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+        
+        if self.metrics is not None:
+            self.metrics.request_started()
+        start = time.monotonic()
+        overloaded = True
+        status = 'erro'
         try:
-            # Remove espaços e caracteres especiais
-            chave = str(nota.get('chave', '')).strip()
-            versao = str(nota.get('versao', '')).strip()
-            ambiente = str(nota.get('ambiente', '')).strip()
-            cIdToken = str(nota.get('cIdToken', '')).strip()
-            vSig = str(nota.get('vSig', '')).strip()
-            
-            # Constrói URL baseada na sua query SQL
-            qr_url = f"https://www.sefaz.mt.gov.br/nfce/consultanfce?p={chave}|{versao}|{ambiente}|{cIdToken}|{vSig}"
-            
-            logger.debug(f"🔗 QR Code gerado: {qr_url}")
-            return qr_url
-            
-        except Exception as e:
-            logger.error(f"❌ Erro ao construir QR Code: {e}")
-            return None
+            response = self.session.post(url, json=payload, timeout=timeout)
+            status = response.status_code
+            overloaded = self.is_overload_status(response.status_code)
+            return response
+        except requests.exceptions.Timeout:
+            status = 'timeout'
+            raise
+        except requests.exceptions.ConnectionError:
+            status = 'conexao'
+            raise
+        except Exception:
+            # Erros locais (ex.: serialização) não dizem nada sobre o servidor
+            overloaded = False
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            if self.concurrency is not None:
+                self.concurrency.release(overloaded, elapsed)
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record(not overloaded)
+            if self.metrics is not None:
+                self.metrics.request_finished(url, status, elapsed)
     
     def process_nfce(self, qr_url: str, max_retries: int = None) -> Dict[str, Any]:
         """Processa NFC-e usando o endpoint de scan"""
         if max_retries is None:
             max_retries = self.config.MAX_RETRIES
         
+        payload = {
+            "qrCode": qr_url
+        }
+        
+        if self.config.DRY_RUN:
+            logger.info(f"🧪 DRY RUN - Payload que seria enviado: {payload}")
+            return {
+                "success": True,
+                "data": {"chave": "DRY_RUN_TEST"},
+                "message": "DRY RUN - NFC-e não foi processada",
+                "dry_run": True
+            }
+        
+        response, failure = self._post_with_retries(
+            self.config.API_SCAN_ENDPOINT,
+            payload,
+            accepted=(200,),
+            timeout=30,
+            max_retries=max_retries
+        )
+        if response is None:
+            return failure
+        
+        result = response.json()
+        logger.debug("✅ NFC-e processada com sucesso: %s", result.get('message', ''))
+        return result
+    
+    def process_nfce_batch(self, qr_urls: List[str], max_retries: int = None) -> List[Dict[str, Any]]:
+        """Processa várias NFC-e em uma única requisição (/api/scan/process-batch)
+        
+        Retorna uma resposta por QR Code, na mesma ordem e no mesmo formato de
+        process_nfce. Só a requisição inteira é repetida (timeout, conexão,
+        429/5xx); falhas de itens individuais voltam como falhas do item.
+        Mais QR Codes que SCAN_BATCH_MAX (o limite do servidor, que recusa o
+        excesso com 413) viram várias requisições, cada uma com timeout de
+        30s por QR Code até o teto SCAN_BATCH_TIMEOUT.
+        """
+        if max_retries is None:
+            max_retries = self.config.MAX_RETRIES
+        
+        if self.config.DRY_RUN:
+            logger.info(f"🧪 DRY RUN - Lote de {len(qr_urls)} QR Codes que seria enviado")
+            return [
+                {
+                    "success": True,
+                    "data": {"chave": "DRY_RUN_TEST"},
+                    "message": "DRY RUN - NFC-e não foi processada",
+                    "dry_run": True
+                }
+                for _ in qr_urls
+            ]
+        
+        step = max(1, self.config.SCAN_BATCH_MAX)
+        results = []
+        for start in range(0, len(qr_urls), step):
+            results.extend(self._process_batch_chunk(qr_urls[start:start + step], max_retries))
+        return results
+    
+    def _process_batch_chunk(self, qr_urls: List[str], max_retries: int) -> List[Dict[str, Any]]:
+        """Uma requisição de /api/scan/process-batch com até SCAN_BATCH_MAX QR Codes
+        
+        Um lote que estoura o timeout não é repetido inteiro: é dividido ao
+        meio e cada metade vai numa requisição própria, até uma nota por vez.
+        Assim uma nota travada na SEFAZ prende só a sua metade, e nenhuma
+        requisição espera mais que SCAN_BATCH_TIMEOUT.
+        """
+        response, failure = self._post_with_retries(
+            self.config.API_SCAN_BATCH_ENDPOINT,
+            {"qrCodes": qr_urls},
+            accepted=(200,),
+            timeout=min(30 * len(qr_urls), self.config.SCAN_BATCH_TIMEOUT),
+            max_retries=max_retries,
+            retry_timeouts=len(qr_urls) == 1
+        )
+        if response is None:
+            if failure.get('error_class') == 'timeout' and len(qr_urls) > 1:
+                half = len(qr_urls) // 2
+                logger.warning(f"⏰ Lote de {len(qr_urls)} QR Codes estourou o timeout: dividindo em {half} + {len(qr_urls) - half}")
+                return (self._process_batch_chunk(qr_urls[:half], max_retries)
+                        + self._process_batch_chunk(qr_urls[half:], max_retries))
+            return [dict(failure) for _ in qr_urls]
+        
+        results = [None] * len(qr_urls)
+        for item in response.json().get('results', []):
+            index = item.get('index') if isinstance(item, dict) else None
+            if not isinstance(index, int) or not 0 <= index < len(qr_urls) or results[index] is not None:
+                # Item sem índice válido: a nota dele fica como ausente (falha)
+                logger.warning("⚠️ Item malformado na resposta do lote: %.200r", item)
+                continue
+            item = dict(item)
+            del item['index']
+            status_code = item.pop('status', 200)
+            if status_code != 200:
+                item = {
+                    "success": False,
+                    "error": f"Erro HTTP {status_code}: {item.get('message', '')}",
+                    "status_code": status_code
+                }
+            results[index] = item
+        
+        return [
+            result if result is not None
+            else {"success": False, "error": "Item ausente na resposta do lote", "error_class": "resposta_lote"}
+            for result in results
+        ]
+    
+    def build_save_payload(self, nota: Dict[str, Any], itens: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Monta o corpo de /api/notas/salvar a partir da nota e dos itens do banco antigo"""
+        return {
+            "chave": str(nota.get('chave', '')).strip(),
+            "versao": str(nota.get('versao', '')).strip(),
+            "tpAmb": str(nota.get('ambiente', '')).strip(),
+            "cIdToken": str(nota.get('cIdToken', '')).strip(),
+            "vSig": str(nota.get('vSig', '')).strip(),
+            "emitente": {
+                "cnpj": json_value(nota.get('cnpjEmitente')),
+                "nome": json_value(nota.get('nomeEmitente')),
+                "ie": json_value(nota.get('ieEmitente'))
+            },
+            "itens": [
+                {
+                    "codigo": json_value(item.get('codigo')),
+                    "descricao": json_value(item.get('descricao')),
+                    "qtde": json_value(item.get('quantidade')),
+                    "un": json_value(item.get('unidade')),
+                    "unitario": json_value(item.get('valorUnitario')),
+                    "total": json_value(item.get('valorTotal'))
+                }
+                for item in itens
+            ]
+        }
+    
+    def save_nfce(self, payload: Dict[str, Any], max_retries: int = None) -> Dict[str, Any]:
+        """Salva NFC-e com itens já conhecidos (/api/notas/salvar), sem novo scrape
+        
+        Retorna no mesmo formato de process_nfce: 201 vira `salva` e 409 vira
+        `duplicada`.
+        """
+        if max_retries is None:
+            max_retries = self.config.MAX_RETRIES
+        
+        if self.config.DRY_RUN:
+            logger.info(f"🧪 DRY RUN - Nota {payload.get('chave')} com {len(payload.get('itens', []))} itens seria salva")
+            return {
+                "success": True,
+                "data": {"chave": "DRY_RUN_TEST"},
+                "message": "DRY RUN - NFC-e não foi salva",
+                "dry_run": True
+            }
+        
+        response, failure = self._post_with_retries(
+            self.config.API_SAVE_ENDPOINT,
+            payload,
+            accepted=(201, 409),
+            timeout=30,
+            max_retries=max_retries
+        )
+        if response is None:
+            return failure
+        
+        result = response.json()
+        if response.status_code == 409:
+            return {
+                "success": True,
+                "message": result.get('message', ''),
+                "salva": {"status": "duplicada", "message": result.get('message', '')}
+            }
+        
+        return {
+            "success": True,
+            "message": result.get('message', 'NFC-e salva com sucesso!'),
+            "salva": {"status": "salva", "id": result.get('id')}
+        }
+    
+    def _post_with_retries(self, url: str, payload: Dict[str, Any], accepted: tuple,
+                           timeout: float, max_retries: int, retry_timeouts: bool = True):
+        """POST com backoff; retorna (resposta aceita, None) ou (None, falha)
+        
+        Só falhas transitórias (is_retryable_failure) são repetidas; 4xx como
+        400 e 409 voltam na primeira tentativa. Com max_retries=0 a espera
+        fica a cargo do RetryScheduler, sem prender a thread. Com
+        `retry_timeouts` falso um timeout volta na hora (o lote é dividido).
+        """
+        failure = {
+            "success": False,
+            "error": "Número máximo de tentativas excedido"
+        }
+        
         for attempt in range(max_retries + 1):
             try:
-                logger.info(f"🔄 Tentativa {attempt + 1}/{max_retries + 1} - Processando NFC-e")
-                
-                payload = {
-                    "qrCode": qr_url
-                }
+                logger.debug("🔄 Tentativa %d/%d - POST %s", attempt + 1, max_retries + 1, url)
+                response = self._post(url, payload, timeout=timeout)
                 
-                if self.config.DRY_RUN:
-                    logger.info(f"🧪 DRY RUN - Payload que seria enviado: {payload}")
-                    return {
-                        "success": True,
-                        "data": {"chave": "DRY_RUN_TEST"},
-                        "message": "DRY RUN - NFC-e não foi processada",
-                        "dry_run": True
-                    }
+                if response.status_code in accepted:
+                    return response, None
                 
-                response = self.session.post(
-                    self.config.API_SCAN_ENDPOINT,
-                    json=payload,
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"✅ NFC-e processada com sucesso: {result.get('message', '')}")
-                    return result
-                else:
-                    error_msg = f"Erro HTTP {response.status_code}: {response.text}"
-                    logger.warning(f"⚠️ {error_msg}")
-                    
-                    if attempt < max_retries:
-                        delay = self.config.RETRY_DELAY * (2 ** attempt)  # Backoff exponencial
-                        logger.info(f"⏳ Aguardando {delay}s antes da próxima tentativa...")
-                        time.sleep(delay)
-                        continue
-                    else:
-                        return {
-                            "success": False,
-                            "error": error_msg,
-                            "status_code": response.status_code
-                        }
-                        
+                failure = {
+                    "success": False,
+                    "error": f"Erro HTTP {response.status_code}: {response.text}",
+                    "status_code": response.status_code
+                }
+                logger.warning("⚠️ %s", failure['error'])
+            
             except requests.exceptions.Timeout:
-                error_msg = "Timeout na requisição"
-                logger.warning(f"⏰ {error_msg}")
-                
-                if attempt < max_retries:
-                    delay = self.config.RETRY_DELAY * (2 ** attempt)
-                    logger.info(f"⏳ Aguardando {delay}s antes da próxima tentativa...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        "success": False,
-                        "error": error_msg
-                    }
-                    
+                failure = {"success": False, "error": "Timeout na requisição", "retryable": True,
+                           "error_class": "timeout"}
+                logger.warning("⏰ Timeout na requisição")
+            
             except requests.exceptions.ConnectionError:
-                error_msg = "Erro de conexão com a API"
-                logger.error(f"🔌 {error_msg}")
-                
-                if attempt < max_retries:
-                    delay = self.config.RETRY_DELAY * (2 ** attempt)
-                    logger.info(f"⏳ Aguardando {delay}s antes da próxima tentativa...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        "success": False,
-                        "error": error_msg
-                    }
-                    
+                failure = {"success": False, "error": "Erro de conexão com a API", "retryable": True,
+                           "error_class": "conexao"}
+                logger.error("🔌 Erro de conexão com a API")
+            
+            except CircuitOpenError as e:
+                # Disjuntor cancelado (encerramento): não há por que insistir
+                failure = {"success": False, "error": str(e), "cancelled": True}
+                break
+            
+            except requests.exceptions.RequestException as e:
+                failure = {"success": False, "error": f"Erro na requisição: {str(e)}", "retryable": True,
+                           "error_class": "conexao"}
+                logger.error("🔌 %s", failure['error'])
+            
             except Exception as e:
-                error_msg = f"Erro inesperado: {str(e)}"
-                logger.error(f"💥 {error_msg}")
-                
-                if attempt < max_retries:
-                    delay = self.config.RETRY_DELAY * (2 ** attempt)
-                    logger.info(f"⏳ Aguardando {delay}s antes da próxima tentativa...")
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        "success": False,
-                        "error": error_msg
-                    }
+                # Erro local (ex.: resposta ilegível): repetir não muda nada
+                failure = {"success": False, "error": f"Erro inesperado: {str(e)}", "error_class": "inesperado"}
+                logger.error("💥 %s", failure['error'])
+            
+            if not self.is_retryable_failure(failure):
+                break
+            if not retry_timeouts and failure.get('error_class') == 'timeout':
+                break
+            
+            if attempt < max_retries:
+                delay = backoff_delay(attempt, self.config.RETRY_DELAY, self.config.RETRY_MAX_DELAY)
+                logger.info("⏳ Aguardando %.1fs antes da próxima tentativa...", delay)
+                if self.metrics is not None:
+                    self.metrics.record_retry()
+                time.sleep(delay)
         
-        return {
-            "success": False,
-            "error": "Número máximo de tentativas excedido"
-        }
+        return None, failure
+    
+    def iter_existing_chaves(self, page_size: int = None) -> Iterator[str]:
+        """Percorre as chaves já salvas no sistema novo (GET /api/notas/chaves, por id)
+        
+        Paginação por keyset: cada página pede as chaves com id maior que o
+        último visto, então percorrer a tabela toda é linear. Servidor sem a
+        rota (versão anterior) cai no GET /api/notas paginado por OFFSET, que
+        conta os itens de cada nota e fica quadrático em tabelas grandes.
+        """
+        if page_size is None:
+            page_size = self.config.PREFLIGHT_PAGE_SIZE
+        
+        after = 0
+        while True:
+            response = self.session.get(
+                self.config.API_CHAVES_ENDPOINT,
+                params={'after': after, 'limit': page_size},
+                timeout=60
+            )
+            if response.status_code == 404 and after == 0:
+                logger.warning("⚠️ Servidor sem /api/notas/chaves: pré-verificação pelo /api/notas paginado (lento)")
+                yield from self._iter_chaves_by_page(page_size)
+                return
+            response.raise_for_status()
+            data = response.json()
+            
+            yield from data.get('chaves', [])
+            
+            if data.get('next') is None:
+                break
+            after = data['next']
+    
+    def _iter_chaves_by_page(self, page_size: int) -> Iterator[str]:
+        """Chaves pelo GET /api/notas (page/limit), para servidores sem /api/notas/chaves"""
+        page = 1
+        while True:
+            response = self.session.get(
+                self.config.API_NOTAS_ENDPOINT,
+                params={'page': page, 'limit': page_size},
+                timeout=60
+            )
+            response.raise_for_status()
+            data = response.json()
+            
+            for nota in data.get('notas', []):
+                if nota.get('chave'):
+                    yield nota['chave']
+            
+            if page >= data.get('pages', 0):
+                break
+            page += 1
     
     def test_connection(self) -> bool:
         """Testa conexão com a API"""
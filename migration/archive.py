@@ -0,0 +1,252 @@
+# migration/archive.py
+import os
+import gzip
+import json
+import sqlite3
+import argparse
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Campos de `data` (resposta do scan) aceitos por /api/notas/salvar
+SAVE_FIELDS = ('chave', 'versao', 'tpAmb', 'cIdToken', 'vSig', 'emitente', 'itens')
+
+def _codec(name: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """(comprimir, descomprimir) do formato pedido"""
+    if name == 'gzip':
+        return (lambda data: gzip.compress(data, compresslevel=6)), gzip.decompress
+    if name == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("ARCHIVE_COMPRESSION=zstd requer o pacote zstandard (pip install zstandard)")
+        # Compressor/descompressor não são thread-safe: um por chamada
+        return (
+            lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data)
+        )
+    raise ValueError(f"Compressão não suportada: {name} (use gzip ou zstd)")
+
+def is_complete(response: Dict[str, Any]) -> bool:
+    """Resposta com os detalhes da SEFAZ (emitente e itens), que vale arquivar
+
+    Quando a página da SEFAZ não pode ser lida, o scan devolve sucesso só com
+    os dados do QR Code, um `warning` e `itens` vazio; reimportar isso
+    gravaria a nota sem itens.
+    """
+    data = response.get('data') or {}
+    return not response.get('warning') and bool(data.get('itens'))
+
+def save_payload(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Corpo de /api/notas/salvar a partir de uma resposta arquivada do scan"""
+    data = response.get('data') or {}
+    return {field: data.get(field) for field in SAVE_FIELDS}
+
+class ScanArchive:
+    """Arquivo local das respostas de /api/scan/process, por chave
+
+    A resposta do scan traz a parte cara do trabalho (emitente e itens lidos
+    da página da SEFAZ). Cada resposta é comprimida (gzip ou zstd) e anexada
+    ao segmento atual (segment-000001.bin, até `segment_bytes`); o índice
+    (index.sqlite, sem rowid) guarda só chave → segmento, posição e tamanho.
+    Passando de `max_bytes`, os segmentos mais antigos são apagados inteiros,
+    com suas entradas no índice. Gravar a mesma chave de novo aponta o índice
+    para a cópia mais recente.
+    """
+
+    CODECS = ('gzip', 'zstd')  # Posição = código gravado no índice
+    COMMIT_EVERY = 100         # Entradas do índice por transação
+
+    def __init__(self, path: str, max_bytes: int = None, segment_bytes: int = None,
+                 compression: str = None, config: Config = None):
+        config = config or Config()
+        self.path = path
+        self.max_bytes = config.ARCHIVE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.segment_bytes = segment_bytes or config.ARCHIVE_SEGMENT_MB * 1024 * 1024
+        if self.max_bytes:
+            # Ao menos alguns segmentos dentro do limite, para a remoção ser gradual
+            self.segment_bytes = min(self.segment_bytes, max(1, self.max_bytes // 4))
+        self.compression = compression or config.ARCHIVE_COMPRESSION
+        self._compress = _codec(self.compression)[0]
+        self._codec_id = self.CODECS.index(self.compression)
+        self._decompressors = {}
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.evicted = 0
+
+        os.makedirs(path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS archive (
+                chave TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                codec INTEGER NOT NULL,
+                stored_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_archive_segment ON archive (segment, offset)")
+        self.connection.commit()
+
+        # Tamanho de cada segmento no disco; o maior número é o que recebe gravações
+        self._sizes = {}
+        for name in os.listdir(path):
+            if name.startswith('segment-') and name.endswith('.bin'):
+                self._sizes[int(name[8:-4])] = os.path.getsize(os.path.join(path, name))
+        self._segment = max(self._sizes, default=1)
+        self._sizes.setdefault(self._segment, 0)
+        self._file = open(self._segment_path(self._segment), 'ab')
+        logger.info(f"🗄️ Arquivo de respostas: {path} ({self.compression})")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:06d}.bin")
+
+    def _decompress(self, codec_id: int) -> Callable[[bytes], bytes]:
+        if codec_id not in self._decompressors:
+            self._decompressors[codec_id] = _codec(self.CODECS[codec_id])[1]
+        return self._decompressors[codec_id]
+
+    @property
+    def segments(self) -> int:
+        return len(self._sizes)
+
+    @property
+    def size(self) -> int:
+        """Bytes ocupados pelos segmentos"""
+        return sum(self._sizes.values())
+
+    def put(self, chave: str, response: Dict[str, Any]) -> None:
+        """Arquiva a resposta do scan da nota `chave`"""
+        blob = json.dumps(response, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            data = self._compress(blob)
+            if self._sizes[self._segment] and self._sizes[self._segment] + len(data) > self.segment_bytes:
+                self._rollover()
+
+            offset = self._sizes[self._segment]
+            # Dados no arquivo antes da entrada no índice: o índice nunca aponta para o vazio
+            self._file.write(data)
+            self._file.flush()
+            self._sizes[self._segment] += len(data)
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO archive (chave, segment, offset, length, codec, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, self._segment, offset, len(data), self._codec_id, datetime.now().isoformat())
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_EVERY:
+                self.connection.commit()
+                self._pending = 0
+
+    def _rollover(self) -> None:
+        """Fecha o segmento cheio, abre o próximo e remove os antigos acima do limite"""
+        self._file.close()
+        self.connection.commit()
+        self._pending = 0
+        self._segment += 1
+        self._sizes[self._segment] = 0
+        self._file = open(self._segment_path(self._segment), 'ab')
+
+        # Espaço para o segmento novo encher: o total fica abaixo de max_bytes
+        while self.max_bytes and self.size + self.segment_bytes > self.max_bytes and len(self._sizes) > 1:
+            oldest = min(self._sizes)
+            with self.connection:
+                removed = self.connection.execute(
+                    "DELETE FROM archive WHERE segment = ?", (oldest,)
+                ).rowcount
+            os.remove(self._segment_path(oldest))
+            del self._sizes[oldest]
+            self.evicted += removed
+            logger.info(f"🗑️ Arquivo de respostas: segmento {oldest} removido ({removed} respostas, limite de tamanho)")
+
+    def _read(self, segment: int, offset: int, length: int, codec_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                data = f.read(length)
+        except FileNotFoundError:
+            # Segmento removido entre a consulta ao índice e a leitura
+            return None
+        return json.loads(self._decompress(codec_id)(data))
+
+    def get(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Resposta arquivada da nota, ou None"""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT segment, offset, length, codec FROM archive WHERE chave = ?", (chave,)
+            ).fetchone()
+        return self._read(*row) if row else None
+
+    def __contains__(self, chave: str) -> bool:
+        with self._lock:
+            return self.connection.execute(
+                "SELECT 1 FROM archive WHERE chave = ?", (chave,)
+            ).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+
+    def iter_records(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(chave, resposta) de todo o arquivo, lendo cada segmento em sequência"""
+        for segment in sorted(self._sizes):
+            with self._lock:
+                rows = self.connection.execute(
+                    "SELECT chave, offset, length, codec FROM archive WHERE segment = ? ORDER BY offset",
+                    (segment,)
+                ).fetchall()
+            for chave, offset, length, codec_id in rows:
+                response = self._read(segment, offset, length, codec_id)
+                if response is not None:
+                    yield chave, response
+
+    def close(self) -> None:
+        """Grava o índice pendente e fecha os arquivos"""
+        with self._lock:
+            self._file.close()
+            self.connection.commit()
+            self.connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta o arquivo local de respostas do scan")
+    parser.add_argument('path', nargs='?', help='Diretório do arquivo (padrão: ARCHIVE_DIR)')
+    parser.add_argument('--get', metavar='CHAVE', help='Mostra a resposta arquivada de uma chave')
+    parser.add_argument('--export', metavar='ARQUIVO', help='Exporta todas as respostas em JSON lines')
+    args = parser.parse_args()
+
+    path = args.path or Config.ARCHIVE_DIR
+    if not path or not os.path.isdir(path):
+        parser.error("Informe o diretório do arquivo (ou ARCHIVE_DIR)")
+
+    archive = ScanArchive(path, max_bytes=0)
+    try:
+        if args.get:
+            response = archive.get(args.get)
+            if response is None:
+                print(f"❌ Chave {args.get} não está no arquivo")
+            else:
+                print(json.dumps(response, ensure_ascii=False, indent=2))
+        elif args.export:
+            count = 0
+            with open(args.export, 'w', encoding='utf-8') as f:
+                for chave, response in archive.iter_records():
+                    f.write(json.dumps({'chave': chave, 'resposta': response}, ensure_ascii=False) + '\n')
+                    count += 1
+            print(f"📝 {count} respostas exportadas para {args.export}")
+        else:
+            print(f"🗄️ {path}: {len(archive)} respostas, {archive.segments} segmento(s), "
+                  f"{archive.size / 1024 / 1024:.1f} MB")
+    finally:
+        archive.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# migration/async_api_client.py
+import asyncio
+import time
+import logging
+from typing import Dict, Any, Optional
+import httpx
+from config import Config
+from api_client import APIClient, build_circuit_breaker, build_qr_code_url
+from rate_limiter import TokenBucket, AdaptiveConcurrency
+from retry import backoff_delay
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from metrics import MigrationMetrics
+
+logger = logging.getLogger(__name__)
+
+class AsyncAPIClient:
+    """Cliente assíncrono (asyncio + httpx) para API do sistema novo
+    
+    Mesma interface do APIClient (`process_nfce`, `test_connection`,
+    `get_api_status`), mas cada requisição em andamento custa uma corrotina
+    em vez de uma thread. As conexões ficam num pool com keep-alive
+    (HTTP_POOL_SIZE) e podem usar HTTP/2 (HTTP2=true, requer o pacote h2).
+    Deve ser usado dentro de um único event loop. Esperas pelo disjuntor e
+    pela concorrência adaptativa suspendem só a corrotina, sem polling.
+    """
+    
+    def __init__(self, max_concurrency: int = None, circuit_breaker: CircuitBreaker = None,
+                 metrics: MigrationMetrics = None, config: Config = None):
+        self.config = config or Config()
+        self.client = httpx.AsyncClient(
+            http2=self.config.HTTP2,
+            limits=httpx.Limits(
+                max_connections=self.config.HTTP_POOL_SIZE,
+                max_keepalive_connections=self.config.HTTP_POOL_SIZE,
+                keepalive_expiry=self.config.HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(30, connect=10),
+            headers={
+                'Content-Type': 'application/json',
+                'User-Agent': 'NFC-e-Migration/1.0'
+            }
+        )
+        
+        # Mesmo controle de carga do cliente síncrono
+        self.rate_limiter = TokenBucket(self.config.RATE_LIMIT, self.config.RATE_BURST or None)
+        max_concurrency = max_concurrency or self.config.MIGRATION_WORKERS
+        self.concurrency = None
+        if self.config.ADAPTIVE_CONCURRENCY and max_concurrency > 1:
+            self.concurrency = AdaptiveConcurrency(
+                initial=self.config.CONCURRENCY_INITIAL,
+                minimum=self.config.CONCURRENCY_MIN,
+                maximum=max_concurrency,
+                latency_tolerance=self.config.LATENCY_TOLERANCE
+            )
+        # Corrotinas à espera de vaga; liberar uma vaga as acorda
+        self._slots = asyncio.Condition()
+        
+        # Disjuntor compartilhável com o APIClient; o teste de /api/status
+        # roda na thread do disjuntor e é agendado no event loop do cliente
+        self.circuit_breaker = circuit_breaker
+        if self.circuit_breaker is None and self.config.CIRCUIT_BREAKER:
+            self.circuit_breaker = build_circuit_breaker(self._probe_status, self.config)
+        # Sinalizado pelo disjuntor (de outra thread) quando o envio pode ter sido liberado
+        self._breaker_changed = asyncio.Event()
+        self._loop = None
+        
+        self.metrics = metrics
+    
+    async def _status_ok(self) -> bool:
+        response = await self.client.get(f"{self.config.API_BASE_URL}/api/status", timeout=10)
+        return response.status_code == 200
+    
+    def _probe_status(self) -> bool:
+        """Teste do disjuntor aberto: /api/status pelo pool deste cliente
+        
+        Chamado na thread do disjuntor, que espera o resultado; a requisição
+        roda no event loop em que o cliente está sendo usado.
+        """
+        if self._loop is None:
+            return False
+        return asyncio.run_coroutine_threadsafe(self._status_ok(), self._loop).result(timeout=15)
+    
+    def _bind_loop(self) -> None:
+        """Na primeira requisição: guarda o event loop e passa a ouvir o disjuntor"""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.add_listener(self._on_breaker_change)
+    
+    def _on_breaker_change(self) -> None:
+        # Chamado pelo disjuntor em qualquer thread
+        try:
+            self._loop.call_soon_threadsafe(self._breaker_changed.set)
+        except RuntimeError:
+            pass  # Event loop já encerrado
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.aclose()
+    
+    async def aclose(self):
+        """Fecha o pool de conexões"""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.remove_listener(self._on_breaker_change)
+        await self.client.aclose()
+    
+    def build_qr_code_url(self, nota: Dict[str, Any]) -> Optional[str]:
+        """Constrói URL do QR Code baseada nos dados da nota"""
+        return build_qr_code_url(nota)
+    
+    async def _wait_circuit(self) -> None:
+        """API fora do ar: só esta corrotina espera, o event loop segue livre"""
+        while True:
+            # Limpa antes de testar: um aviso entre o teste e o wait não se perde
+            self._breaker_changed.clear()
+            if self.circuit_breaker.try_acquire():
+                return
+            await self._breaker_changed.wait()
+    
+    async def _post(self, url: str, payload: Dict[str, Any]) -> httpx.Response:
+        """POST respeitando o disjuntor, o limite de taxa e a concorrência adaptativa"""
+        self._bind_loop()
+        if self.circuit_breaker is not None:
+            await self._wait_circuit()
+        
+        delay = self.rate_limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        if self.concurrency is not None:
+            async with self._slots:
+                await self._slots.wait_for(self.concurrency.try_acquire)
+        
+        if self.metrics is not None:
+            self.metrics.request_started()
+        start = time.monotonic()
+        overloaded = True
+        status = 'erro'
+        try:
+            response = await self.client.post(url, json=payload)
+            status = response.status_code
+            overloaded = APIClient.is_overload_status(response.status_code)
+            return response
+        except httpx.TimeoutException:
+            status = 'timeout'
+            raise
+        except httpx.TransportError:
+            status = 'conexao'
+            raise
+        except Exception:
+            # Erros locais (ex.: serialização) não dizem nada sobre o servidor
+            overloaded = False
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            if self.concurrency is not None:
+                self.concurrency.release(overloaded, elapsed)
+                async with self._slots:
+                    self._slots.notify_all()
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record(not overloaded)
+            if self.metrics is not None:
+                self.metrics.request_finished(url, status, elapsed)
+    
+    async def process_nfce(self, qr_url: str, max_retries: int = None) -> Dict[str, Any]:
+        """Processa NFC-e usando o endpoint de scan"""
+        if max_retries is None:
+            max_retries = self.config.MAX_RETRIES
+        
+        payload = {
+            "qrCode": qr_url
+        }
+        
+        if self.config.DRY_RUN:
+            logger.info(f"🧪 DRY RUN - Payload que seria enviado: {payload}")
+            return {
+                "success": True,
+                "data": {"chave": "DRY_RUN_TEST"},
+                "message": "DRY RUN - NFC-e não foi processada",
+                "dry_run": True
+            }
+        
+        result = {
+            "success": False,
+            "error": "Número máximo de tentativas excedido"
+        }
+        
+        for attempt in range(max_retries + 1):
+            try:
+                logger.debug("🔄 Tentativa %d/%d - Processando NFC-e", attempt + 1, max_retries + 1)
+                response = await self._post(self.config.API_SCAN_ENDPOINT, payload)
+                
+                if response.status_code == 200:
+                    result = response.json()
+                    logger.debug("✅ NFC-e processada com sucesso: %s", result.get('message', ''))
+                    return result
+                
+                error_msg = f"Erro HTTP {response.status_code}: {response.text}"
+                logger.warning("⚠️ %s", error_msg)
+                result = {
+                    "success": False,
+                    "error": error_msg,
+                    "status_code": response.status_code
+                }
+            
+            except httpx.TimeoutException:
+                logger.warning("⏰ Timeout na requisição")
+                result = {"success": False, "error": "Timeout na requisição", "retryable": True,
+                          "error_class": "timeout"}
+            
+            except httpx.TransportError:
+                logger.error("🔌 Erro de conexão com a API")
+                result = {"success": False, "error": "Erro de conexão com a API", "retryable": True,
+                          "error_class": "conexao"}
+            
+            except CircuitOpenError as e:
+                return {"success": False, "error": str(e), "cancelled": True}
+            
+            except Exception as e:
+                error_msg = f"Erro inesperado: {str(e)}"
+                logger.error("💥 %s", error_msg)
+                result = {"success": False, "error": error_msg, "error_class": "inesperado"}
+            
+            if not APIClient.is_retryable_failure(result):
+                break
+            
+            if attempt < max_retries:
+                delay = backoff_delay(attempt, self.config.RETRY_DELAY, self.config.RETRY_MAX_DELAY)
+                logger.info("⏳ Aguardando %.1fs antes da próxima tentativa...", delay)
+                if self.metrics is not None:
+                    self.metrics.record_retry()
+                # Só esta corrotina espera; as demais notas seguem em andamento
+                await asyncio.sleep(delay)
+        
+        return result
+    
+    async def test_connection(self) -> bool:
+        """Testa conexão com a API"""
+        try:
+            response = await self.client.get(f"{self.config.API_BASE_URL}/api/status", timeout=10)
+            
+            if response.status_code == 200:
+                logger.info("✅ Conexão com API estabelecida")
+                return True
+            else:
+                logger.error(f"❌ API retornou status {response.status_code}")
+                return False
+        
+        except Exception as e:
+            logger.error(f"❌ Erro ao testar conexão com API: {e}")
+            return False
+    
+    async def get_api_status(self) -> Dict[str, Any]:
+        """Retorna status da API"""
+        try:
+            response = await self.client.get(f"{self.config.API_BASE_URL}/api/status", timeout=10)
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {
+                    "error": f"Status {response.status_code}",
+                    "message": response.text
+                }
+        
+        except Exception as e:
+            return {
+                "error": str(e),
+                "message": "Erro ao conectar com API"
+            }
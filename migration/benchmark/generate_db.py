@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# migration/benchmark/generate_db.py
+# Gera um database_old.sqlite sintético para os benchmarks da migração
+
+import os
+import sys
+import random
+import sqlite3
+import argparse
+import time
+from datetime import datetime, timedelta
+
+# Reaproveita o DV da validação local
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation import dv_mod11
+
+# Códigos IBGE das UFs (2 primeiros dígitos da chave)
+UFS = (
+    '11', '12', '13', '14', '15', '16', '17',
+    '21', '22', '23', '24', '25', '26', '27', '28', '29',
+    '31', '32', '33', '35',
+    '41', '42', '43',
+    '50', '51', '52', '53'
+)
+
+# Atalhos aceitos em --notas
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Mesmo esquema do banco antigo (ver "Estrutura do Banco Antigo" no README)
+SCHEMA = """
+CREATE TABLE notas_fiscais (
+    id INTEGER PRIMARY KEY,
+    chave TEXT,
+    versao TEXT,
+    ambiente TEXT,
+    cIdToken TEXT,
+    vSig TEXT,
+    cnpjEmitente TEXT,
+    nomeEmitente TEXT,
+    ieEmitente TEXT,
+    createdAt DATETIME,
+    updatedAt DATETIME
+);
+CREATE TABLE itens_nota (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT,
+    descricao TEXT,
+    quantidade REAL,
+    unidade TEXT,
+    valorUnitario REAL,
+    valorTotal REAL,
+    notaFiscalId INTEGER,
+    createdAt DATETIME,
+    updatedAt DATETIME
+);
+"""
+
+# Índices que o banco antigo pode não ter; só com --indexes
+INDEXES = """
+CREATE INDEX idx_notas_created ON notas_fiscais (createdAt, id);
+CREATE INDEX idx_itens_nota ON itens_nota (notaFiscalId);
+CREATE INDEX idx_notas_updated ON notas_fiscais (updatedAt, id);
+"""
+
+PRODUTOS = [
+    ('ARROZ TIPO 1 5KG', 'UN', 24.90), ('FEIJAO CARIOCA 1KG', 'UN', 8.49),
+    ('ACUCAR CRISTAL 5KG', 'UN', 21.90), ('CAFE TORRADO 500G', 'UN', 17.99),
+    ('OLEO DE SOJA 900ML', 'UN', 7.29), ('LEITE UHT INTEGRAL 1L', 'UN', 4.99),
+    ('PAO FRANCES', 'KG', 14.90), ('BANANA PRATA', 'KG', 6.98),
+    ('TOMATE', 'KG', 8.99), ('CARNE BOVINA PATINHO', 'KG', 42.90),
+    ('FRANGO INTEIRO CONGELADO', 'KG', 11.49), ('REFRIGERANTE COLA 2L', 'UN', 9.99),
+    ('CERVEJA LATA 350ML', 'UN', 3.79), ('AGUA MINERAL 1,5L', 'UN', 2.99),
+    ('SABAO EM PO 1KG', 'UN', 13.90), ('PAPEL HIGIENICO 12UN', 'PCT', 19.90),
+    ('DETERGENTE 500ML', 'UN', 2.49), ('MACARRAO ESPAGUETE 500G', 'UN', 4.59),
+    ('MOLHO DE TOMATE 340G', 'UN', 2.89), ('QUEIJO MUSSARELA', 'KG', 39.90),
+    ('PRESUNTO FATIADO', 'KG', 29.90), ('IOGURTE NATURAL 170G', 'UN', 3.49),
+    ('OVOS BRANCOS 12UN', 'DZ', 12.90), ('GASOLINA COMUM', 'LT', 5.89)
+]
+
+def cnpj_dv(base12: str) -> str:
+    """Completa os 12 primeiros dígitos do CNPJ com os dois verificadores"""
+    digits = base12
+    for weights in ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)):
+        soma = sum(int(d) * w for d, w in zip(digits, weights))
+        resto = soma % 11
+        digits += '0' if resto < 2 else str(11 - resto)
+    return digits
+
+def build_emitentes(rng: random.Random, count: int):
+    """Lojas sintéticas: (cUF, CNPJ, nome, IE)"""
+    ufs = sorted(UFS)
+    emitentes = []
+    for i in range(count):
+        cnpj = cnpj_dv(f"{rng.randrange(10**8):08d}0001")
+        emitentes.append((rng.choice(ufs), cnpj, f"MERCADO SINTETICO {i + 1:04d} LTDA", f"{rng.randrange(10**9):09d}"))
+    return emitentes
+
+def build_chave(rng: random.Random, cuf: str, emissao: datetime, cnpj: str, numero: int) -> str:
+    """Chave de 44 dígitos: cUF AAMM CNPJ mod série nNF tpEmis cNF DV"""
+    chave43 = (
+        f"{cuf}{emissao:%y%m}{cnpj}65{rng.randrange(1, 1000):03d}"
+        f"{numero:09d}1{rng.randrange(10**8):08d}"
+    )
+    return chave43 + str(dv_mod11(chave43))
+
+def generate(path: str, notas: int, itens_min: int, itens_max: int, invalid_ratio: float,
+             seed: int, indexes: bool, chunk: int = 5000) -> None:
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    # Só geração: sem journal nem fsync
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+
+    emitentes = build_emitentes(rng, max(1, min(2000, notas // 50)))
+    inicio = datetime(2021, 1, 1)
+    periodo = int((datetime(2024, 12, 31) - inicio).total_seconds())
+    item_id = 0
+    started = time.monotonic()
+
+    for first in range(1, notas + 1, chunk):
+        notas_rows = []
+        itens_rows = []
+        for nota_id in range(first, min(first + chunk, notas + 1)):
+            cuf, cnpj, nome, ie = rng.choice(emitentes)
+            emissao = inicio + timedelta(seconds=rng.randrange(periodo))
+            chave = build_chave(rng, cuf, emissao, cnpj, nota_id)
+            if rng.random() < invalid_ratio:
+                # DV trocado: exercita a validação local
+                chave = chave[:43] + str((int(chave[43]) + 1) % 10)
+            created = emissao.strftime('%Y-%m-%d %H:%M:%S')
+            notas_rows.append((
+                nota_id, chave, '2', '1', f"{rng.randrange(1, 10):06d}",
+                f"{rng.getrandbits(160):040X}", cnpj, nome, ie, created, created
+            ))
+
+            for _ in range(rng.randint(itens_min, itens_max)):
+                item_id += 1
+                produto = rng.randrange(len(PRODUTOS))
+                descricao, unidade, preco = PRODUTOS[produto]
+                quantidade = round(rng.uniform(0.2, 3.0), 3) if unidade in ('KG', 'LT') else float(rng.randint(1, 6))
+                valor_unitario = round(preco * rng.uniform(0.9, 1.1), 2)
+                itens_rows.append((
+                    item_id, f"{produto + 1:06d}", descricao,
+                    quantidade, unidade, valor_unitario, round(quantidade * valor_unitario, 2),
+                    nota_id, created, created
+                ))
+
+        conn.executemany("INSERT INTO notas_fiscais VALUES (?,?,?,?,?,?,?,?,?,?,?)", notas_rows)
+        conn.executemany("INSERT INTO itens_nota VALUES (?,?,?,?,?,?,?,?,?,?)", itens_rows)
+        conn.commit()
+        done = min(first + chunk - 1, notas)
+        print(f"\r📦 {done}/{notas} notas, {item_id} itens", end='', flush=True)
+
+    if indexes:
+        conn.executescript(INDEXES)
+    conn.close()
+    print(f"\n✅ {path} gerado em {time.monotonic() - started:.1f}s "
+          f"({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+
+def parse_notas(value: str) -> int:
+    return SCALES.get(value.lower()) or int(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um banco antigo sintético para benchmark")
+    parser.add_argument('--notas', type=parse_notas, default=SCALES['10k'],
+                        help='Quantidade de notas ou 10k/100k/1m (padrão: 10k)')
+    parser.add_argument('--output', default='database_old.bench.sqlite', help='Arquivo gerado')
+    parser.add_argument('--itens-min', type=int, default=1, help='Itens mínimos por nota')
+    parser.add_argument('--itens-max', type=int, default=15, help='Itens máximos por nota')
+    parser.add_argument('--invalid-ratio', type=float, default=0.0,
+                        help='Fração de chaves com DV errado (rejeitadas sem requisição)')
+    parser.add_argument('--seed', type=int, default=42, help='Semente (mesma semente, mesmo banco)')
+    parser.add_argument('--indexes', action='store_true',
+                        help='Cria índices em createdAt, updatedAt (--follow) e itens_nota.notaFiscalId')
+    args = parser.parse_args()
+
+    generate(args.output, args.notas, args.itens_min, args.itens_max,
+             args.invalid_ratio, args.seed, args.indexes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# migration/benchmark/mock_server.py
+# Servidor local no lugar do sistema novo: mesmas rotas usadas pela migração,
+# sem SEFAZ nem r.jina.ai, com latência, erros e duplicadas configuráveis
+
+import json
+import random
+import argparse
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+class MockState:
+    """Notas "salvas" e contadores do servidor simulado
+
+    As decisões (erro transitório, rejeição, duplicada) saem de um hash da
+    chave e da semente, não da ordem de chegada: duas execuções com os mesmos
+    parâmetros recebem as mesmas respostas, com qualquer concorrência.
+    """
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float,
+                 reject_rate: float, dup_ratio: float, seed: int):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.dup_ratio = dup_ratio
+        self.seed = seed
+        self.saved = {}             # chave → id
+        self.attempts = Counter()   # chave → requisições recebidas
+        self.responses = Counter()  # "rota status" → total
+        self.lock = threading.Lock()
+
+    def chance(self, *parts) -> float:
+        """Número em [0, 1) fixo para (semente, parts)"""
+        key = '|'.join(str(part) for part in (self.seed,) + parts).encode()
+        return zlib.crc32(key) / 2 ** 32
+
+    def sleep(self) -> None:
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def scan(self, qr_code: str):
+        """Resposta de /api/scan/process para um QR Code: (status, corpo)"""
+        try:
+            chave = urlsplit(qr_code).query.split('p=', 1)[1].split('|', 1)[0]
+        except (IndexError, AttributeError):
+            chave = ''
+        if len(chave) != 44 or not chave.isdigit():
+            return 400, {'success': False, 'message': 'QR Code não é uma NFC-e válida'}
+
+        attempt = self.next_attempt(chave)
+        if self.chance('rejeita', chave) < self.reject_rate:
+            return 400, {'success': False, 'message': 'QR Code não é uma NFC-e válida'}
+        if self.chance('erro', chave, attempt) < self.error_rate:
+            # Transitório: a mesma nota pode passar na tentativa seguinte
+            return 503, {'success': False, 'message': 'Serviço temporariamente indisponível'}
+
+        return 200, {
+            'success': True,
+            'data': self.nfce_data(chave),
+            'message': 'NFC-e processada e salva com sucesso',
+            'salva': self.save(chave)
+        }
+
+    def nfce_data(self, chave: str) -> dict:
+        """"Página da SEFAZ" da nota: emitente e 1 a 15 itens, fixos pela chave"""
+        itens = [
+            {'codigo': f"{i + 1:06d}", 'descricao': f"PRODUTO SINTETICO {i + 1}", 'qtde': '1,000',
+             'un': 'UN', 'unitario': '9,90', 'total': '9,90'}
+            for i in range(1 + int(self.chance('itens', chave) * 15))
+        ]
+        emitente = {'cnpj': chave[6:20], 'nome': f"MERCADO SINTETICO {chave[6:14]} LTDA", 'ie': chave[25:34]}
+        return {'chave': chave, 'emitente': emitente, 'itens': itens}
+
+    def next_attempt(self, chave: str) -> int:
+        """Quantas vezes a nota já chegou antes desta requisição"""
+        with self.lock:
+            attempt = self.attempts[chave]
+            self.attempts[chave] += 1
+            return attempt
+
+    def save(self, chave: str) -> dict:
+        with self.lock:
+            if chave in self.saved or self.chance('duplicada', chave) < self.dup_ratio:
+                self.saved.setdefault(chave, len(self.saved) + 1)
+                return {
+                    'status': 'duplicada',
+                    'message': 'NFC-e com esta chave já foi salva anteriormente',
+                    'id': self.saved[chave]
+                }
+            self.saved[chave] = len(self.saved) + 1
+            return {'status': 'salva', 'message': 'NFC-e salva com sucesso!', 'id': self.saved[chave]}
+
+    def count(self, route: str, status: int) -> None:
+        with self.lock:
+            self.responses[f"{route} {status}"] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'salvas': len(self.saved),
+                'requisicoes': sum(self.attempts.values()),
+                'respostas': dict(self.responses)
+            }
+
+class MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Fila de conexões maior que o padrão (5): --workers altos conectam de uma vez
+    request_queue_size = 1024
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, como o servidor real atrás do proxy
+        protocol_version = 'HTTP/1.1'
+        # Cabeçalho e corpo saem num único send (handle_one_request dá o flush)
+        # e sem Nagle: escritas separadas esbarravam no ACK atrasado do
+        # cliente e punham ~40 ms em cada resposta
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status: int, body) -> None:
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            state.count(urlsplit(self.path).path, status)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/api/status':
+                return self.send_json(200, {'message': 'Servidor NFC-e Scan (benchmark) está rodando!'})
+            if url.path == '/api/notas/chaves':
+                # Chaves por keyset (usada pelo --preflight); a posição na lista faz o papel do id
+                query = parse_qs(url.query)
+                after = int(query.get('after', ['0'])[0])
+                limit = int(query.get('limit', ['1000'])[0])
+                with state.lock:
+                    chaves = list(state.saved)[after:after + limit]
+                return self.send_json(200, {
+                    'chaves': chaves,
+                    'next': after + limit if len(chaves) == limit else None
+                })
+            if url.path == '/api/notas':
+                # Paginação de /api/notas (servidores sem /api/notas/chaves)
+                query = parse_qs(url.query)
+                page = int(query.get('page', ['1'])[0])
+                limit = int(query.get('limit', ['10'])[0])
+                with state.lock:
+                    chaves = list(state.saved)
+                notas = [{'chave': chave} for chave in chaves[(page - 1) * limit:page * limit]]
+                return self.send_json(200, {
+                    'notas': notas, 'total': len(chaves), 'page': page,
+                    'pages': (len(chaves) + limit - 1) // limit
+                })
+            if url.path == '/bench/stats':
+                return self.send_json(200, state.stats())
+            self.send_json(404, {'message': 'Rota não encontrada'})
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            body = self.read_json()
+            state.sleep()
+
+            if path == '/api/scan/process':
+                status, response = state.scan(body.get('qrCode'))
+                return self.send_json(status, response)
+
+            if path == '/api/scan/process-batch':
+                results = []
+                for index, qr_code in enumerate(body.get('qrCodes') or []):
+                    status, response = state.scan(qr_code)
+                    results.append({'index': index, 'status': status, **response})
+                return self.send_json(200, {'success': True, 'total': len(results), 'results': results})
+
+            if path == '/api/notas/salvar':
+                chave = str(body.get('chave', ''))
+                if state.chance('erro', chave, state.next_attempt(chave)) < state.error_rate:
+                    return self.send_json(503, {'message': 'Serviço temporariamente indisponível'})
+                salva = state.save(chave)
+                if salva['status'] == 'duplicada':
+                    return self.send_json(409, {'message': 'NFC-e com esta chave já foi salva.'})
+                return self.send_json(201, {'message': 'NFC-e salva com sucesso!', 'id': salva['id']})
+
+            self.send_json(404, {'message': 'Rota não encontrada'})
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor simulado do sistema novo para benchmark")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1425, help='Porta (padrão: 1425, a do migrate_sqlite.py)')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Latência média por requisição')
+    parser.add_argument('--jitter-ms', type=float, default=10, help='Desvio padrão da latência')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fração de respostas 503 (transitórias)')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='Fração de notas rejeitadas com 400')
+    parser.add_argument('--dup-ratio', type=float, default=0.0, help='Fração de notas já existentes (duplicadas)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    state = MockState(args.latency_ms, args.jitter_ms, args.error_rate,
+                      args.reject_rate, args.dup_ratio, args.seed)
+    server = MockHTTPServer((args.host, args.port), make_handler(state))
+    print(f"🧪 Servidor simulado em http://{args.host}:{args.port} "
+          f"(latência {args.latency_ms:.0f}±{args.jitter_ms:.0f}ms, erro {args.error_rate:.0%}, "
+          f"rejeição {args.reject_rate:.0%}, duplicadas {args.dup_ratio:.0%})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
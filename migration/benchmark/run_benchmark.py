@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# migration/benchmark/run_benchmark.py
+# Roda os modos do migrate.py/migrate_sqlite.py contra o servidor simulado e
+# compara notas/s, latência p99 e pico de memória com uma execução anterior
+
+import os
+import sys
+import json
+import socket
+import sqlite3
+import argparse
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+from generate_db import generate, parse_notas
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_DIR = os.path.dirname(BENCH_DIR)
+
+# Cenário → (script, argumentos)
+SCENARIOS = {
+    'sqlite': ('migrate_sqlite.py', []),
+    'serial': ('migrate.py', ['--workers', '1']),
+    'threads': ('migrate.py', ['--workers', '16']),
+    'async': ('migrate.py', ['--async', '--workers', '64']),
+    'batch': ('migrate.py', ['--workers', '4', '--dispatch-batch', '50']),
+    'direct': ('migrate.py', ['--mode', 'direct', '--workers', '16']),
+}
+DEFAULT_SCENARIOS = ['threads', 'async', 'batch']
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_mock(args, workdir: str):
+    """Sobe um servidor simulado novo (sem notas salvas) e espera /api/status"""
+    port = free_port()
+    log = open(os.path.join(workdir, 'mock.log'), 'w')
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, 'mock_server.py'),
+        '--port', str(port),
+        '--latency-ms', str(args.latency_ms),
+        '--jitter-ms', str(args.jitter_ms),
+        '--error-rate', str(args.error_rate),
+        '--reject-rate', str(args.reject_rate),
+        '--dup-ratio', str(args.dup_ratio),
+        '--seed', str(args.seed)
+    ], stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/status", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Servidor simulado não respondeu em 10s")
+
+def run_process(cmd, env, log_path: str, timeout: float = None):
+    """Executa e devolve (código de saída, segundos, pico de RSS em MB)"""
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, cwd=MIGRATION_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if not hasattr(os, 'wait4'):
+            # Sem wait4 (Windows) não há pico de RSS do processo filho
+            process.wait(timeout=timeout)
+            return process.returncode, time.perf_counter() - start, None
+
+        # wait4 em vez de wait: devolve também o rusage do filho
+        deadline = start + timeout if timeout else None
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG if deadline else 0)
+            if pid:
+                break
+            if time.perf_counter() >= deadline:
+                process.kill()
+                deadline = None
+            else:
+                time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss: KB no Linux, bytes no macOS
+    peak = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return process.returncode, elapsed, peak
+
+def checkpoint_counts(path: str) -> dict:
+    """Desfechos gravados no checkpoint (mesmo formato nos dois scripts)"""
+    if not os.path.exists(path):
+        return {}
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM checkpoint GROUP BY status").fetchall())
+    finally:
+        conn.close()
+
+def request_latency(metrics_path: str):
+    """(p50, p99) em ms das respostas 2xx mais frequentes, do snapshot de métricas"""
+    if not os.path.exists(metrics_path):
+        return None, None
+    with open(metrics_path, encoding='utf-8') as f:
+        series = [s for s in json.load(f)['requests'] if s['status'].startswith('2')]
+    if not series:
+        return None, None
+    main = max(series, key=lambda s: s['count'])
+    return main['p50'] * 1000, main['p99'] * 1000
+
+def run_scenario(name: str, args, db_path: str, root: str) -> dict:
+    script, extra = SCENARIOS[name]
+    workdir = os.path.join(root, name)
+    os.makedirs(workdir, exist_ok=True)
+    checkpoint = os.path.join(workdir, 'checkpoint.sqlite')
+    metrics_file = os.path.join(workdir, 'metrics.json')
+
+    mock, base_url = start_mock(args, workdir)
+    try:
+        env = dict(
+            os.environ,
+            API_BASE_URL=base_url,
+            OLD_DB_TYPE='sqlite',
+            OLD_DB_FILE=db_path,
+            LOG_FILE=os.path.join(workdir, 'migration.log'),
+            LOG_MODE='performance',
+            CHECKPOINT_FILE=checkpoint,
+            ERROR_FILE=os.path.join(workdir, 'errors.jsonl'),
+            METRICS_PORT='0',
+            METRICS_SNAPSHOT_FILE=metrics_file
+        )
+        cmd = [sys.executable, script] + extra
+        if script == 'migrate_sqlite.py':
+            cmd += ['--db', db_path, '--api-url', base_url, '--checkpoint', checkpoint]
+        if args.limit:
+            cmd += ['--limit', str(args.limit)]
+
+        print(f"▶️  {name}: {' '.join(cmd[1:])}", flush=True)
+        exit_code, seconds, peak_rss = run_process(cmd, env, os.path.join(workdir, 'run.log'), args.timeout)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    counts = checkpoint_counts(checkpoint)
+    processed = sum(counts.values())
+    p50, p99 = request_latency(metrics_file)
+    return {
+        'cenario': name,
+        'comando': ' '.join([script] + extra),
+        'codigo_saida': exit_code,
+        'notas': processed,
+        'desfechos': counts,
+        'segundos': round(seconds, 2),
+        'notas_por_segundo': round(processed / seconds, 1) if seconds > 0 else 0.0,
+        'p50_ms': round(p50, 1) if p50 is not None else None,
+        'p99_ms': round(p99, 1) if p99 is not None else None,
+        'pico_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+        'logs': workdir
+    }
+
+def format_delta(current, previous) -> str:
+    if current is None or not previous:
+        return ''
+    return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+def print_report(results, baseline=None) -> None:
+    previous = {r['cenario']: r for r in (baseline or {}).get('resultados', [])}
+    print(f"\n{'='*78}")
+    print(f"{'cenário':<10} {'notas':>8} {'tempo (s)':>10} {'notas/s':>16} {'p99 (ms)':>16} {'pico RSS (MB)':>14}")
+    print('-' * 78)
+    for r in results:
+        base = previous.get(r['cenario'], {})
+        rate = f"{r['notas_por_segundo']}{format_delta(r['notas_por_segundo'], base.get('notas_por_segundo'))}"
+        p99 = '-' if r['p99_ms'] is None else f"{r['p99_ms']}{format_delta(r['p99_ms'], base.get('p99_ms'))}"
+        rss = '-' if r['pico_rss_mb'] is None else f"{r['pico_rss_mb']}"
+        alert = '' if r['codigo_saida'] == 0 else f"  ⚠️ saída {r['codigo_saida']}"
+        print(f"{r['cenario']:<10} {r['notas']:>8} {r['segundos']:>10} {rate:>16} {p99:>16} {rss:>14}{alert}")
+    print('=' * 78)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da migração contra o servidor simulado")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS) + ['all'],
+                        help=f"Cenário a rodar (repita para vários; padrão: {', '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument('--notas', type=parse_notas, default=parse_notas('10k'),
+                        help='Tamanho do banco sintético: N ou 10k/100k/1m (padrão: 10k)')
+    parser.add_argument('--db', help='Banco a usar (padrão: database_old.bench_<notas>.sqlite, gerado se não existir)')
+    parser.add_argument('--limit', type=int, help='Notas por cenário (padrão: todas)')
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--reject-rate', type=float, default=0.0)
+    parser.add_argument('--dup-ratio', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, help='Tempo máximo por cenário (s)')
+    parser.add_argument('--workdir', help='Onde ficam logs, checkpoints e métricas (padrão: diretório temporário)')
+    parser.add_argument('--output', default='benchmark_results.json', help='Arquivo com os resultados')
+    parser.add_argument('--baseline', help='Resultados anteriores para comparar (ex.: benchmark_results.json)')
+    args = parser.parse_args()
+
+    scenarios = args.scenario or DEFAULT_SCENARIOS
+    if 'all' in scenarios:
+        scenarios = list(SCENARIOS)
+
+    db_path = os.path.abspath(args.db or f"database_old.bench_{args.notas}.sqlite")
+    if not os.path.exists(db_path):
+        generate(db_path, args.notas, itens_min=1, itens_max=15, invalid_ratio=0.0,
+                 seed=args.seed, indexes=False)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    root = args.workdir or tempfile.mkdtemp(prefix='nfce_bench_')
+    results = [run_scenario(name, args, db_path, root) for name in scenarios]
+    print_report(results, baseline)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'parametros': {
+                'db': db_path, 'limit': args.limit, 'latency_ms': args.latency_ms,
+                'jitter_ms': args.jitter_ms, 'error_rate': args.error_rate,
+                'reject_rate': args.reject_rate, 'dup_ratio': args.dup_ratio, 'seed': args.seed
+            },
+            'resultados': results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"📝 Resultados em {args.output} (logs em {root})")
+
+if __name__ == "__main__":
+    main()
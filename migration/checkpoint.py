@@ -0,0 +1,152 @@
+# migration/checkpoint.py
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Optional, Set, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def rewind_watermark(position: Optional[Tuple[Any, int]], seconds: float) -> Optional[Tuple[Any, int]]:
+    """Posição `seconds` antes da watermark, para reler a janela de gravações atrasadas
+    
+    Uma transação aberta antes da última leitura pode gravar depois dela um
+    updatedAt menor que o da watermark; relendo a janela, essas notas ainda
+    são alcançadas. updatedAt vem como datetime (MySQL/PostgreSQL) ou texto
+    'AAAA-MM-DD HH:MM:SS...' (sqlite e watermark gravada); em outro formato
+    a posição volta sem janela.
+    """
+    if position is None or seconds <= 0:
+        return position
+    updated_at = position[0]
+    if isinstance(updated_at, datetime):
+        return (updated_at - timedelta(seconds=seconds), 0)
+    
+    text = str(updated_at)
+    try:
+        moment = datetime.strptime(text[:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return position
+    # Só data e hora: como prefixo, fica antes de qualquer valor daquele segundo
+    start = (moment - timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+    if text[10:11] == 'T':
+        start = f"{start[:10]}T{start[11:]}"
+    return (start, 0)
+
+class CheckpointJournal:
+    """Diário local com o desfecho de cada nota, para retomar migrações
+    
+    Grava em um sqlite pequeno (ao lado do migration.log) o último estado de
+    cada id. As escritas são acumuladas em memória e gravadas em lote
+    (CHECKPOINT_FLUSH_SIZE registros ou CHECKPOINT_FLUSH_INTERVAL segundos),
+    então o diário não atrasa os workers.
+    """
+    
+    # Estados que não precisam ser reenviados em uma retomada
+    COMPLETED_STATUSES = ('sucesso', 'duplicada')
+    
+    def __init__(self, path: str = None, config: Config = None):
+        self.config = config or Config()
+        self.path = path or self.config.CHECKPOINT_FILE
+        self.flush_size = self.config.CHECKPOINT_FLUSH_SIZE
+        self.flush_interval = self.config.CHECKPOINT_FLUSH_INTERVAL
+        
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()        # Protege a lista pendente
+        self._write_lock = threading.Lock()  # Serializa as escritas no arquivo
+        
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint (
+                nota_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                message TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS watermark (
+                name TEXT PRIMARY KEY,
+                updated_at TEXT NOT NULL,
+                nota_id INTEGER NOT NULL,
+                saved_at TEXT NOT NULL
+            )
+        """)
+        self.connection.commit()
+        logger.info(f"📒 Checkpoint: {self.path}")
+    
+    def record(self, nota_id: int, status: str, message: str = ""):
+        """Registra o desfecho de uma nota (gravado no próximo flush)"""
+        with self._lock:
+            self._pending.append((nota_id, status, (message or '')[:500], datetime.now().isoformat()))
+            due = (
+                len(self._pending) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        
+        if due:
+            self.flush()
+    
+    def flush(self):
+        """Grava em uma única transação os registros pendentes"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        
+        if not pending:
+            return
+        
+        with self._write_lock:
+            try:
+                with self.connection:
+                    self.connection.executemany(
+                        "INSERT OR REPLACE INTO checkpoint (nota_id, status, message, updated_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        pending
+                    )
+            except Exception as e:
+                logger.error(f"❌ Erro ao gravar checkpoint: {e}")
+    
+    def completed_ids(self) -> Set[int]:
+        """Ids já migrados (sucesso ou duplicada); falhas são tentadas de novo"""
+        self.flush()
+        placeholders = ', '.join('?' for _ in self.COMPLETED_STATUSES)
+        with self._write_lock:
+            rows = self.connection.execute(
+                f"SELECT nota_id FROM checkpoint WHERE status IN ({placeholders})",
+                self.COMPLETED_STATUSES
+            ).fetchall()
+        return {row[0] for row in rows}
+    
+    def load_watermark(self, name: str = 'follow') -> Optional[Tuple[str, int]]:
+        """Posição (updatedAt, id) da última nota concluída pelo --follow"""
+        with self._write_lock:
+            row = self.connection.execute(
+                "SELECT updated_at, nota_id FROM watermark WHERE name = ?", (name,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+    
+    def save_watermark(self, position: Tuple[Any, int], name: str = 'follow'):
+        """Grava a posição depois dos desfechos pendentes (nunca à frente deles)"""
+        self.flush()
+        updated_at, nota_id = position
+        if hasattr(updated_at, 'isoformat'):
+            # datetime do MySQL/PostgreSQL: texto que o banco compara de volta
+            updated_at = updated_at.isoformat(sep=' ')
+        with self._write_lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO watermark (name, updated_at, nota_id, saved_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (name, str(updated_at), int(nota_id), datetime.now().isoformat())
+                )
+    
+    def close(self):
+        """Grava o que estiver pendente e fecha o arquivo"""
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,163 @@
+# migration/circuit_breaker.py
+import threading
+import time
+import logging
+from collections import deque
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Requisição abandonada porque o disjuntor foi cancelado com a API fora do ar"""
+
+class CircuitBreaker:
+    """Disjuntor da API: pausa o envio enquanto ela estiver fora do ar
+
+    fechado: requisições passam; se a taxa de erro na janela móvel
+    (`window` segundos, ao menos `min_requests` respostas) chegar a
+    `error_rate`, abre. aberto: ninguém envia; uma thread consulta `probe`
+    (/api/status) a cada `open_seconds` e, quando a API responde, passa a
+    meio-aberto. meio-aberto: só `half_open_requests` requisições de teste;
+    se todas derem certo fecha, se alguma falhar abre de novo.
+
+    Erro aqui é sinal de API indisponível (timeout, conexão, 429, 5xx); 4xx
+    de uma nota específica conta como sucesso. Quem não pode bloquear uma
+    thread em `acquire` (ex.: corrotinas) usa `try_acquire` e registra um
+    ouvinte em `add_listener`, chamado quando o envio pode ter sido liberado.
+    """
+
+    CLOSED = 'fechado'
+    OPEN = 'aberto'
+    HALF_OPEN = 'meio-aberto'
+
+    def __init__(self, probe: Callable[[], bool], window: float = 30.0,
+                 min_requests: int = 20, error_rate: float = 0.5,
+                 open_seconds: float = 10.0, half_open_requests: int = 3):
+        self.probe = probe
+        self.window = window
+        self.min_requests = max(1, min_requests)
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_requests = max(1, half_open_requests)
+
+        self.state = self.CLOSED
+        self.opened_count = 0       # Quantas vezes o disjuntor abriu
+        self._results = deque()     # (instante, falhou) dentro da janela
+        self._failures = 0
+        self._trials = 0            # Testes em andamento no meio-aberto
+        self._trial_successes = 0
+        self._cancelled = False
+        self._probing = False
+        self._listeners: List[Callable[[], None]] = []
+        self._cond = threading.Condition()
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """`callback()` a cada mudança que pode liberar o envio (chamado com o lock; não deve bloquear)"""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]) -> None:
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _wake(self) -> None:
+        """Acorda threads paradas em acquire e avisa os ouvintes"""
+        self._cond.notify_all()
+        for callback in self._listeners:
+            callback()
+
+    def try_acquire(self) -> bool:
+        """Libera o envio se o estado permitir, sem bloquear"""
+        with self._cond:
+            return self._try_acquire_locked()
+
+    def acquire(self) -> None:
+        """Bloqueia enquanto o disjuntor estiver aberto"""
+        with self._cond:
+            while not self._try_acquire_locked():
+                self._cond.wait()
+
+    def _try_acquire_locked(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self._cancelled:
+            raise CircuitOpenError("Circuito aberto: API indisponível")
+        if self.state == self.HALF_OPEN and self._trials < self.half_open_requests:
+            self._trials += 1
+            return True
+        return False
+
+    def record(self, success: bool) -> None:
+        """Registra o resultado de uma requisição liberada por acquire"""
+        with self._cond:
+            now = time.monotonic()
+
+            if self.state == self.HALF_OPEN:
+                self._trials = max(0, self._trials - 1)
+                if not success:
+                    self._open(now, "requisição de teste falhou")
+                    return
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_requests:
+                    self.state = self.CLOSED
+                    self._results.clear()
+                    self._failures = 0
+                    logger.info("✅ Circuito fechado: envio retomado")
+                # Fechou, ou vagou uma das requisições de teste
+                self._wake()
+                return
+
+            if self.state == self.OPEN:
+                # Respostas atrasadas de antes da abertura não mudam nada
+                return
+
+            self._results.append((now, not success))
+            if not success:
+                self._failures += 1
+            while self._results and self._results[0][0] < now - self.window:
+                if self._results.popleft()[1]:
+                    self._failures -= 1
+
+            total = len(self._results)
+            if total >= self.min_requests and self._failures / total >= self.error_rate:
+                self._open(now, f"{self._failures}/{total} erros em {self.window:.0f}s")
+
+    def _open(self, now: float, reason: str) -> None:
+        self.state = self.OPEN
+        self.opened_count += 1
+        self._trials = 0
+        self._trial_successes = 0
+        logger.warning(f"🔌 Circuito aberto ({reason}): envio pausado até /api/status responder")
+
+        if not self._probing:
+            self._probing = True
+            threading.Thread(target=self._probe_loop, name='circuit-probe', daemon=True).start()
+
+    def _probe_loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._cancelled, timeout=self.open_seconds)
+                if self._cancelled or self.state != self.OPEN:
+                    self._probing = False
+                    return
+
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+
+            if healthy:
+                with self._cond:
+                    self._probing = False
+                    if self.state == self.OPEN:
+                        self.state = self.HALF_OPEN
+                        logger.info(f"🔎 API respondeu: testando com {self.half_open_requests} requisições")
+                        self._wake()
+                return
+
+    def cancel(self) -> None:
+        """Desiste de esperar: quem está bloqueado em acquire recebe CircuitOpenError"""
+        with self._cond:
+            self._cancelled = True
+            self._wake()
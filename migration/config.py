@@ -11,6 +11,10 @@ class Config:
     # Configurações da API do sistema novo
     API_BASE_URL = os.getenv('API_BASE_URL', 'https://teste.neurelix.com.br')
     API_SCAN_ENDPOINT = f"{API_BASE_URL}/api/scan/process"
+    API_SCAN_BATCH_ENDPOINT = f"{API_BASE_URL}/api/scan/process-batch"
+    API_NOTAS_ENDPOINT = f"{API_BASE_URL}/api/notas"
+    API_CHAVES_ENDPOINT = f"{API_BASE_URL}/api/notas/chaves"
+    API_SAVE_ENDPOINT = f"{API_BASE_URL}/api/notas/salvar"
     
     # Configurações do banco antigo
     OLD_DB_TYPE = os.getenv('OLD_DB_TYPE', 'sqlite')  # sqlite, mysql, postgresql
@@ -20,16 +24,107 @@ class Config:
     OLD_DB_USER = os.getenv('OLD_DB_USER', 'root')
     OLD_DB_PASSWORD = os.getenv('OLD_DB_PASSWORD', '')
     OLD_DB_FILE = os.getenv('OLD_DB_FILE', 'database_old.sqlite')
+    # Pool de conexões do banco antigo (sqlite: uma conexão por thread)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))  # Máximo de conexões MySQL/PostgreSQL
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # Espera por uma conexão livre (segundos)
+    DB_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', '30'))  # Parada há mais que isso: SELECT 1 antes do uso
+    # Leitura do sqlite: default, ro (somente leitura) ou immutable (arquivo que ninguém grava)
+    SQLITE_ACCESS = os.getenv('SQLITE_ACCESS', 'ro')
+    SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', '256'))  # Janela de mmap (0 = desligado)
+    SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', '64'))  # Cache de páginas por conexão
+    SQLITE_WORKING_COPY = os.getenv('SQLITE_WORKING_COPY', '')  # Cópia indexada do --sqlite-index ('' = <arquivo>.indexed.sqlite)
     
     # Configurações de migração
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', '10'))
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
     RETRY_DELAY = int(os.getenv('RETRY_DELAY', '2'))
+    RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '60'))  # Teto do backoff (segundos)
     DRY_RUN = os.getenv('DRY_RUN', 'false').lower() == 'true'
+    MIGRATION_MODE = os.getenv('MIGRATION_MODE', 'scan')  # scan (QR Code), direct (itens do banco antigo)
+    MIGRATION_WORKERS = int(os.getenv('MIGRATION_WORKERS', '1'))  # 1 = modo sequencial
+    DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', '1'))  # QR Codes por requisição (1 = /process)
+    SCAN_BATCH_MAX = int(os.getenv('SCAN_BATCH_MAX', '100'))  # Limite do servidor por /process-batch (mesmo SCAN_BATCH_MAX)
+    SCAN_BATCH_TIMEOUT = float(os.getenv('SCAN_BATCH_TIMEOUT', '120'))  # Teto do timeout de um /process-batch (segundos)
+    
+    # Controle de carga sobre a API
+    RATE_LIMIT = float(os.getenv('RATE_LIMIT', '0'))  # Requisições/s (0 = sem limite)
+    RATE_BURST = int(os.getenv('RATE_BURST', '0'))  # Rajada máxima (0 = igual ao RATE_LIMIT)
+    ADAPTIVE_CONCURRENCY = os.getenv('ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+    CONCURRENCY_INITIAL = int(os.getenv('CONCURRENCY_INITIAL', '2'))  # Ponto de partida do AIMD
+    CONCURRENCY_MIN = int(os.getenv('CONCURRENCY_MIN', '1'))
+    LATENCY_TOLERANCE = float(os.getenv('LATENCY_TOLERANCE', '0'))  # x latência típica conta como sobrecarga (0 = só erros)
+    
+    # Disjuntor: pausa o envio enquanto a API estiver fora do ar
+    CIRCUIT_BREAKER = os.getenv('CIRCUIT_BREAKER', 'true').lower() == 'true'
+    CIRCUIT_WINDOW = float(os.getenv('CIRCUIT_WINDOW', '30'))  # Janela da taxa de erro (segundos)
+    CIRCUIT_MIN_REQUESTS = int(os.getenv('CIRCUIT_MIN_REQUESTS', '20'))  # Respostas mínimas na janela
+    CIRCUIT_ERROR_RATE = float(os.getenv('CIRCUIT_ERROR_RATE', '0.5'))  # Fração de erros que abre o circuito
+    CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '10'))  # Intervalo entre testes de /api/status
+    CIRCUIT_HALF_OPEN_REQUESTS = int(os.getenv('CIRCUIT_HALF_OPEN_REQUESTS', '3'))  # Testes antes de fechar
+    
+    # Cliente assíncrono (--async)
+    ASYNC_DISPATCH = os.getenv('ASYNC_DISPATCH', 'false').lower() == 'true'
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '100'))  # Conexões mantidas abertas
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))  # Segundos
+    HTTP2 = os.getenv('HTTP2', 'false').lower() == 'true'  # Requer o pacote h2
+    
+    READ_MODE = os.getenv('READ_MODE', 'keyset')  # keyset, offset, stream
+    STREAM_PREFETCH = int(os.getenv('STREAM_PREFETCH', '500'))  # Linhas por fetch no modo stream
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))  # Lotes aguardando entre estágios
+    VALIDATE_CHAVE = os.getenv('VALIDATE_CHAVE', 'true').lower() == 'true'  # 44 dígitos e DV antes do scan (como o servidor)
+    PREFLIGHT_DEDUP = os.getenv('PREFLIGHT_DEDUP', 'false').lower() == 'true'
+    PREFLIGHT_PAGE_SIZE = int(os.getenv('PREFLIGHT_PAGE_SIZE', '1000'))  # Chaves por página de /api/notas/chaves
     
     # Configurações de log
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'migration.log')
+    LOG_MODE = os.getenv('LOG_MODE', 'default')  # default, performance (fila + JSON lines)
+    LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '100'))  # 1 linha a cada N notas (performance)
+    LOG_PROGRESS_INTERVAL = float(os.getenv('LOG_PROGRESS_INTERVAL', '10'))  # Segundos entre linhas de progresso
+    
+    # Arquivo de falhas (uma linha por nota; .csv grava CSV, demais JSON lines)
+    ERROR_FILE = os.getenv(
+        'ERROR_FILE',
+        os.path.join(os.path.dirname(LOG_FILE), 'migration_errors.jsonl')
+    )
+    ERROR_SAMPLE_SIZE = int(os.getenv('ERROR_SAMPLE_SIZE', '20'))  # Mensagens mantidas para o resumo
+    
+    # Métricas ao vivo (migrate.py)
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # /metrics e /metrics.json (0 = desligado)
+    METRICS_SNAPSHOT_FILE = os.getenv('METRICS_SNAPSHOT_FILE', '')  # Snapshot JSON periódico ('' = desligado)
+    METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', '10'))  # Segundos
+    
+    # Configurações de checkpoint (retomada com --resume)
+    CHECKPOINT_FILE = os.getenv(
+        'CHECKPOINT_FILE',
+        os.path.join(os.path.dirname(LOG_FILE), 'migration_checkpoint.sqlite')
+    )
+    CHECKPOINT_FLUSH_SIZE = int(os.getenv('CHECKPOINT_FLUSH_SIZE', '200'))  # Registros por escrita
+    CHECKPOINT_FLUSH_INTERVAL = float(os.getenv('CHECKPOINT_FLUSH_INTERVAL', '5'))  # Segundos
+    
+    # Arquivo local das respostas do scan (--archive / --from-archive)
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')  # '' = desligado
+    ARCHIVE_MAX_MB = int(os.getenv('ARCHIVE_MAX_MB', '1024'))  # Acima disso os segmentos mais antigos saem (0 = sem limite)
+    ARCHIVE_SEGMENT_MB = int(os.getenv('ARCHIVE_SEGMENT_MB', '64'))  # Tamanho de cada segmento
+    ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'gzip')  # gzip ou zstd (requer zstandard)
+    
+    # Snapshot exportado pelo snapshot.py (--snapshot): lido no lugar do banco antigo
+    SNAPSHOT_FILE = os.getenv('SNAPSHOT_FILE', '')  # '' = lê do banco antigo
+    
+    # Modo contínuo (--follow): notas novas ou alteradas, por (updatedAt, id)
+    FOLLOW_INTERVAL = float(os.getenv('FOLLOW_INTERVAL', '30'))  # Segundos entre consultas sem novidades
+    FOLLOW_CYCLE_LIMIT = int(os.getenv('FOLLOW_CYCLE_LIMIT', '5000'))  # Notas por ciclo (watermark gravada a cada ciclo)
+    FOLLOW_SAFETY_LAG = float(os.getenv('FOLLOW_SAFETY_LAG', '5'))  # Segundos de updatedAt relidos a cada ciclo (gravações atrasadas)
+    
+    def set_api_base_url(self, url: str) -> None:
+        """Aponta esta instância para outro servidor (endpoints derivados juntos)"""
+        self.API_BASE_URL = url.rstrip('/')
+        self.API_SCAN_ENDPOINT = f"{self.API_BASE_URL}/api/scan/process"
+        self.API_SCAN_BATCH_ENDPOINT = f"{self.API_BASE_URL}/api/scan/process-batch"
+        self.API_NOTAS_ENDPOINT = f"{self.API_BASE_URL}/api/notas"
+        self.API_CHAVES_ENDPOINT = f"{self.API_BASE_URL}/api/notas/chaves"
+        self.API_SAVE_ENDPOINT = f"{self.API_BASE_URL}/api/notas/salvar"
     
     @classmethod
     def get_old_db_connection_string(cls):
@@ -0,0 +1,267 @@
+# migration/connection_pool.py
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+class PoolTimeoutError(Exception):
+    """Nenhuma conexão do pool ficou livre dentro do prazo"""
+
+class ConnectionPool:
+    """Conexões com o banco antigo compartilhadas entre threads
+
+    `connection()` empresta uma conexão e a devolve ao fim do bloco. Uma
+    conexão parada há mais de `ping_interval` segundos passa por um
+    `SELECT 1` antes de ser entregue e, se não responder, é trocada por uma
+    nova. Se o bloco terminar com um dos `disconnect_errors` e
+    `disconnect_check` (quando dado) confirmar que é conexão caída, a conexão
+    é descartada em vez de voltar ao pool; os demais erros do driver (coluna
+    inexistente, banco travado) devolvem a conexão normalmente.
+    """
+
+    def __init__(self, factory: Callable[[], Any], disconnect_errors: Tuple[Type[BaseException], ...] = (),
+                 ping_interval: float = 30.0,
+                 disconnect_check: Optional[Callable[[BaseException], bool]] = None):
+        self.factory = factory
+        self.disconnect_errors = disconnect_errors
+        self.disconnect_check = disconnect_check
+        self.ping_interval = ping_interval
+        self.reconnects = 0  # Conexões trocadas no health check
+        self._closed = False
+        self._stats_lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        raise NotImplementedError
+
+    def release(self, connection: Any, broken: bool = False) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def is_disconnect(self, error: BaseException) -> bool:
+        """O erro indica que a conexão caiu (e não um erro da consulta)?"""
+        if not isinstance(error, self.disconnect_errors):
+            return False
+        return self.disconnect_check is None or self.disconnect_check(error)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except self.disconnect_errors as e:
+            self.release(connection, broken=self.is_disconnect(e))
+            raise
+        except BaseException:
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def _stale(self, last_used: float) -> bool:
+        return self.ping_interval >= 0 and time.monotonic() - last_used >= self.ping_interval
+
+    @staticmethod
+    def ping(connection: Any) -> bool:
+        """Health check: a conexão ainda responde a uma consulta trivial?"""
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _replace(self, connection: Any, reason: str) -> Any:
+        """Fecha a conexão e abre outra no lugar"""
+        self._close_quietly(connection)
+        with self._stats_lock:
+            self.reconnects += 1
+        logger.warning(f"🔄 Reconectando ao banco antigo ({reason})")
+        return self.factory()
+
+class ThreadLocalPool(ConnectionPool):
+    """Uma conexão por thread (sqlite: conexões não devem trocar de thread)
+
+    Cada thread abre a sua na primeira consulta e a reutiliza até `close`.
+    Conexões de threads que já terminaram são fechadas quando outra é aberta.
+    A fábrica deve criar conexões com check_same_thread=False, para que
+    `close` (chamado de outra thread) consiga fechá-las.
+
+    `close` só fecha as conexões que não estão emprestadas no momento; a de
+    uma thread que ainda está no meio de uma consulta é fechada pela própria
+    thread ao devolvê-la, nunca por baixo dela.
+    """
+
+    def __init__(self, factory: Callable[[], Any], disconnect_errors: Tuple[Type[BaseException], ...] = (),
+                 ping_interval: float = 30.0,
+                 disconnect_check: Optional[Callable[[BaseException], bool]] = None):
+        super().__init__(factory, disconnect_errors, ping_interval, disconnect_check)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # id da thread → (thread, conexão)
+        self._connections: Dict[int, Tuple[threading.Thread, Any]] = {}
+        # id da thread → empréstimos em aberto (connection() pode aninhar)
+        self._borrowed: Dict[int, int] = {}
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        ident = threading.get_ident()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pool de conexões fechado")
+            self._borrowed[ident] = self._borrowed.get(ident, 0) + 1
+        try:
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self.factory()
+                self._register(connection)
+            elif self._stale(self._local.last_used) and not self.ping(connection):
+                connection = self._replace(connection, "health check falhou")
+                self._register(connection)
+            return connection
+        except BaseException:
+            self._unborrow(ident)
+            raise
+
+    def _unborrow(self, ident: int) -> bool:
+        """Encerra um empréstimo; True se a thread não tem mais nenhum (chamar com o lock)"""
+        remaining = self._borrowed.get(ident, 1) - 1
+        if remaining:
+            self._borrowed[ident] = remaining
+            return False
+        self._borrowed.pop(ident, None)
+        return True
+
+    def _register(self, connection: Any) -> None:
+        current = threading.current_thread()
+        self._local.connection = connection
+        self._local.last_used = time.monotonic()
+        with self._lock:
+            finished = [ident for ident, (thread, _) in self._connections.items() if not thread.is_alive()]
+            orphans = [self._connections.pop(ident)[1] for ident in finished]
+            self._connections[current.ident] = (current, connection)
+        for orphan in orphans:
+            self._close_quietly(orphan)
+
+    def release(self, connection: Any, broken: bool = False) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            idle = self._unborrow(ident)
+            # Pool fechado com a conexão emprestada: `close` deixou para nós
+            discard = broken or (self._closed and idle)
+            if discard:
+                self._connections.pop(ident, None)
+        if discard:
+            self._close_quietly(connection)
+            self._local.connection = None
+            return
+        self._local.last_used = time.monotonic()
+
+    def close(self) -> None:
+        """Fecha as conexões livres; as emprestadas são fechadas ao voltar"""
+        with self._lock:
+            self._closed = True
+            idle = [ident for ident in self._connections if ident not in self._borrowed]
+            connections = [self._connections.pop(ident)[1] for ident in idle]
+        for connection in connections:
+            self._close_quietly(connection)
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+class BoundedPool(ConnectionPool):
+    """Até `max_size` conexões (pymysql/psycopg2), emprestadas uma thread por vez
+
+    Conexões são abertas sob demanda; com todas emprestadas, `acquire`
+    espera até `timeout` segundos e então levanta PoolTimeoutError. A
+    devolvida mais recentemente é a próxima a sair (a mais "quente"), e as
+    que ficam paradas passam pelo health check antes de voltar ao uso.
+    """
+
+    def __init__(self, factory: Callable[[], Any], max_size: int, disconnect_errors: Tuple[Type[BaseException], ...] = (),
+                 ping_interval: float = 30.0, timeout: float = 30.0,
+                 disconnect_check: Optional[Callable[[BaseException], bool]] = None):
+        super().__init__(factory, disconnect_errors, ping_interval, disconnect_check)
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._idle: List[Tuple[Any, float]] = []  # (conexão, último uso)
+        self._opened = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Pool de conexões fechado")
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._opened < self.max_size:
+                    # Reserva a vaga; a conexão é aberta fora do lock
+                    self._opened += 1
+                    connection, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"Nenhuma das {self.max_size} conexões com o banco antigo ficou livre em {timeout:g}s"
+                    )
+                self._cond.wait(remaining)
+
+        try:
+            if connection is None:
+                return self.factory()
+            if self._stale(last_used) and not self.ping(connection):
+                return self._replace(connection, "health check falhou")
+            return connection
+        except BaseException:
+            # Não abriu: libera a vaga para outra thread tentar
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, connection: Any, broken: bool = False) -> None:
+        with self._cond:
+            if broken or self._closed:
+                self._opened -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._cond.notify()
+        if connection is not None:
+            self._close_quietly(connection)
+
+    def close(self) -> None:
+        """Fecha as conexões livres; as emprestadas são fechadas ao voltar"""
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._opened -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    @property
+    def size(self) -> int:
+        with self._cond:
+            return self._opened
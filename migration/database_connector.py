@@ -1,51 +1,124 @@
 # migration/database_connector.py
 import sqlite3
 import pymysql
+import pymysql.cursors
 import psycopg2
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import logging
 from config import Config
+from connection_pool import ConnectionPool, ThreadLocalPool, BoundedPool
+import sqlite_access
 
 logger = logging.getLogger(__name__)
 
+# Mensagens do sqlite3 para conexão fechada ou arquivo inacessível
+SQLITE_DISCONNECT_MESSAGES = ('closed database', 'unable to open database', 'disk i/o error')
+# CR_CONN_HOST_ERROR, CR_SERVER_GONE_ERROR, CR_SERVER_LOST e afins (pymysql usa o errno em args[0])
+MYSQL_DISCONNECT_CODES = {2003, 2006, 2013, 2055}
+# admin_shutdown, crash_shutdown, cannot_connect_now (a classe 08 é tratada à parte)
+PG_DISCONNECT_CODES = {'57P01', '57P02', '57P03'}
+
 class DatabaseConnector:
-    """Conector para banco de dados antigo"""
+    """Conector para banco de dados antigo
+    
+    Pode ser usado por várias threads ao mesmo tempo: cada consulta empresta
+    uma conexão do pool (uma por thread no sqlite, até DB_POOL_SIZE no
+    MySQL/PostgreSQL) e a devolve ao terminar, então o leitor e os estágios
+    que buscam itens consultam em paralelo.
+    """
+    
+    def __init__(self, shard: Optional[Tuple[int, int]] = None, config: Config = None):
+        self.config = config or Config()
+        self.pool: Optional[ConnectionPool] = None
+        # (índice, total): lê só as notas com id % total == índice
+        self.shard = shard
     
-    def __init__(self):
-        self.config = Config()
-        self.connection = None
-        self.cursor = None
+    def _open_connection(self):
+        """Abre uma nova conexão com o banco antigo"""
+        if self.config.OLD_DB_TYPE == 'sqlite':
+            # Somente leitura, mmap e cache maior (ver sqlite_access.connect)
+            connection = sqlite_access.connect(self.config.OLD_DB_FILE, self.config, check_same_thread=False)
+            connection.row_factory = sqlite3.Row  # Para retornar dicts
+            
+        elif self.config.OLD_DB_TYPE == 'mysql':
+            connection = pymysql.connect(
+                host=self.config.OLD_DB_HOST,
+                port=self.config.OLD_DB_PORT,
+                user=self.config.OLD_DB_USER,
+                password=self.config.OLD_DB_PASSWORD,
+                database=self.config.OLD_DB_NAME,
+                charset='utf8mb4',
+                # Sem transação aberta entre consultas: uma conexão reaproveitada
+                # pelo pool não fica presa a um retrato antigo das tabelas
+                autocommit=True
+            )
+            
+        elif self.config.OLD_DB_TYPE == 'postgresql':
+            connection = psycopg2.connect(
+                host=self.config.OLD_DB_HOST,
+                port=self.config.OLD_DB_PORT,
+                user=self.config.OLD_DB_USER,
+                password=self.config.OLD_DB_PASSWORD,
+                database=self.config.OLD_DB_NAME
+            )
+            connection.autocommit = True
+        else:
+            raise ValueError(f"Tipo de banco não suportado: {self.config.OLD_DB_TYPE}")
+        
+        return connection
+    
+    def _disconnect_errors(self) -> Tuple[type, ...]:
+        """Erros do driver que podem indicar conexão perdida (ver _is_disconnect)"""
+        if self.config.OLD_DB_TYPE == 'sqlite':
+            # ProgrammingError: conexão fechada por baixo ("Cannot operate on a closed database")
+            return (sqlite3.OperationalError, sqlite3.ProgrammingError)
+        if self.config.OLD_DB_TYPE == 'mysql':
+            return (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+        return (psycopg2.OperationalError, psycopg2.InterfaceError)
+    
+    def _is_disconnect(self, error: BaseException) -> bool:
+        """O erro é mesmo conexão perdida? (a conexão é descartada e a consulta repetida)
+        
+        Os drivers usam as mesmas classes para erros da consulta ("no such
+        column", "database is locked", deadlock): esses sobem como estão, sem
+        descartar a conexão nem repetir.
+        """
+        if self.config.OLD_DB_TYPE == 'sqlite':
+            message = str(error).lower()
+            return any(text in message for text in SQLITE_DISCONNECT_MESSAGES)
+        if self.config.OLD_DB_TYPE == 'mysql':
+            if isinstance(error, pymysql.err.InterfaceError):
+                return True
+            return bool(error.args) and error.args[0] in MYSQL_DISCONNECT_CODES
+        if isinstance(error, psycopg2.InterfaceError):
+            return True
+        # Sem SQLSTATE: erro do próprio libpq (socket fechado, servidor sumiu)
+        pgcode = getattr(error, 'pgcode', None)
+        return pgcode is None or pgcode.startswith('08') or pgcode in PG_DISCONNECT_CODES
     
     def connect(self):
-        """Estabelece conexão com o banco antigo"""
+        """Estabelece conexão com o banco antigo (cria o pool e abre a primeira conexão)"""
         try:
             if self.config.OLD_DB_TYPE == 'sqlite':
-                self.connection = sqlite3.connect(self.config.OLD_DB_FILE)
-                self.connection.row_factory = sqlite3.Row  # Para retornar dicts
-                
-            elif self.config.OLD_DB_TYPE == 'mysql':
-                self.connection = pymysql.connect(
-                    host=self.config.OLD_DB_HOST,
-                    port=self.config.OLD_DB_PORT,
-                    user=self.config.OLD_DB_USER,
-                    password=self.config.OLD_DB_PASSWORD,
-                    database=self.config.OLD_DB_NAME,
-                    charset='utf8mb4'
+                pool = ThreadLocalPool(
+                    self._open_connection,
+                    disconnect_errors=self._disconnect_errors(),
+                    disconnect_check=self._is_disconnect,
+                    ping_interval=self.config.DB_POOL_PING_INTERVAL
                 )
-                
-            elif self.config.OLD_DB_TYPE == 'postgresql':
-                self.connection = psycopg2.connect(
-                    host=self.config.OLD_DB_HOST,
-                    port=self.config.OLD_DB_PORT,
-                    user=self.config.OLD_DB_USER,
-                    password=self.config.OLD_DB_PASSWORD,
-                    database=self.config.OLD_DB_NAME
-                )
-                self.connection.autocommit = True
             else:
-                raise ValueError(f"Tipo de banco não suportado: {self.config.OLD_DB_TYPE}")
-            
-            self.cursor = self.connection.cursor()
+                pool = BoundedPool(
+                    self._open_connection,
+                    max_size=self.config.DB_POOL_SIZE,
+                    disconnect_errors=self._disconnect_errors(),
+                    disconnect_check=self._is_disconnect,
+                    ping_interval=self.config.DB_POOL_PING_INTERVAL,
+                    timeout=self.config.DB_POOL_TIMEOUT
+                )
+            # Primeira conexão já aqui: arquivo ou credencial errados falham no connect
+            with pool.connection():
+                pass
+            self.pool = pool
             logger.info(f"✅ Conectado ao banco {self.config.OLD_DB_TYPE}: {self.config.OLD_DB_NAME}")
             
         except Exception as e:
@@ -53,13 +126,59 @@ class DatabaseConnector:
             raise
     
     def disconnect(self):
-        """Fecha conexão com o banco"""
-        if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
+        """Fecha as conexões com o banco"""
+        if self.pool is not None:
+            if self.pool.reconnects:
+                logger.info(f"🔄 Reconexões ao banco antigo: {self.pool.reconnects}")
+            self.pool.close()
+            self.pool = None
         logger.info("🔌 Conexão com banco fechada")
     
+    def _fetch(self, query: str, params: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """Executa uma consulta numa conexão do pool e devolve as linhas como dicts
+        
+        Se a conexão caiu (servidor reiniciado, timeout de inatividade), ela é
+        descartada e a consulta repetida uma vez em uma conexão nova: o
+        conector só faz leituras, então repetir é seguro.
+        """
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as connection:
+                    cursor = connection.cursor()
+                    try:
+                        if params:
+                            cursor.execute(query, params)
+                        else:
+                            cursor.execute(query)
+                        columns = [desc[0] for desc in cursor.description]
+                        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+                    finally:
+                        cursor.close()
+            except self.pool.disconnect_errors as e:
+                if attempt or not self.pool.is_disconnect(e):
+                    raise
+                logger.warning(f"🔄 Conexão com o banco antigo perdida ({e}); repetindo a consulta")
+    
+    def _placeholder(self) -> str:
+        """Marcador de parâmetro do driver em uso (sqlite3 usa '?', os demais '%s')"""
+        return '?' if self.config.OLD_DB_TYPE == 'sqlite' else '%s'
+    
+    def _shard_clause(self) -> str:
+        """Filtro SQL da fatia (shard) desta instância, ou vazio sem sharding
+        
+        Partição por id módulo N: determinística, disjunta e sem depender da
+        ordem de leitura. Os valores são inteiros validados e vão literais na
+        query (MOD() em MySQL/PostgreSQL evita o '%' que os drivers tratam
+        como marcador de parâmetro).
+        """
+        if not self.shard:
+            return ""
+        
+        index, count = int(self.shard[0]), int(self.shard[1])
+        if self.config.OLD_DB_TYPE == 'sqlite':
+            return f" AND (id % {count}) = {index}"
+        return f" AND MOD(id, {count}) = {index}"
+    
     def get_tables_info(self) -> List[Dict[str, Any]]:
         """Retorna informações sobre as tabelas do banco"""
         try:
@@ -78,7 +197,6 @@ class DatabaseConnector:
                 WHERE TABLE_SCHEMA = %s
                 ORDER BY TABLE_NAME
                 """
-                self.cursor.execute(query, (self.config.OLD_DB_NAME,))
                 
             elif self.config.OLD_DB_TYPE == 'postgresql':
                 query = """
@@ -89,13 +207,11 @@ class DatabaseConnector:
                 ORDER BY table_name
                 """
             
-            if self.config.OLD_DB_TYPE == 'sqlite':
-                self.cursor.execute(query)
-            else:
-                self.cursor.execute(query)
+            params = [self.config.OLD_DB_NAME] if self.config.OLD_DB_TYPE == 'mysql' else None
             
             tables = []
-            for row in self.cursor.fetchall():
+            for row in self._fetch(query, params):
+                row = list(row.values())
                 if self.config.OLD_DB_TYPE == 'sqlite':
                     tables.append({
                         'table_name': row[0],
@@ -115,58 +231,156 @@ class DatabaseConnector:
             logger.error(f"❌ Erro ao obter informações das tabelas: {e}")
             return []
     
-    def get_notas_fiscais(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
-        """Retorna lista de notas fiscais do banco antigo"""
+    def _notas_base_query(self) -> str:
+        """SELECT das notas válidas (com os campos do QR Code) da fatia desta instância"""
+        # Query baseada na sua query SQL
+        query = """
+        SELECT 
+            id,
+            chave,
+            versao,
+            ambiente,
+            cIdToken,
+            vSig,
+            cnpjEmitente,
+            nomeEmitente,
+            ieEmitente,
+            createdAt,
+            updatedAt
+        FROM notas_fiscais
+        WHERE chave IS NOT NULL 
+            AND versao IS NOT NULL 
+            AND ambiente IS NOT NULL 
+            AND cIdToken IS NOT NULL 
+            AND vSig IS NOT NULL
+        """
+        return query + self._shard_clause()
+    
+    def _notas_query(self, limit: Optional[int] = None, offset: int = 0,
+                     after: Optional[Tuple[Any, int]] = None) -> Tuple[str, List[Any]]:
+        """Monta a query de notas válidas e seus parâmetros
+        
+        Com `after` = (createdAt, id) da última nota lida usa paginação por
+        chave (keyset): o banco posiciona direto no cursor em vez de reler as
+        linhas puladas pelo OFFSET, então a página N custa o mesmo que a
+        primeira. Notas inseridas durante a execução ficam antes do cursor
+        (createdAt mais novo) e não deslocam as páginas seguintes. Notas com
+        createdAt nulo não são alcançadas nesse modo.
+        """
+        query = self._notas_base_query()
+        params = []
+        
+        if after is not None:
+            ph = self._placeholder()
+            # Expandido em OR (em vez de comparação de tupla) para usar o
+            # índice de createdAt em sqlite, MySQL e PostgreSQL
+            query += f" AND (createdAt < {ph} OR (createdAt = {ph} AND id < {ph}))"
+            params.extend([after[0], after[0], after[1]])
+        
+        # id desempata notas com o mesmo createdAt (ordem determinística)
+        query += " ORDER BY createdAt DESC, id DESC"
+        
+        if limit:
+            query += f" LIMIT {int(limit)}"
+            if offset:
+                query += f" OFFSET {int(offset)}"
+        elif offset:
+            # sqlite e MySQL não aceitam OFFSET sem LIMIT
+            query += f" LIMIT {2**63 - 1} OFFSET {int(offset)}"
+        
+        return query, params
+    
+    def get_notas_fiscais(self, limit: Optional[int] = None, offset: int = 0,
+                          after: Optional[Tuple[Any, int]] = None) -> List[Dict[str, Any]]:
+        """Retorna lista de notas fiscais do banco antigo (ver `_notas_query` para `after`)"""
         try:
-            # Query baseada na sua query SQL
-            query = """
-            SELECT 
-                id,
-                chave,
-                versao,
-                ambiente,
-                cIdToken,
-                vSig,
-                cnpjEmitente,
-                nomeEmitente,
-                ieEmitente,
-                createdAt,
-                updatedAt
-            FROM notas_fiscais
-            WHERE chave IS NOT NULL 
-                AND versao IS NOT NULL 
-                AND ambiente IS NOT NULL 
-                AND cIdToken IS NOT NULL 
-                AND vSig IS NOT NULL
-            ORDER BY createdAt DESC
-            """
-            
-            if limit:
-                query += f" LIMIT {limit} OFFSET {offset}"
-            
-            self.cursor.execute(query)
-            
-            notas = []
-            for row in self.cursor.fetchall():
-                if self.config.OLD_DB_TYPE == 'sqlite':
-                    # SQLite retorna Row objects
-                    notas.append(dict(row))
-                else:
-                    # MySQL/PostgreSQL retorna tuplas
-                    columns = [desc[0] for desc in self.cursor.description]
-                    notas.append(dict(zip(columns, row)))
+            query, params = self._notas_query(limit, offset, after)
+            notas = self._fetch(query, params)
             
             logger.info(f"📊 Encontradas {len(notas)} notas fiscais")
             return notas
             
         except Exception as e:
+            # Lista vazia seria lida como fim da tabela: o resto ficaria para trás sem aviso
             logger.error(f"❌ Erro ao buscar notas fiscais: {e}")
-            return []
+            raise
+    
+    def _changes_query(self, after: Optional[Tuple[Any, int]] = None,
+                       limit: int = 500) -> Tuple[str, List[Any]]:
+        """Query das notas alteradas depois de `after` = (updatedAt, id) e seus parâmetros"""
+        ph = self._placeholder()
+        query = self._notas_base_query() + " AND updatedAt IS NOT NULL"
+        params = []
+        if after is not None:
+            # Mesmo formato em OR do keyset de createdAt, para usar o índice
+            query += f" AND (updatedAt > {ph} OR (updatedAt = {ph} AND id > {ph}))"
+            params.extend([after[0], after[0], after[1]])
+        query += f" ORDER BY updatedAt, id LIMIT {int(limit)}"
+        return query, params
+    
+    def get_notas_alteradas(self, after: Optional[Tuple[Any, int]] = None,
+                            limit: int = 500) -> List[Dict[str, Any]]:
+        """Notas criadas ou alteradas depois de `after` = (updatedAt, id), em ordem crescente
+        
+        Faixa em (updatedAt, id) a partir da última posição vista: com um
+        índice nessas colunas o banco lê só as linhas novas, então o custo de
+        cada consulta do --follow acompanha o volume de alterações, não o
+        tamanho da tabela. Notas com updatedAt nulo não são alcançadas.
+        """
+        query, params = self._changes_query(after, limit)
+        return self._fetch(query, params)
+    
+    def iter_notas_fiscais(self, prefetch: Optional[int] = None, limit: Optional[int] = None,
+                           offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """Percorre as notas fiscais em streaming, com memória limitada
+        
+        Usa uma conexão própria, fora do pool (o cursor fica aberto a leitura
+        inteira e as demais consultas seguem pelo pool), e traz `prefetch` linhas por vez: fetchmany no sqlite,
+        SSCursor (sem buffer no cliente) no pymysql e cursor nomeado do lado
+        do servidor no psycopg2. A memória fica constante qualquer que seja o
+        tamanho da tabela.
+        """
+        prefetch = prefetch or self.config.STREAM_PREFETCH
+        query, params = self._notas_query(limit, offset)
+        
+        connection = self._open_connection()
+        cursor = None
+        try:
+            if self.config.OLD_DB_TYPE == 'mysql':
+                cursor = connection.cursor(pymysql.cursors.SSCursor)
+            elif self.config.OLD_DB_TYPE == 'postgresql':
+                # withhold=True permite cursor nomeado com autocommit ligado
+                cursor = connection.cursor(name='notas_fiscais_stream', withhold=True)
+                cursor.itersize = prefetch
+            else:
+                cursor = connection.cursor()
+            
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            
+            columns = None
+            while True:
+                rows = cursor.fetchmany(prefetch)
+                if not rows:
+                    break
+                
+                # Cursor nomeado do psycopg2 só tem description após o primeiro fetch
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description]
+                
+                for row in rows:
+                    yield dict(zip(columns, row))
+        finally:
+            if cursor is not None:
+                cursor.close()
+            connection.close()
     
     def get_itens_nota(self, nota_id: int) -> List[Dict[str, Any]]:
         """Retorna itens de uma nota fiscal específica"""
         try:
-            query = """
+            query = f"""
             SELECT 
                 id,
                 codigo,
@@ -179,26 +393,64 @@ class DatabaseConnector:
                 createdAt,
                 updatedAt
             FROM itens_nota
-            WHERE notaFiscalId = %s
+            WHERE notaFiscalId = {self._placeholder()}
             ORDER BY id
             """
             
-            self.cursor.execute(query, (nota_id,))
-            
-            itens = []
-            for row in self.cursor.fetchall():
-                if self.config.OLD_DB_TYPE == 'sqlite':
-                    itens.append(dict(row))
-                else:
-                    columns = [desc[0] for desc in self.cursor.description]
-                    itens.append(dict(zip(columns, row)))
-            
-            return itens
+            return self._fetch(query, [nota_id])
             
         except Exception as e:
             logger.error(f"❌ Erro ao buscar itens da nota {nota_id}: {e}")
             return []
     
+    def _itens_query(self, count: int) -> str:
+        """Query dos itens de `count` notas (um marcador por id), ordenados por nota"""
+        placeholders = ', '.join(self._placeholder() for _ in range(count))
+        return f"""
+        SELECT 
+            id,
+            codigo,
+            descricao,
+            quantidade,
+            unidade,
+            valorUnitario,
+            valorTotal,
+            notaFiscalId,
+            createdAt,
+            updatedAt
+        FROM itens_nota
+        WHERE notaFiscalId IN ({placeholders})
+        ORDER BY notaFiscalId, id
+        """
+    
+    def get_itens_notas(self, nota_ids: List[int], chunk_size: int = 500) -> Dict[int, List[Dict[str, Any]]]:
+        """Retorna os itens de várias notas de uma vez, agrupados por nota
+        
+        Uma consulta `WHERE notaFiscalId IN (...)` por bloco de `chunk_size`
+        ids (abaixo do limite de parâmetros do sqlite) em vez de uma por nota.
+        As linhas vêm ordenadas por (notaFiscalId, id) e são agrupadas numa
+        única passada. Notas sem itens aparecem com lista vazia.
+        """
+        itens_por_nota = {nota_id: [] for nota_id in nota_ids}
+        ids = list(itens_por_nota)
+        
+        try:
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                
+                nota_atual, itens_atuais = None, None
+                for item in self._fetch(self._itens_query(len(chunk)), chunk):
+                    if item['notaFiscalId'] != nota_atual:
+                        nota_atual = item['notaFiscalId']
+                        itens_atuais = itens_por_nota.setdefault(nota_atual, [])
+                    itens_atuais.append(item)
+            
+            return itens_por_nota
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar itens de {len(ids)} notas: {e}")
+            raise
+    
     def get_total_notas(self) -> int:
         """Retorna total de notas fiscais no banco antigo"""
         try:
@@ -210,16 +462,31 @@ class DatabaseConnector:
                 AND ambiente IS NOT NULL 
                 AND cIdToken IS NOT NULL 
                 AND vSig IS NOT NULL
-            """
+            """ + self._shard_clause()
             
-            self.cursor.execute(query)
-            result = self.cursor.fetchone()
-            
-            if self.config.OLD_DB_TYPE == 'sqlite':
-                return result['total']
-            else:
-                return result[0]
+            return self._fetch(query)[0]['total']
                 
         except Exception as e:
             logger.error(f"❌ Erro ao contar notas fiscais: {e}")
             return 0
+    
+    def explain_plans(self) -> Dict[str, List[str]]:
+        """Plano (EXPLAIN QUERY PLAN) das consultas da migração no sqlite
+        
+        Cobre a primeira página e as seguintes do keyset, a página do --follow
+        e a busca de itens do modo direct. Um passo 'USE TEMP B-TREE' indica
+        que a consulta ordena a tabela inteira a cada página: falta índice
+        (ver sqlite_access.INDEXES e --sqlite-index). Nos demais bancos
+        devolve vazio.
+        """
+        if self.config.OLD_DB_TYPE != 'sqlite':
+            return {}
+        
+        sample = (0, 0)
+        with self.pool.connection() as connection:
+            return sqlite_access.explain_plans(connection, {
+                'notas': self._notas_query(limit=500),
+                'notas_keyset': self._notas_query(limit=500, after=sample),
+                'alteradas': self._changes_query(after=sample),
+                'itens': (self._itens_query(2), [0, 0]),
+            })
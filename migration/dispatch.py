@@ -0,0 +1,133 @@
+# migration/dispatch.py
+import asyncio
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class DispatchStrategy:
+    """Como o motor executa as unidades de envio (nota ou bloco de notas)
+
+    `submit(func, arg)` devolve o controle assim que a unidade estiver em
+    andamento; `wait_idle()` espera todas terminarem. Cada unidade ocupa uma
+    vaga de `slots`: sem vaga o despacho espera e o pipeline segura o leitor.
+    """
+
+    name = 'serial'
+    is_async = False
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+        self.slots_size = 0
+        self.slots = None
+
+    def start(self) -> None:
+        """Prepara a execução (chamado uma vez, antes do primeiro submit)"""
+
+    def submit(self, func: Callable[[Any], Any], arg: Any) -> None:
+        func(arg)
+
+    def wait_idle(self) -> None:
+        """Bloqueia até nenhuma unidade estar em andamento"""
+        if self.slots is None:
+            return
+        # Ocupar todas as vagas só é possível quando nenhuma está em uso
+        for _ in range(self.slots_size):
+            self.slots.acquire()
+        for _ in range(self.slots_size):
+            self.slots.release()
+
+    def close(self) -> None:
+        """Aguarda as unidades em andamento e libera os recursos"""
+
+    def _release_slot(self, future) -> None:
+        self.slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"💥 Erro no envio: {future.exception()}")
+
+class SerialDispatch(DispatchStrategy):
+    """Uma unidade por vez, na própria thread de envio"""
+
+class ThreadPoolDispatch(DispatchStrategy):
+    """Unidades em um pool de `workers` threads
+
+    O dobro de vagas em relação aos workers mantém o pool ocupado enquanto o
+    próximo lote é despachado.
+    """
+
+    name = 'threads'
+
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        self.executor = None
+
+    def start(self) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='migracao')
+        self.slots_size = self.workers * 2
+        self.slots = threading.BoundedSemaphore(self.slots_size)
+        logger.info(f"⚡ Modo concorrente: {self.workers} workers")
+
+    def submit(self, func: Callable[[Any], Any], arg: Any) -> None:
+        self.slots.acquire()
+        future = self.executor.submit(func, arg)
+        future.add_done_callback(self._release_slot)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+class AsyncDispatch(DispatchStrategy):
+    """Lotes inteiros como corrotinas em um event loop de thread própria
+
+    `client_factory` cria o cliente assíncrono dentro do loop (httpx exige
+    isso); `semaphore` limita a `workers` requisições simultâneas. Duas vagas:
+    um lote em andamento e o próximo já despachado.
+    """
+
+    name = 'async'
+    is_async = True
+
+    def __init__(self, workers: int, client_factory: Callable[[], Any]):
+        super().__init__(workers)
+        self.client_factory = client_factory
+        self.client = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.loop = None
+        self.loop_thread = None
+
+    def start(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name='migracao-async', daemon=True)
+        self.loop_thread.start()
+
+        async def create_client():
+            # Cliente e semáforo precisam nascer dentro do loop que os usa
+            self.semaphore = asyncio.Semaphore(self.workers)
+            return self.client_factory()
+
+        self.client = asyncio.run_coroutine_threadsafe(create_client(), self.loop).result()
+        self.slots_size = 2
+        self.slots = threading.BoundedSemaphore(self.slots_size)
+        logger.info(f"⚡ Modo assíncrono: até {self.workers} requisições simultâneas")
+
+    def submit(self, func: Callable[[Any], Any], arg: Any) -> None:
+        """`func` aqui é uma função de corrotina (ex.: o lote inteiro)"""
+        self.slots.acquire()
+        future = asyncio.run_coroutine_threadsafe(func(arg), self.loop)
+        future.add_done_callback(self._release_slot)
+
+    def close(self) -> None:
+        """Fecha o pool de conexões e encerra o event loop"""
+        if self.loop is None:
+            return
+        self.wait_idle()
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        self.client = None
+        self.loop = None
+        self.loop_thread = None
@@ -0,0 +1,808 @@
+# migration/engine.py
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from tqdm import tqdm
+
+from config import Config
+from database_connector import DatabaseConnector
+from api_client import APIClient
+from checkpoint import CheckpointJournal, rewind_watermark
+from preflight import DuplicateFilter
+from pipeline import MigrationPipeline
+from validation import validate_batch
+from retry import RetryScheduler
+from metrics import MigrationMetrics, MetricsExporter
+from sources import NotaSource, DatabaseSource, SnapshotSource
+from dispatch import DispatchStrategy, SerialDispatch, ThreadPoolDispatch, AsyncDispatch
+from archive import ScanArchive, is_complete, save_payload
+from sqlite_access import plan_warnings
+from sharding import shard_checkpoint_file
+from logger import logger, MigrationStats
+
+class MigrationEngine:
+    """Motor da migração de NFC-e, usado pelo migrate.py e pelo migrate_sqlite.py
+    
+    De onde as notas vêm é a `source` (NotaSource; padrão: o banco antigo da
+    configuração) e como as requisições são executadas é o `dispatcher`
+    (DispatchStrategy; padrão: serial, pool de threads ou assíncrono conforme
+    --workers/--async). O resto (pipeline, validação, checkpoint, novas
+    tentativas, disjuntor, métricas) é o mesmo para qualquer combinação.
+    `config` é compartilhada com os clientes e o conector, então ajustes por
+    execução (URL da API, DRY_RUN, RATE_LIMIT) valem para todos.
+    """
+    
+    def __init__(self, workers: int = None, read_mode: str = None, prefetch: int = None,
+                 resume: bool = False, checkpoint_file: str = None, preflight: bool = None,
+                 async_dispatch: bool = None, dispatch_batch: int = None, mode: str = None,
+                 shard: Tuple[int, int] = None, metrics_port: int = None, metrics_file: str = None,
+                 config: Config = None, source: NotaSource = None, dispatcher: DispatchStrategy = None,
+                 archive_dir: str = None, from_archive: bool = False, snapshot: str = None):
+        self.config = config or Config()
+        self.shard = shard
+        snapshot = snapshot or self.config.SNAPSHOT_FILE
+        if source is None and snapshot:
+            # Snapshot exportado: nenhum acesso ao banco antigo
+            source = SnapshotSource(snapshot, shard=shard)
+        self.source = source or DatabaseSource(
+            DatabaseConnector(shard=shard, config=self.config),
+            read_mode=read_mode,
+            prefetch=prefetch
+        )
+        self.workers = max(1, workers or self.config.MIGRATION_WORKERS)
+        self.stats = MigrationStats(
+            error_file=shard_checkpoint_file(self.config.ERROR_FILE, *shard) if shard else None,
+            # Retomada: as falhas da execução anterior continuam no arquivo
+            append_errors=resume,
+            config=self.config
+        )
+        self.metrics = MigrationMetrics(self.stats)
+        self.api_client = APIClient(max_concurrency=self.workers, metrics=self.metrics, config=self.config)
+        self.resume = resume
+        self.checkpoint_file = checkpoint_file
+        if shard:
+            self.checkpoint_file = shard_checkpoint_file(
+                checkpoint_file or self.config.CHECKPOINT_FILE, *shard
+            )
+        self.journal = None
+        self.completed_ids = set()
+        self.preflight = self.config.PREFLIGHT_DEDUP if preflight is None else preflight
+        self.duplicate_filter = None
+        self.dispatcher = dispatcher
+        if dispatcher is not None:
+            self.async_dispatch = dispatcher.is_async
+        else:
+            self.async_dispatch = self.config.ASYNC_DISPATCH if async_dispatch is None else async_dispatch
+        self.dispatch_batch = max(1, dispatch_batch or self.config.DISPATCH_BATCH_SIZE)
+        self.mode = mode or self.config.MIGRATION_MODE
+        self.pipeline = None
+        self.retry_scheduler = None
+        
+        # --follow: posição (updatedAt, id) da última nota lida e notas lidas no ciclo
+        self.follow_position = None
+        self.follow_read = 0
+        self.follow_resent = 0
+        # --follow: notas lidas sem desfecho definitivo (id → nota), falhas
+        # transitórias para o próximo ciclo e versões já concluídas (id → updatedAt)
+        self.follow_pending = None
+        self.follow_retry = {}
+        self.follow_done = {}
+        self.follow_lock = threading.Lock()
+        
+        # Métricas ao vivo: porta HTTP (/metrics) e snapshot JSON periódico
+        self.metrics_port = self.config.METRICS_PORT if metrics_port is None else metrics_port
+        self.metrics_file = metrics_file or self.config.METRICS_SNAPSHOT_FILE
+        if shard:
+            # Um endpoint e um arquivo por shard
+            if self.metrics_port:
+                self.metrics_port += shard[0]
+            if self.metrics_file:
+                self.metrics_file = shard_checkpoint_file(self.metrics_file, *shard)
+        self.metrics_exporter = None
+        
+        # Arquivo local das respostas do scan (um diretório por shard)
+        self.archive_dir = archive_dir or self.config.ARCHIVE_DIR
+        if shard and self.archive_dir:
+            self.archive_dir = shard_checkpoint_file(self.archive_dir.rstrip('/\\'), *shard)
+        self.from_archive = from_archive
+        self.archive = None
+    
+    def validate_config(self, follow: bool = False) -> bool:
+        """Valida configurações antes de iniciar migração"""
+        logger.info("🔍 Validando configurações...")
+        
+        # Testa conexão com banco antigo
+        try:
+            self.source.connect()
+            total_notas = self.source.count()
+            logger.info(f"📊 Banco antigo: {total_notas} notas encontradas")
+            self.stats.total_notas = total_notas
+            # Consultas desta execução que ordenam a tabela inteira a cada página (falta índice)
+            used = {'notas', 'notas_keyset', 'alteradas' if follow else None, 'itens' if self.mode == 'direct' else None}
+            for name, steps in plan_warnings(self.source.explain()).items():
+                if name not in used:
+                    continue
+                logger.warning(f"⚠️ Consulta '{name}' sem índice adequado: {'; '.join(steps)} (veja --explain / --sqlite-index)")
+            self.source.disconnect()
+        except Exception as e:
+            logger.error(f"❌ Erro ao conectar no banco antigo: {e}")
+            return False
+        
+        # Testa conexão com API
+        if not self.api_client.test_connection():
+            logger.error("❌ Erro ao conectar com API do sistema novo")
+            return False
+        
+        # Mostra status da API
+        api_status = self.api_client.get_api_status()
+        logger.info(f"🌐 API Status: {api_status}")
+        
+        return True
+    
+    def load_duplicate_filter(self) -> None:
+        """Baixa as chaves já existentes no sistema novo para a pré-verificação"""
+        logger.info("🔎 Pré-verificação: baixando chaves já existentes no sistema novo...")
+        duplicate_filter = DuplicateFilter(self.api_client)
+        try:
+            total = duplicate_filter.load()
+        except Exception as e:
+            # Sem a lista, a API continua detectando duplicadas normalmente
+            logger.warning(f"⚠️ Pré-verificação desativada: {e}")
+            return
+        
+        self.duplicate_filter = duplicate_filter
+        logger.info(f"🔎 Pré-verificação: {total} chaves já existentes serão puladas")
+    
+    def classify_result(self, result: Dict[str, Any]) -> Tuple[str, str]:
+        """Converte a resposta da API em (status, mensagem)"""
+        if result.get('success'):
+            if result.get('salva', {}).get('status') == 'duplicada':
+                return MigrationStats.DUPLICATE, result.get('salva', {}).get('message', '')
+            return MigrationStats.SUCCESS, result.get('message', 'Processada com sucesso')
+        
+        return MigrationStats.FAILURE, result.get('error', 'Erro desconhecido')
+    
+    @property
+    def client_retries(self) -> int:
+        """Tentativas feitas dentro do cliente (0 quando o RetryScheduler cuida delas)"""
+        return 0 if self.retry_scheduler is not None else self.config.MAX_RETRIES
+    
+    def dispatch_nota(self, nota: Dict[str, Any]) -> Dict[str, Any]:
+        """Envia uma nota para a API e retorna a resposta no formato de process_nfce"""
+        try:
+            if self.from_archive:
+                archived = self.archive.get(str(nota.get('chave', '')).strip())
+                if archived is not None and is_complete(archived):
+                    # Emitente e itens do scan anterior: salva direto, sem novo scrape
+                    result = self.api_client.save_nfce(save_payload(archived), max_retries=self.client_retries)
+                    result['from_archive'] = True
+                    return result
+            
+            if self.mode == 'direct':
+                # Itens do banco antigo: salva direto, sem buscar a página da SEFAZ
+                payload = self.api_client.build_save_payload(nota, nota.get('itens', []))
+                return self.api_client.save_nfce(payload, max_retries=self.client_retries)
+            
+            # URL do QR Code montada no estágio de preparo
+            return self.api_client.process_nfce(nota['qr_url'], max_retries=self.client_retries)
+                
+        except Exception as e:
+            logger.error("💥 Erro ao processar nota %s: %s", nota['id'], e)
+            return {"success": False, "error": str(e), "error_class": "inesperado"}
+    
+    async def dispatch_nota_async(self, nota: Dict[str, Any]) -> Dict[str, Any]:
+        """Versão assíncrona de dispatch_nota (modo --async)"""
+        try:
+            return await self.dispatcher.client.process_nfce(nota['qr_url'], max_retries=self.client_retries)
+        
+        except Exception as e:
+            logger.error("💥 Erro ao processar nota %s: %s", nota['id'], e)
+            return {"success": False, "error": str(e), "error_class": "inesperado"}
+    
+    def process_chunk(self, notas: List[Dict[str, Any]]) -> None:
+        """Envia várias notas em uma única requisição e registra cada desfecho"""
+        try:
+            results = self.api_client.process_nfce_batch(
+                [nota['qr_url'] for nota in notas],
+                max_retries=self.client_retries
+            )
+        except Exception as e:
+            logger.error(f"💥 Erro ao processar lote de {len(notas)} notas: {e}")
+            results = [{"success": False, "error": str(e), "error_class": "inesperado"} for _ in notas]
+        
+        for nota, result in zip(notas, results):
+            self.handle_result(nota, result)
+    
+    def handle_result(self, nota: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Registra o desfecho, ou agenda nova tentativa se a falha for transitória"""
+        if result.get('cancelled'):
+            # Interrompido com o disjuntor aberto: a nota fica para o --resume
+            return
+        
+        if (not result.get('success')
+                and self.retry_scheduler is not None
+                and self.api_client.is_retryable_failure(result)
+                and self.retry_scheduler.schedule(nota, result.get('error', ''))):
+            self.metrics.record_retry()
+            return
+        
+        if (self.follow_pending is not None and not result.get('success')
+                and self.api_client.is_retryable_failure(result)):
+            # --follow: tentativas esgotadas numa falha transitória; a nota volta
+            # no próximo ciclo e a watermark não passa dela
+            # Desfecho ainda não definitivo: não entra nas estatísticas nem no checkpoint
+            with self.follow_lock:
+                self.follow_retry[nota['id']] = nota
+            self.metrics.record_retry()
+            logger.warning(f"⚠️ Nota {nota['id']}: {result.get('error', 'Erro desconhecido')} (volta no próximo ciclo)")
+            return
+        
+        if (self.archive is not None and result.get('success') and is_complete(result)
+                and not result.get('dry_run') and not result.get('from_archive')):
+            self.archive_result(nota, result)
+        
+        status, message = self.classify_result(result)
+        self.record_result(nota['id'], status, message, result.get('error_class'), result.get('status_code'))
+    
+    def archive_result(self, nota: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Guarda a resposta do scan no arquivo local (falha ao arquivar não derruba a nota)"""
+        try:
+            self.archive.put(str(nota.get('chave', '')).strip(), result)
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível arquivar a resposta da nota {nota['id']}: {e}")
+    
+    def record_result(self, nota_id: int, status: str, message: str,
+                      error_class: str = None, http_status: int = None) -> None:
+        """Entrega o desfecho ao estágio de registro (ou grava direto, fora do pipeline)
+        
+        Em falhas, `error_class`/`http_status` classificam a linha do arquivo de erros.
+        """
+        if self.pipeline is not None:
+            self.pipeline.put_result(nota_id, status, message, error_class, http_status)
+        else:
+            self.store_result(nota_id, status, message, error_class, http_status)
+    
+    def store_result(self, nota_id: int, status: str, message: str,
+                     error_class: str = None, http_status: int = None) -> None:
+        """Registra o desfecho da nota nas estatísticas e no checkpoint"""
+        self.stats.add_result(nota_id, status, message, error_class, http_status)
+        self.metrics.record_outcome()
+        if self.journal is not None:
+            self.journal.record(nota_id, status, message)
+        if self.follow_pending is not None:
+            self.settle_follow(nota_id, status)
+    
+    def settle_follow(self, nota_id: int, status: str) -> None:
+        """--follow: nota com desfecho definitivo deixa de segurar a watermark"""
+        with self.follow_lock:
+            if status in (MigrationStats.SUCCESS, MigrationStats.DUPLICATE):
+                self.completed_ids.add(nota_id)
+            nota = self.follow_pending.pop(nota_id, None)
+            if nota is not None:
+                # Relida na janela de segurança com o mesmo updatedAt: não é reenviada
+                self.follow_done[nota_id] = nota['updatedAt']
+    
+    def process_nota(self, nota: Dict[str, Any]) -> None:
+        """Processa uma nota individual"""
+        self.handle_result(nota, self.dispatch_nota(nota))
+    
+    def filter_batch(self, notas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Remove do lote as notas que não precisam de requisição"""
+        if self.completed_ids:
+            # Retomada: notas já concluídas não custam nenhuma requisição
+            pendentes = [nota for nota in notas if nota['id'] not in self.completed_ids]
+            self.stats.add_skipped(len(notas) - len(pendentes))
+            notas = pendentes
+        
+        if self.duplicate_filter is not None:
+            # Pré-verificação: chaves que o sistema novo já tem não são enviadas
+            notas, existentes = self.duplicate_filter.split(notas)
+            for nota in existentes:
+                self.record_result(
+                    nota['id'],
+                    MigrationStats.DUPLICATE,
+                    "Já existe no sistema novo (pré-verificação)"
+                )
+        
+        return notas
+    
+    def attach_itens(self, notas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Modo direct: carrega os itens do lote inteiro em uma consulta"""
+        try:
+            itens_por_nota = self.source.get_itens_notas([nota['id'] for nota in notas])
+        except Exception as e:
+            for nota in notas:
+                self.record_result(nota['id'], MigrationStats.FAILURE, f"Erro ao buscar itens: {e}", 'itens')
+            return []
+        
+        for nota in notas:
+            nota['itens'] = itens_por_nota.get(nota['id'], [])
+        return notas
+    
+    def read_batches(self, batch_size: int, limit: int = None, offset: int = 0,
+                     follow: bool = False) -> Iterator[List[Dict[str, Any]]]:
+        """Estágio de leitura: lotes filtrados (checkpoint e pré-verificação)
+        
+        A origem é conectada pelo run_pipeline. Com `follow`, lê as notas
+        novas ou alteradas (ver read_changes).
+        """
+        if follow:
+            batches = self.read_changes(batch_size, limit)
+        else:
+            batches = self.source.iter_batches(batch_size, limit, offset)
+        try:
+            while True:
+                start = time.monotonic()
+                notas = next(batches, None)
+                if notas is None:
+                    break
+                self.metrics.observe_fetch(time.monotonic() - start, len(notas))
+                
+                notas = self.filter_batch(notas)
+                if notas:
+                    yield notas
+        finally:
+            batches.close()
+    
+    def read_changes(self, batch_size: int, limit: int) -> Iterator[List[Dict[str, Any]]]:
+        """Lotes de um ciclo do --follow: falhas transitórias do ciclo anterior e
+        até `limit` notas novas ou alteradas depois de `follow_position`
+        
+        A leitura recomeça FOLLOW_SAFETY_LAG segundos antes da posição, para
+        alcançar notas gravadas com atraso; as que já tiveram desfecho com o
+        mesmo updatedAt, e as já migradas segundo o checkpoint, são puladas
+        sem requisição.
+        """
+        with self.follow_lock:
+            retry = list(self.follow_retry.values())
+            self.follow_retry.clear()
+        self.follow_resent = len(retry)
+        for nota in retry:
+            # Novo ciclo, novas tentativas no RetryScheduler
+            nota.pop('tentativas', None)
+        for i in range(0, len(retry), batch_size):
+            # Já contadas no total quando lidas pela primeira vez
+            yield retry[i:i + batch_size]
+        
+        after = rewind_watermark(self.follow_position, self.config.FOLLOW_SAFETY_LAG)
+        batches = self.source.iter_changes(batch_size, after)
+        try:
+            for notas in batches:
+                novas = []
+                with self.follow_lock:
+                    for nota in notas:
+                        if self.follow_read + len(novas) >= limit:
+                            break
+                        self.follow_position = (nota['updatedAt'], nota['id'])
+                        if nota['id'] in self.completed_ids:
+                            # Já migrada (sucesso ou duplicada): o sistema novo não
+                            # atualiza notas existentes, reenviar só daria "duplicada"
+                            continue
+                        pendente = self.follow_pending.get(nota['id'])
+                        if (self.follow_done.get(nota['id']) == nota['updatedAt']
+                                or (pendente is not None and pendente['updatedAt'] == nota['updatedAt'])):
+                            # Mesma versão já concluída, em andamento ou aguardando nova tentativa
+                            continue
+                        # Versão nova substitui a que aguardava nova tentativa
+                        self.follow_retry.pop(nota['id'], None)
+                        self.follow_pending[nota['id']] = nota
+                        novas.append(nota)
+                
+                self.follow_read += len(novas)
+                self.stats.total_notas += len(novas)
+                if novas:
+                    yield novas
+                if self.follow_read >= limit:
+                    break
+        finally:
+            batches.close()
+    
+    def follow_watermark(self):
+        """Posição a gravar: logo antes da nota sem desfecho definitivo mais antiga
+        
+        Notas com falha transitória ou interrompidas seguram a watermark: numa
+        nova execução são relidas. Sem pendências, é a última nota lida.
+        """
+        with self.follow_lock:
+            if not self.follow_pending:
+                return self.follow_position
+            updated_at, nota_id = min((nota['updatedAt'], nota['id']) for nota in self.follow_pending.values())
+        # (updatedAt, id - 1): a consulta por posições depois dela começa na própria nota
+        return (updated_at, nota_id - 1)
+    
+    def prune_follow_done(self) -> None:
+        """Esquece desfechos anteriores à janela que o próximo ciclo relê"""
+        start = rewind_watermark(self.follow_position, self.config.FOLLOW_SAFETY_LAG)
+        if start is None:
+            return
+        with self.follow_lock:
+            self.follow_done = {
+                nota_id: updated_at for nota_id, updated_at in self.follow_done.items()
+                if updated_at >= start[0]
+            }
+    
+    def prepare_batch(self, notas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Estágio de preparo: valida as chaves e monta a URL do QR Code (modo scan)
+        
+        No modo direct busca aqui os itens do lote: a consulta de itens corre
+        em paralelo com a leitura da próxima página (o conector tem uma
+        conexão por thread). /api/notas/salvar não valida a chave, então o
+        modo direct também não.
+        """
+        if self.mode == 'direct':
+            return self.attach_itens(notas) if notas else notas
+        
+        if self.config.VALIDATE_CHAVE:
+            # Chave que o scan recusaria (formato/DV): falha local, sem ida ao servidor
+            notas, invalidas = validate_batch(notas)
+            for nota, motivo in invalidas:
+                self.record_result(nota['id'], MigrationStats.FAILURE, motivo, 'validacao')
+        
+        prontas = []
+        for nota in notas:
+            qr_url = self.api_client.build_qr_code_url(nota)
+            if not qr_url:
+                self.record_result(nota['id'], MigrationStats.FAILURE, "Falha ao construir QR Code", 'qr_code')
+                continue
+            nota['qr_url'] = qr_url
+            prontas.append(nota)
+        return prontas
+    
+    def submit_batch(self, notas: List[Dict[str, Any]]) -> None:
+        """Estágio de envio: despacha o lote sem esperar as respostas
+        
+        Cada unidade (nota, bloco do endpoint em lote ou lote assíncrono)
+        ocupa uma vaga do dispatcher; sem vaga, o despacho espera, e a
+        fila de envio enche até segurar o leitor.
+        """
+        if self.dispatch_batch > 1:
+            # Endpoint em lote: uma requisição para até dispatch_batch notas
+            units = [
+                (self.process_chunk, notas[i:i + self.dispatch_batch])
+                for i in range(0, len(notas), self.dispatch_batch)
+            ]
+        else:
+            units = [(self.process_nota, nota) for nota in notas]
+        
+        if self.dispatcher.is_async:
+            # Todas as notas do lote em andamento no event loop, até --workers por vez
+            self.dispatcher.submit(self.process_batch_async, notas)
+            return
+        
+        for func, arg in units:
+            if self.pipeline is not None and self.pipeline.stopped:
+                # Interrompido: o restante do lote fica para o --resume
+                return
+            # Modo concorrente: o próximo lote começa enquanto este termina
+            self.dispatcher.submit(func, arg)
+    
+    def cancel_dispatch(self) -> None:
+        """Ao interromper, workers parados no disjuntor aberto desistem da nota"""
+        if self.api_client.circuit_breaker is not None:
+            self.api_client.circuit_breaker.cancel()
+    
+    def drain_dispatch(self) -> bool:
+        """Aguarda as unidades em andamento; True se há novas tentativas por voltar ao envio"""
+        if self.dispatcher is None:
+            return False
+        self.dispatcher.wait_idle()
+        # Sem unidades em andamento, nenhuma nova tentativa surge por fora
+        return self.retry_scheduler is not None and self.retry_scheduler.pending > 0
+    
+    def resubmit_retries(self, notas: List[Dict[str, Any]]) -> None:
+        """Notas com a nova tentativa vencida voltam à fila de envio do pipeline"""
+        pipeline = self.pipeline
+        if pipeline is None or not pipeline.resubmit(notas):
+            # Interrompido: as notas ficam para o --resume
+            logger.warning(f"⚠️ {len(notas)} novas tentativas descartadas: migração interrompida")
+    
+    async def process_batch_async(self, notas: List[Dict[str, Any]]) -> None:
+        """Despacha o lote como corrotinas no event loop do modo --async"""
+        async def process(nota: Dict[str, Any]) -> None:
+            async with self.dispatcher.semaphore:
+                result = await self.dispatch_nota_async(nota)
+            self.handle_result(nota, result)
+        
+        await asyncio.gather(*(process(nota) for nota in notas))
+    
+    def build_dispatcher(self) -> DispatchStrategy:
+        """Estratégia de envio conforme --async/--workers"""
+        if self.async_dispatch:
+            # Import tardio: httpx só é exigido no modo --async
+            from async_api_client import AsyncAPIClient
+            return AsyncDispatch(self.workers, lambda: AsyncAPIClient(
+                max_concurrency=self.workers,
+                circuit_breaker=self.api_client.circuit_breaker,
+                metrics=self.metrics,
+                config=self.config
+            ))
+        if self.workers > 1:
+            return ThreadPoolDispatch(self.workers)
+        return SerialDispatch()
+    
+    def start_run(self) -> int:
+        """Abre checkpoint, dispatcher, novas tentativas e métricas; devolve o tamanho do lote"""
+        # Checkpoint (não é gravado em dry run para não marcar notas como migradas)
+        if not self.config.DRY_RUN:
+            self.journal = CheckpointJournal(self.checkpoint_file, config=self.config)
+            if self.resume:
+                self.completed_ids = self.journal.completed_ids()
+                logger.info(f"⏭️ Retomando: {len(self.completed_ids)} notas já concluídas serão puladas")
+        
+        if self.preflight:
+            self.load_duplicate_filter()
+        
+        if self.from_archive and not self.archive_dir:
+            raise ValueError("--from-archive requer --archive DIR (ou ARCHIVE_DIR)")
+        if self.archive_dir:
+            self.archive = ScanArchive(self.archive_dir, config=self.config)
+            if self.from_archive:
+                logger.info(f"🗄️ Reimportação: {len(self.archive)} respostas arquivadas; as demais notas passam pelo scan")
+        
+        # Processa em lotes
+        batch_size = self.config.BATCH_SIZE
+        
+        if self.mode == 'direct' and (self.dispatch_batch > 1 or self.async_dispatch):
+            logger.warning("⚠️ Modo direct envia uma nota por requisição com o cliente síncrono")
+            self.dispatch_batch = 1
+            self.async_dispatch = False
+        
+        if self.from_archive and (self.dispatch_batch > 1 or self.async_dispatch):
+            logger.warning("⚠️ --from-archive envia uma nota por requisição com o cliente síncrono")
+            self.dispatch_batch = 1
+            self.async_dispatch = False
+        
+        # Cada unidade de envio leva dispatch_batch notas
+        batch_size = max(batch_size, self.dispatch_batch)
+        
+        if self.async_dispatch and self.dispatch_batch > 1:
+            logger.warning("⚠️ --async ignorado: envio em lote usa o cliente síncrono")
+            self.async_dispatch = False
+        
+        if self.dispatcher is None or self.dispatcher.is_async != self.async_dispatch:
+            self.dispatcher = self.build_dispatcher()
+        
+        if self.dispatcher.is_async:
+            # Lote precisa ter ao menos uma nota por vaga para ocupar o pool
+            batch_size = max(batch_size, self.dispatcher.workers)
+        else:
+            # Lote precisa ter ao menos uma unidade de envio por worker para ocupar o pool
+            batch_size = max(batch_size, self.dispatcher.workers * self.dispatch_batch)
+        self.dispatcher.start()
+        
+        if self.config.MAX_RETRIES > 0:
+            # Backoff fora dos workers: a nota espera na fila de atraso e
+            # volta à fila de envio do pipeline junto com as notas novas
+            self.retry_scheduler = RetryScheduler(
+                resubmit=self.resubmit_retries,
+                max_retries=self.config.MAX_RETRIES,
+                base_delay=self.config.RETRY_DELAY,
+                max_delay=self.config.RETRY_MAX_DELAY
+            )
+            self.retry_scheduler.start()
+        
+        if self.metrics_port or self.metrics_file:
+            self.metrics_exporter = MetricsExporter(
+                self.metrics,
+                host=self.config.METRICS_HOST,
+                port=self.metrics_port,
+                snapshot_file=self.metrics_file,
+                interval=self.config.METRICS_SNAPSHOT_INTERVAL
+            )
+            self.metrics_exporter.start()
+        
+        return batch_size
+    
+    def run_pipeline(self, read: Callable[[], Iterator[List[Dict[str, Any]]]],
+                     batch_size: int, progress_bar: bool = True) -> None:
+        """Leitura → preparo → envio → registro até `read` esgotar e o último desfecho ser gravado"""
+        # Conectada aqui, não no leitor: o preparo também consulta (itens do modo direct)
+        self.source.connect()
+        self.pipeline = MigrationPipeline(
+            read=read,
+            prepare=self.prepare_batch,
+            dispatch=self.submit_batch,
+            drain=self.drain_dispatch,
+            record=self.store_result,
+            queue_size=self.config.PIPELINE_QUEUE_SIZE,
+            result_queue_size=self.config.PIPELINE_QUEUE_SIZE * batch_size,
+            on_stop=self.cancel_dispatch
+        )
+        self.metrics.pipeline = self.pipeline
+        
+        desc = f"Migrando NFC-e [shard {self.shard[0]}/{self.shard[1]}]" if self.shard else "Migrando NFC-e"
+        position = self.shard[0] if self.shard else None
+        # Modo performance: sem barra; uma linha agregada a cada LOG_PROGRESS_INTERVAL
+        performance = self.config.LOG_MODE == 'performance'
+        last_line = [time.monotonic()]
+        
+        try:
+            with tqdm(total=self.stats.total_notas, desc=desc, position=position,
+                      disable=performance or not progress_bar) as pbar:
+                def monitor(depths: Dict[str, int]) -> None:
+                    # Fila cheia na entrada de um estágio aponta o gargalo
+                    if performance:
+                        now = time.monotonic()
+                        if now - last_line[0] >= self.config.LOG_PROGRESS_INTERVAL:
+                            last_line[0] = now
+                            logger.info(
+                                "📊 %s | filas %s",
+                                self.stats.progress_line(),
+                                ' '.join(f"{stage}={depth}" for stage, depth in depths.items())
+                            )
+                        return
+                    pbar.n = self.stats.processed_notas + self.stats.skipped_notas
+                    pbar.set_postfix(depths, refresh=False)
+                    pbar.refresh()
+                
+                self.pipeline.run(monitor=monitor)
+        finally:
+            self.source.disconnect()
+            self.metrics.pipeline = None
+            self.pipeline = None
+        
+        if performance:
+            logger.info("📊 %s", self.stats.progress_line())
+    
+    def finish_run(self, report: bool = True) -> None:
+        """Aguarda o que estiver em andamento, fecha os recursos e mostra o resumo"""
+        breaker = self.api_client.circuit_breaker
+        if breaker is not None and breaker.opened_count:
+            logger.info(f"🔌 Circuito aberto {breaker.opened_count} vez(es) durante a migração")
+        
+        if self.retry_scheduler is not None:
+            if self.retry_scheduler.scheduled:
+                logger.info(f"🔁 Novas tentativas agendadas: {self.retry_scheduler.scheduled}")
+            self.retry_scheduler.close()
+            self.retry_scheduler = None
+        
+        if self.metrics_exporter is not None:
+            # Último snapshot já com o resultado final
+            self.metrics_exporter.close()
+            self.metrics_exporter = None
+        
+        # Aguarda notas em andamento e libera os workers
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+        
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        
+        if self.archive is not None:
+            if self.archive.evicted:
+                logger.info(f"🗑️ Respostas removidas do arquivo pelo limite de tamanho: {self.archive.evicted}")
+            self.archive.close()
+            self.archive = None
+        
+        self.stats.error_sink.close()
+        
+        if report:
+            # Mostra resumo
+            print(self.stats.get_summary())
+            
+            # Salva erros se houver
+            if self.stats.errors:
+                self.stats.save_errors_to_file()
+    
+    def migrate(self, limit: int = None, offset: int = 0, report: bool = True) -> None:
+        """Executa migração completa (report=False deixa o resumo para o coordenador de shards)"""
+        logger.info("🚀 Iniciando migração de NFC-e...")
+        
+        if not self.validate_config():
+            logger.error("❌ Validação falhou. Abortando migração.")
+            return
+        
+        # Com --limit/--offset o total (barra, taxa de sucesso e ETA) é só a fatia pedida
+        remaining = max(0, self.stats.total_notas - offset)
+        self.stats.total_notas = min(limit, remaining) if limit else remaining
+        
+        try:
+            batch_size = self.start_run()
+            self.run_pipeline(lambda: self.read_batches(batch_size, limit, offset), batch_size)
+            logger.info("✅ Migração concluída!")
+            
+        except KeyboardInterrupt:
+            logger.warning("⚠️ Migração interrompida pelo usuário")
+        except Exception as e:
+            # Sobe para o script: a execução termina com erro, não como concluída
+            logger.error(f"💥 Erro durante migração: {e}")
+            raise
+        finally:
+            self.finish_run(report)
+    
+    def follow(self, interval: float = None, cycle_limit: int = None, report: bool = True) -> None:
+        """Modo contínuo (--follow): migra as notas novas ou alteradas enquanto o sistema antigo segue em uso
+        
+        Cada ciclo lê, a partir da posição (updatedAt, id) da última nota
+        lida, até `cycle_limit` notas em ordem crescente e as passa pelo
+        mesmo pipeline da migração completa. Notas com falha transitória
+        (tentativas esgotadas) voltam no ciclo seguinte. A watermark gravada
+        no checkpoint ao fim de cada ciclo nunca passa de uma nota sem
+        desfecho definitivo: interrompida a execução, a próxima relê a partir
+        dela. Notas já migradas (sucesso ou duplicada no checkpoint, também
+        de execuções anteriores) são puladas: o sistema novo responde
+        "duplicada" para uma chave que já tem e não aplica alterações, então
+        o --follow leva só notas novas e as que ainda não foram migradas (ex.:
+        rejeitadas e corrigidas no sistema antigo). Ciclo cheio emenda no
+        próximo; ciclo parcial espera `interval` segundos.
+        """
+        interval = self.config.FOLLOW_INTERVAL if interval is None else interval
+        cycle_limit = cycle_limit or self.config.FOLLOW_CYCLE_LIMIT
+        logger.info("🔁 Iniciando migração contínua de NFC-e (--follow)...")
+        if self.config.SQLITE_ACCESS == 'immutable':
+            # immutable não enxerga gravações feitas depois da abertura
+            logger.warning("⚠️ SQLITE_ACCESS=immutable não vê alterações no --follow: usando ro")
+            self.config.SQLITE_ACCESS = 'ro'
+        
+        if not self.validate_config(follow=True):
+            logger.error("❌ Validação falhou. Abortando migração.")
+            return
+        
+        # Total cresce a cada ciclo com as notas lidas
+        self.stats.total_notas = 0
+        cycles = 0
+        
+        try:
+            batch_size = self.start_run()
+            if self.journal is not None:
+                # Também sem --resume: a janela de segurança relida após um
+                # reinício não reenvia o que já foi migrado
+                self.completed_ids = self.journal.completed_ids()
+            self.follow_pending = {}
+            # Continuação da mesma watermark: falhas anteriores ficam no arquivo
+            self.stats.error_sink.append = True
+            if self.journal is not None:
+                self.follow_position = self.journal.load_watermark()
+            if self.follow_position is not None:
+                logger.info(f"🔁 Watermark: updatedAt={self.follow_position[0]} id={self.follow_position[1]}")
+            else:
+                logger.info("🔁 Sem watermark: o primeiro ciclo começa pela nota mais antiga")
+            
+            while True:
+                self.follow_read = 0
+                self.run_pipeline(
+                    lambda: self.read_batches(batch_size, cycle_limit, follow=True),
+                    batch_size,
+                    progress_bar=False
+                )
+                cycles += 1
+                
+                watermark = self.follow_watermark()
+                if watermark is not None and self.journal is not None:
+                    self.journal.save_watermark(watermark)
+                self.prune_follow_done()
+                if self.follow_read or self.follow_resent:
+                    logger.info(
+                        f"🔁 Ciclo {cycles}: {self.follow_read} notas novas | "
+                        f"{self.follow_resent} reenviadas | {len(self.follow_retry)} para o próximo ciclo | "
+                        f"watermark updatedAt={watermark[0]} id={watermark[1]} | "
+                        f"{self.stats.progress_line()}"
+                    )
+                
+                if self.follow_read < cycle_limit:
+                    # Alcançou o fim da tabela: espera novidades
+                    time.sleep(interval)
+            
+        except KeyboardInterrupt:
+            logger.warning("⚠️ Migração contínua interrompida pelo usuário")
+        except Exception as e:
+            logger.error(f"💥 Erro durante migração contínua: {e}")
+            raise
+        finally:
+            self.finish_run(report)
+    
+    def dry_run(self, limit: int = 5) -> None:
+        """Executa migração em modo de teste (dry run)"""
+        logger.info("🧪 Executando DRY RUN...")
+        
+        # Ativa modo dry run
+        original_dry_run = self.config.DRY_RUN
+        self.config.DRY_RUN = True
+        
+        try:
+            self.migrate(limit=limit)
+        finally:
+            # Restaura configuração original
+            self.config.DRY_RUN = original_dry_run
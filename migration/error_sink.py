@@ -0,0 +1,112 @@
+# migration/error_sink.py
+import csv
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+def classify_error(error_class: Optional[str] = None, http_status: Optional[int] = None) -> str:
+    """Classe gravada da falha: http_NNN com status HTTP, senão a informada por quem falhou
+
+    `error_class` e `http_status` vêm do resultado (campos `error_class` e
+    `status_code` dos clientes, ou a etapa local que recusou a nota), nunca
+    do texto da mensagem.
+    """
+    if http_status is not None:
+        return f"http_{http_status}"
+    return error_class or 'outro'
+
+class ErrorSink:
+    """Falhas gravadas em disco à medida que acontecem
+
+    Cada falha vira uma linha (CSV se o arquivo terminar em .csv, JSON lines
+    nos demais casos) com nota, classe do erro e status HTTP. Em memória ficam
+    só os contadores por classe e as primeiras `sample_size` mensagens, então
+    o consumo não cresce com o número de falhas. O arquivo só é aberto na
+    primeira falha; com `append` (retomadas) as falhas anteriores são mantidas.
+    """
+
+    FIELDS = ('ts', 'nota_id', 'classe', 'http_status', 'mensagem')
+
+    def __init__(self, path: Optional[str], sample_size: int = 20, append: bool = False):
+        self.path = path
+        self.sample_size = sample_size
+        self.append = append
+        self.total = 0
+        self.counts = Counter()
+        self.sample: List[str] = []
+        self.files: List[str] = []  # Arquivos com as falhas (inclui os de shards somados)
+        self._file = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.total
+
+    def record(self, nota_id: Any, message: str, error_class: Optional[str] = None,
+               http_status: Optional[int] = None) -> None:
+        """Registra uma falha (contador, amostra e linha no arquivo)"""
+        classe = classify_error(error_class, http_status)
+        with self._lock:
+            self.total += 1
+            self.counts[classe] += 1
+            if len(self.sample) < self.sample_size:
+                self.sample.append(f"Nota {nota_id}: {message}")
+
+            if self.path is None:
+                return
+            if self._file is None:
+                self._open()
+            row = {
+                'ts': datetime.now().isoformat(timespec='seconds'),
+                'nota_id': nota_id,
+                'classe': classe,
+                'http_status': http_status,
+                'mensagem': message
+            }
+            if self._writer is not None:
+                self._writer.writerow(row)
+            else:
+                self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Retomada: continua o arquivo da execução anterior em vez de apagá-lo
+        appending = self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        # Buffer de linha: cada falha chega ao disco sem esperar o fim da migração
+        self._file = open(self.path, 'a' if appending else 'w', encoding='utf-8', newline='', buffering=1)
+        if self.path.endswith('.csv'):
+            self._writer = csv.DictWriter(self._file, fieldnames=self.FIELDS)
+            if not appending:
+                self._writer.writeheader()
+        self.files.append(self.path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Exporta contadores, amostra e arquivos (ex.: de um processo de shard)"""
+        with self._lock:
+            return {
+                'total': self.total,
+                'counts': dict(self.counts),
+                'sample': list(self.sample),
+                'files': list(self.files)
+            }
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Soma o que outro ErrorSink exportou com to_dict"""
+        with self._lock:
+            self.total += data['total']
+            self.counts.update(data['counts'])
+            room = self.sample_size - len(self.sample)
+            self.sample.extend(data['sample'][:max(0, room)])
+            self.files.extend(data['files'])
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._writer = None
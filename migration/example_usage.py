@@ -15,7 +15,8 @@ def example_basic_migration():
     print("📋 Exemplo 1: Migração Básica")
     print("-" * 40)
     
-    migrator = SQLiteMigrator()
+    # Mesmo motor do migrate.py: pool de workers, novas tentativas e checkpoint
+    migrator = SQLiteMigrator(workers=8)
     
     # Testa configuração
     if migrator.validate_setup():
@@ -32,6 +33,23 @@ def example_dry_run():
     migrator = SQLiteMigrator()
     migrator.migrate(limit=3, dry_run=True)
 
+def example_engine():
+    """Exemplo do motor direto, com origem e envio escolhidos no código"""
+    print("\n📋 Exemplo 4: Motor de Migração")
+    print("-" * 40)
+    
+    from config import Config
+    from engine import MigrationEngine
+    from sources import DatabaseSource
+    from dispatch import ThreadPoolDispatch
+    
+    config = Config()
+    config.set_api_base_url("http://localhost:1425")
+    source = DatabaseSource.sqlite(Path(__file__).parent.parent / "database_old.sqlite", config, read_mode='stream')
+    
+    engine = MigrationEngine(config=config, source=source, dispatcher=ThreadPoolDispatch(8))
+    engine.dry_run(limit=3)
+
 def example_database_info():
     """Exemplo de informações do banco"""
     print("\n📋 Exemplo 3: Informações do Banco")
@@ -71,6 +89,9 @@ def main():
     # Exemplo 3: Migração real (comentado para segurança)
     # example_basic_migration()
     
+    # Exemplo 4: Motor direto (comentado para segurança)
+    # example_engine()
+    
     print("\n" + "=" * 60)
     print("✅ Exemplos concluídos!")
     print("\n💡 Para executar migração real:")
@@ -1,9 +1,15 @@
 # migration/logger.py
 import logging
+import logging.handlers
+import atexit
+import json
+import queue
 import sys
+import threading
 from datetime import datetime
 from colorama import init, Fore, Style
 from config import Config
+from error_sink import ErrorSink
 
 # Inicializa colorama para Windows
 init(autoreset=True)
@@ -19,11 +25,42 @@ class ColoredFormatter(logging.Formatter):
         'CRITICAL': Fore.MAGENTA + Style.BRIGHT
     }
     
-    def format(self, record):
+    def formatMessage(self, record):
+        # Cores só na saída: o registro segue intacto para os demais handlers
         log_color = self.COLORS.get(record.levelname, '')
-        record.levelname = f"{log_color}{record.levelname}{Style.RESET_ALL}"
-        record.msg = f"{log_color}{record.msg}{Style.RESET_ALL}"
-        return super().format(record)
+        values = dict(
+            record.__dict__,
+            levelname=f"{log_color}{record.levelname}{Style.RESET_ALL}",
+            message=f"{log_color}{record.message}{Style.RESET_ALL}"
+        )
+        return self._fmt % values
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro (LOG_MODE=performance)"""
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+# Escritor em segundo plano do modo performance (um por processo)
+_listener = None
+
+def _stop_listener():
+    """Esvazia a fila de logs e encerra a thread escritora"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(_stop_listener)
 
 def setup_logger(name: str = None) -> logging.Logger:
     """Configura sistema de logging"""
@@ -34,9 +71,12 @@ def setup_logger(name: str = None) -> logging.Logger:
     logger.setLevel(getattr(logging, config.LOG_LEVEL.upper()))
     
     # Remove handlers existentes para evitar duplicação
+    _stop_listener()
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
     
+    performance = config.LOG_MODE == 'performance'
+    
     # Handler para console (colorido)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
@@ -50,54 +90,156 @@ def setup_logger(name: str = None) -> logging.Logger:
     # Handler para arquivo
     file_handler = logging.FileHandler(config.LOG_FILE, encoding='utf-8')
     file_handler.setLevel(logging.DEBUG)
-    file_formatter = logging.Formatter(
-        '%(asctime)s | %(levelname)s | %(name)s | %(funcName)s:%(lineno)d | %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    if performance:
+        file_formatter = JsonFormatter()
+    else:
+        file_formatter = logging.Formatter(
+            '%(asctime)s | %(levelname)s | %(name)s | %(funcName)s:%(lineno)d | %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
     file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
+    
+    if not performance:
+        logger.addHandler(file_handler)
+        return logger
+    
+    # Modo performance: quem loga só enfileira; formatação e escrita em
+    # disco/console ficam na thread do QueueListener
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    logger.removeHandler(console_handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
     return logger
 
 class MigrationStats:
-    """Estatísticas da migração"""
+    """Estatísticas da migração (seguras para uso por várias threads)"""
+    
+    # Desfechos possíveis de uma nota (também gravados no checkpoint)
+    SUCCESS = 'sucesso'
+    DUPLICATE = 'duplicada'
+    FAILURE = 'falha'
     
-    def __init__(self):
+    def __init__(self, error_file: str = None, append_errors: bool = False, config: Config = None):
         self.start_time = datetime.now()
         self.total_notas = 0
         self.processed_notas = 0
         self.successful_notas = 0
         self.failed_notas = 0
         self.duplicated_notas = 0
-        self.errors = []
+        self.skipped_notas = 0
+        self._lock = threading.Lock()
+        
+        # Modo performance: só 1 a cada LOG_SAMPLE_EVERY notas vira linha de log
+        config = config or Config()
+        
+        # Falhas vão para o arquivo; em memória ficam só contadores e amostra
+        self.error_sink = ErrorSink(error_file or config.ERROR_FILE, config.ERROR_SAMPLE_SIZE, append=append_errors)
+        self.performance_log = config.LOG_MODE == 'performance'
+        self.sample_every = max(1, config.LOG_SAMPLE_EVERY)
+    
+    @property
+    def errors(self):
+        """Amostra das mensagens de erro (a lista completa está no arquivo de falhas)"""
+        return self.error_sink.sample
     
     def add_success(self, nota_id: int, message: str = ""):
         """Adiciona nota processada com sucesso"""
-        self.successful_notas += 1
-        self.processed_notas += 1
-        self.log_progress(f"✅ Nota {nota_id} processada: {message}")
+        with self._lock:
+            self.successful_notas += 1
+            self.processed_notas += 1
+            processed = self.processed_notas
+        self.log_progress(processed, "✅ Nota %s processada: %s", nota_id, message)
     
-    def add_failure(self, nota_id: int, error: str):
-        """Adiciona nota com falha"""
-        self.failed_notas += 1
-        self.processed_notas += 1
-        self.errors.append(f"Nota {nota_id}: {error}")
-        self.log_progress(f"❌ Nota {nota_id} falhou: {error}")
+    def add_failure(self, nota_id: int, error: str, error_class: str = None, http_status: int = None):
+        """Adiciona nota com falha (classe e status HTTP vêm do resultado)"""
+        with self._lock:
+            self.failed_notas += 1
+            self.processed_notas += 1
+            processed = self.processed_notas
+        self.error_sink.record(nota_id, error, error_class, http_status)
+        self.log_progress(processed, "❌ Nota %s falhou: %s", nota_id, error)
     
     def add_duplicate(self, nota_id: int, message: str = ""):
         """Adiciona nota duplicada"""
-        self.duplicated_notas += 1
-        self.processed_notas += 1
-        self.log_progress(f"⚠️ Nota {nota_id} duplicada: {message}")
+        with self._lock:
+            self.duplicated_notas += 1
+            self.processed_notas += 1
+            processed = self.processed_notas
+        self.log_progress(processed, "⚠️ Nota %s duplicada: %s", nota_id, message)
+    
+    def add_skipped(self, count: int):
+        """Adiciona notas puladas por já constarem no checkpoint"""
+        with self._lock:
+            self.skipped_notas += count
     
-    def log_progress(self, message: str):
-        """Log de progresso"""
-        progress = (self.processed_notas / self.total_notas * 100) if self.total_notas > 0 else 0
-        print(f"[{progress:5.1f}%] {message}")
+    def add_result(self, nota_id: int, status: str, message: str = "",
+                   error_class: str = None, http_status: int = None):
+        """Adiciona o desfecho de uma nota conforme o status"""
+        if status == self.SUCCESS:
+            self.add_success(nota_id, message)
+        elif status == self.DUPLICATE:
+            self.add_duplicate(nota_id, message)
+        else:
+            self.add_failure(nota_id, message, error_class, http_status)
+    
+    def to_dict(self) -> dict:
+        """Exporta as estatísticas (ex.: para devolver de um processo de shard)"""
+        with self._lock:
+            return {
+                'start_time': self.start_time,
+                'total_notas': self.total_notas,
+                'processed_notas': self.processed_notas,
+                'successful_notas': self.successful_notas,
+                'failed_notas': self.failed_notas,
+                'duplicated_notas': self.duplicated_notas,
+                'skipped_notas': self.skipped_notas,
+                'errors': self.error_sink.to_dict()
+            }
+    
+    def merge(self, data: dict):
+        """Soma as estatísticas exportadas por outro processo (to_dict)"""
+        with self._lock:
+            self.start_time = min(self.start_time, data['start_time'])
+            self.total_notas += data['total_notas']
+            self.processed_notas += data['processed_notas']
+            self.successful_notas += data['successful_notas']
+            self.failed_notas += data['failed_notas']
+            self.duplicated_notas += data['duplicated_notas']
+            self.skipped_notas += data['skipped_notas']
+        self.error_sink.merge(data['errors'])
+    
+    def log_progress(self, processed: int, message: str, *args):
+        """Log de progresso por nota (a mensagem só é formatada se for exibida)"""
+        progress = (processed / self.total_notas * 100) if self.total_notas > 0 else 0
+        if self.performance_log:
+            if processed % self.sample_every == 0:
+                notas_logger.info("[%5.1f%%] " + message, progress, *args)
+            return
+        print(f"[{progress:5.1f}%] {message % args}")
+    
+    def progress_line(self) -> str:
+        """Resumo de uma linha do andamento (linha periódica do modo performance)"""
+        with self._lock:
+            processed = self.processed_notas
+            done = processed + self.skipped_notas
+            elapsed = (datetime.now() - self.start_time).total_seconds()
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            progress = (done / self.total_notas * 100) if self.total_notas > 0 else 0
+            return (
+                f"{done}/{self.total_notas} ({progress:.1f}%) | {rate:.1f} notas/s | "
+                f"✅ {self.successful_notas} ❌ {self.failed_notas} "
+                f"⚠️ {self.duplicated_notas} ⏭️ {self.skipped_notas}"
+            )
     
     def get_summary(self) -> str:
         """Retorna resumo da migração"""
         duration = datetime.now() - self.start_time
+        success_rate = (self.successful_notas / self.total_notas * 100) if self.total_notas > 0 else 0
         
         summary = f"""
 {'='*60}
@@ -108,31 +250,31 @@ class MigrationStats:
 ✅ Processadas com sucesso: {self.successful_notas}
 ❌ Falharam: {self.failed_notas}
 ⚠️  Duplicadas: {self.duplicated_notas}
-📊 Taxa de sucesso: {(self.successful_notas / self.total_notas * 100):.1f}%
+⏭️  Puladas (checkpoint): {self.skipped_notas}
+📊 Taxa de sucesso: {success_rate:.1f}%
 {'='*60}
         """
         
-        if self.errors:
-            summary += f"\n❌ ERROS ENCONTRADOS:\n"
-            for error in self.errors[:10]:  # Mostra apenas os primeiros 10 erros
+        sink = self.error_sink
+        if sink.total:
+            summary += f"\n❌ ERROS ENCONTRADOS ({sink.total}):\n"
+            for classe, count in sink.counts.most_common():
+                summary += f"  {classe}: {count}\n"
+            for error in sink.sample[:10]:  # Mostra apenas os primeiros 10 erros
                 summary += f"  • {error}\n"
-            if len(self.errors) > 10:
-                summary += f"  ... e mais {len(self.errors) - 10} erros\n"
+            if sink.total > 10:
+                summary += f"  ... e mais {sink.total - 10} erros\n"
         
         return summary.strip()
     
-    def save_errors_to_file(self, filename: str = "migration_errors.log"):
-        """Salva erros em arquivo separado"""
-        if not self.errors:
-            return
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(f"Erros da migração - {datetime.now()}\n")
-            f.write("="*50 + "\n\n")
-            for error in self.errors:
-                f.write(f"{error}\n")
-        
-        print(f"📝 Erros salvos em: {filename}")
+    def save_errors_to_file(self):
+        """Fecha o arquivo de falhas (gravado durante a migração) e mostra onde está"""
+        self.error_sink.close()
+        for filename in self.error_sink.files:
+            print(f"📝 Erros salvos em: {filename}")
 
 # Logger global
 logger = setup_logger('migration')
+
+# Linhas por nota (amostradas no modo performance); propaga para 'migration'
+notas_logger = logging.getLogger('migration.notas')
@@ -0,0 +1,321 @@
+# migration/metrics.py
+import json
+import os
+import threading
+import time
+import logging
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) dos buckets de latência, como os padrões do Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Janelas (segundos) da vazão móvel
+THROUGHPUT_WINDOWS = (10, 60, 300)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """Histograma de buckets fixos: memória constante, quantis estimados
+
+    Os quantis são interpolados dentro do bucket, como o histogram_quantile
+    do Prometheus. Não tem lock próprio (quem usa é MigrationMetrics).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Último bucket = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    # Acima do último limite não há como interpolar
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'count': self.count, 'mean': self.sum / self.count if self.count else None}
+        for q in QUANTILES:
+            data[f"p{int(q * 100)}"] = self.quantile(q)
+        return data
+
+class MigrationMetrics:
+    """Instrumentação da migração em andamento
+
+    Vazão em janelas móveis, latência por endpoint e status HTTP, novas
+    tentativas, requisições em andamento, latência das leituras do banco e
+    ETA a partir de `stats.total_notas`. Os clientes e o migrador só chamam
+    os métodos de registro; `snapshot()` e `render_prometheus()` montam a
+    visão exposta por MetricsExporter.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.pipeline = None  # Profundidade das filas, quando houver pipeline
+        self.started = time.monotonic()
+        self.requests: Dict[Tuple[str, str], Histogram] = {}
+        self.db_fetch = Histogram()
+        self.db_rows = 0
+        self.retries = 0
+        self.in_flight = 0
+        self._outcomes = deque()  # [segundo, desfechos] do último THROUGHPUT_WINDOWS[-1]
+        self._lock = threading.Lock()
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, url: str, status: Any, seconds: float) -> None:
+        """Fim de uma requisição; `status` é o código HTTP ou o tipo de erro"""
+        key = (urlsplit(url).path, str(status))
+        with self._lock:
+            self.in_flight -= 1
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def observe_fetch(self, seconds: float, rows: int) -> None:
+        """Tempo de uma leitura de lote no banco antigo"""
+        with self._lock:
+            self.db_fetch.observe(seconds)
+            self.db_rows += rows
+
+    def record_outcome(self) -> None:
+        """Uma nota concluída (qualquer desfecho), para a vazão móvel"""
+        second = int(time.monotonic())
+        with self._lock:
+            if self._outcomes and self._outcomes[-1][0] == second:
+                self._outcomes[-1][1] += 1
+                return
+            self._outcomes.append([second, 1])
+            while self._outcomes[0][0] <= second - THROUGHPUT_WINDOWS[-1]:
+                self._outcomes.popleft()
+
+    def _throughput(self, now: float, elapsed: float) -> Dict[str, float]:
+        rates = {}
+        for window in THROUGHPUT_WINDOWS:
+            count = sum(n for second, n in self._outcomes if second > now - window)
+            rates[f"{window}s"] = count / max(1.0, min(window, elapsed))
+        return rates
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado atual das métricas (também é o conteúdo do arquivo JSON)"""
+        stats = self.stats
+        now = time.monotonic()
+        elapsed = now - self.started
+        with self._lock:
+            throughput = self._throughput(now, elapsed)
+            requests = [
+                {'endpoint': endpoint, 'status': status, **histogram.to_dict()}
+                for (endpoint, status), histogram in sorted(self.requests.items())
+            ]
+            db_fetch = {**self.db_fetch.to_dict(), 'rows': self.db_rows}
+            retries = self.retries
+            in_flight = self.in_flight
+
+        done = stats.processed_notas + stats.skipped_notas
+        remaining = max(0, stats.total_notas - done)
+        # ETA pela vazão do último minuto (a média desde o início esconde quedas)
+        rate = throughput['60s'] or (stats.processed_notas / elapsed if elapsed > 0 else 0)
+        eta = remaining / rate if rate > 0 else None
+
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'elapsed_seconds': round(elapsed, 1),
+            'notas': {
+                'total': stats.total_notas,
+                'processadas': stats.processed_notas,
+                'sucesso': stats.successful_notas,
+                'falha': stats.failed_notas,
+                'duplicada': stats.duplicated_notas,
+                'puladas': stats.skipped_notas
+            },
+            'throughput': throughput,
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'in_flight': in_flight,
+            'retries': retries,
+            'requests': requests,
+            'db_fetch': db_fetch,
+            'filas': self.pipeline.queue_depths() if self.pipeline is not None else {}
+        }
+
+    def render_prometheus(self) -> str:
+        """Métricas no formato texto do Prometheus (GET /metrics)"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples) -> None:
+            lines.append(f"# HELP nfce_migration_{name} {help_text}")
+            lines.append(f"# TYPE nfce_migration_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                suffix = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"nfce_migration_{name}{suffix} {_format_value(value)}")
+
+        notas = snapshot['notas']
+        metric('notas_total', 'gauge', 'Notas a migrar', [({}, notas['total'])])
+        metric('notas_processed_total', 'counter', 'Notas concluídas por desfecho', [
+            ({'status': status}, notas[status]) for status in ('sucesso', 'falha', 'duplicada', 'puladas')
+        ])
+        metric('throughput_notas_per_second', 'gauge', 'Vazão em janela móvel', [
+            ({'window': window}, rate) for window, rate in snapshot['throughput'].items()
+        ])
+        metric('eta_seconds', 'gauge', 'Tempo estimado até o fim', [({}, snapshot['eta_seconds'])])
+        metric('requests_in_flight', 'gauge', 'Requisições em andamento', [({}, snapshot['in_flight'])])
+        metric('retries_total', 'counter', 'Novas tentativas', [({}, snapshot['retries'])])
+        metric('queue_depth', 'gauge', 'Itens na entrada de cada estágio do pipeline', [
+            ({'stage': stage}, depth) for stage, depth in snapshot['filas'].items()
+        ])
+
+        with self._lock:
+            requests = sorted(self.requests.items())
+            histograms = [
+                ('request_duration_seconds', 'Latência das requisições à API',
+                 [({'endpoint': endpoint, 'status': status}, histogram) for (endpoint, status), histogram in requests]),
+                ('db_fetch_duration_seconds', 'Latência das leituras de lote no banco antigo',
+                 [({}, self.db_fetch)])
+            ]
+            for name, help_text, series in histograms:
+                lines.append(f"# HELP nfce_migration_{name} {help_text}")
+                lines.append(f"# TYPE nfce_migration_{name} histogram")
+                for labels, histogram in series:
+                    lines.extend(_histogram_lines(f"nfce_migration_{name}", labels, histogram))
+
+        metric('request_duration_quantile_seconds', 'gauge', 'p50/p95/p99 estimados dos buckets', [
+            ({'endpoint': item['endpoint'], 'status': item['status'], 'quantile': str(q)}, item[f"p{int(q * 100)}"])
+            for item in snapshot['requests'] for q in QUANTILES
+        ])
+        return '\n'.join(lines) + '\n'
+
+def _format_value(value) -> str:
+    if value is None:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _histogram_lines(name: str, labels: Dict[str, str], histogram: Histogram):
+    base = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    prefix = f"{base}," if base else ""
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        yield f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}'
+    suffix = f"{{{base}}}" if base else ""
+    yield f"{name}_sum{suffix} {histogram.sum!r}"
+    yield f"{name}_count{suffix} {histogram.count}"
+
+class MetricsExporter:
+    """Expõe MigrationMetrics por HTTP e/ou em um arquivo JSON periódico
+
+    Com `port`, sobe um servidor local com GET /metrics (texto Prometheus) e
+    GET /metrics.json. Com `snapshot_file`, grava o snapshot a cada
+    `interval` segundos (troca atômica: quem lê nunca vê o arquivo pela
+    metade) e uma última vez ao fechar.
+    """
+
+    def __init__(self, metrics: MigrationMetrics, host: str = '127.0.0.1', port: int = 0,
+                 snapshot_file: Optional[str] = None, interval: float = 10.0):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.snapshot_file = snapshot_file
+        self.interval = interval
+        self.server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        if self.port:
+            self.server = ThreadingHTTPServer((self.host, self.port), self._handler())
+            self.server.daemon_threads = True
+            self._spawn(self.server.serve_forever, 'metrics-http')
+            logger.info(f"📈 Métricas em http://{self.host}:{self.port}/metrics")
+
+        if self.snapshot_file:
+            self._spawn(self._snapshot_loop, 'metrics-snapshot')
+            logger.info(f"📈 Snapshot das métricas em {self.snapshot_file} a cada {self.interval:.0f}s")
+
+    def _spawn(self, target, name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Cada scrape não vira linha de log
+                pass
+
+        return Handler
+
+    def write_snapshot(self) -> None:
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.metrics.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.snapshot_file)
+
+    def _snapshot_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.error(f"💥 Erro ao gravar snapshot das métricas: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.snapshot_file:
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.error(f"💥 Erro ao gravar snapshot das métricas: {e}")
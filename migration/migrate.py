@@ -4,152 +4,18 @@
 import sys
 import os
 import argparse
-from typing import List, Dict, Any
-from tqdm import tqdm
 
 # Adiciona o diretório atual ao path para imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config import Config
-from database_connector import DatabaseConnector
-from api_client import APIClient
-from logger import logger, MigrationStats
+from engine import MigrationEngine
+from sharding import parse_shard, run_sharded
+from sqlite_access import build_indexed_copy, plan_warnings
+from logger import logger, setup_logger
 
-class NFCMigration:
-    """Sistema principal de migração de NFC-e"""
-    
-    def __init__(self):
-        self.config = Config()
-        self.db_connector = DatabaseConnector()
-        self.api_client = APIClient()
-        self.stats = MigrationStats()
-        
-    def validate_config(self) -> bool:
-        """Valida configurações antes de iniciar migração"""
-        logger.info("🔍 Validando configurações...")
-        
-        # Testa conexão com banco antigo
-        try:
-            self.db_connector.connect()
-            total_notas = self.db_connector.get_total_notas()
-            logger.info(f"📊 Banco antigo: {total_notas} notas encontradas")
-            self.stats.total_notas = total_notas
-            self.db_connector.disconnect()
-        except Exception as e:
-            logger.error(f"❌ Erro ao conectar no banco antigo: {e}")
-            return False
-        
-        # Testa conexão com API
-        if not self.api_client.test_connection():
-            logger.error("❌ Erro ao conectar com API do sistema novo")
-            return False
-        
-        # Mostra status da API
-        api_status = self.api_client.get_api_status()
-        logger.info(f"🌐 API Status: {api_status}")
-        
-        return True
-    
-    def process_batch(self, notas: List[Dict[str, Any]]) -> None:
-        """Processa um lote de notas"""
-        for nota in notas:
-            try:
-                # Constrói URL do QR Code
-                qr_url = self.api_client.build_qr_code_url(nota)
-                if not qr_url:
-                    self.stats.add_failure(nota['id'], "Falha ao construir QR Code")
-                    continue
-                
-                # Processa via API
-                result = self.api_client.process_nfce(qr_url)
-                
-                if result.get('success'):
-                    if result.get('salva', {}).get('status') == 'duplicada':
-                        self.stats.add_duplicate(
-                            nota['id'], 
-                            result.get('salva', {}).get('message', '')
-                        )
-                    else:
-                        self.stats.add_success(
-                            nota['id'],
-                            result.get('message', 'Processada com sucesso')
-                        )
-                else:
-                    self.stats.add_failure(
-                        nota['id'], 
-                        result.get('error', 'Erro desconhecido')
-                    )
-                    
-            except Exception as e:
-                logger.error(f"💥 Erro ao processar nota {nota['id']}: {e}")
-                self.stats.add_failure(nota['id'], str(e))
-    
-    def migrate(self, limit: int = None, offset: int = 0) -> None:
-        """Executa migração completa"""
-        logger.info("🚀 Iniciando migração de NFC-e...")
-        
-        if not self.validate_config():
-            logger.error("❌ Validação falhou. Abortando migração.")
-            return
-        
-        try:
-            # Conecta no banco antigo
-            self.db_connector.connect()
-            
-            # Processa em lotes
-            batch_size = self.config.BATCH_SIZE
-            processed = 0
-            
-            with tqdm(total=self.stats.total_notas, desc="Migrando NFC-e") as pbar:
-                while True:
-                    # Busca próximo lote
-                    notas = self.db_connector.get_notas_fiscais(
-                        limit=batch_size, 
-                        offset=offset + processed
-                    )
-                    
-                    if not notas:
-                        break
-                    
-                    # Processa lote
-                    self.process_batch(notas)
-                    processed += len(notas)
-                    pbar.update(len(notas))
-                    
-                    # Para se atingiu o limite
-                    if limit and processed >= limit:
-                        break
-            
-            logger.info("✅ Migração concluída!")
-            
-        except KeyboardInterrupt:
-            logger.warning("⚠️ Migração interrompida pelo usuário")
-        except Exception as e:
-            logger.error(f"💥 Erro durante migração: {e}")
-        finally:
-            # Fecha conexões
-            self.db_connector.disconnect()
-            
-            # Mostra resumo
-            print(self.stats.get_summary())
-            
-            # Salva erros se houver
-            if self.stats.errors:
-                self.stats.save_errors_to_file()
-    
-    def dry_run(self, limit: int = 5) -> None:
-        """Executa migração em modo de teste (dry run)"""
-        logger.info("🧪 Executando DRY RUN...")
-        
-        # Ativa modo dry run
-        original_dry_run = self.config.DRY_RUN
-        self.config.DRY_RUN = True
-        
-        try:
-            self.migrate(limit=limit)
-        finally:
-            # Restaura configuração original
-            self.config.DRY_RUN = original_dry_run
+# Nome antigo do motor, mantido para scripts que o importam daqui
+NFCMigration = MigrationEngine
 
 def main():
     """Função principal"""
@@ -170,6 +36,107 @@ def main():
         help='Offset para começar processamento (padrão: 0)'
     )
     
+    parser.add_argument(
+        '--read-mode', 
+        choices=['keyset', 'offset', 'stream'],
+        help='Leitura do banco antigo: keyset (cursor em createdAt/id), offset ou stream (cursor de servidor) (padrão: READ_MODE ou keyset)'
+    )
+    
+    parser.add_argument(
+        '--prefetch', 
+        type=int,
+        help='Linhas trazidas por fetch no modo stream (padrão: STREAM_PREFETCH ou 500)'
+    )
+    
+    parser.add_argument(
+        '--mode', 
+        choices=['scan', 'direct'],
+        help='scan: envia o QR Code e o servidor busca a página da SEFAZ; direct: envia nota + itens do banco antigo para /api/notas/salvar (padrão: MIGRATION_MODE ou scan)'
+    )
+    
+    parser.add_argument(
+        '--workers', 
+        type=int,
+        help='Número de notas processadas em paralelo (padrão: MIGRATION_WORKERS ou 1)'
+    )
+    
+    parser.add_argument(
+        '--dispatch-batch', 
+        type=int,
+        help='QR Codes por requisição em /api/scan/process-batch (padrão: DISPATCH_BATCH_SIZE ou 1 = /process)'
+    )
+    
+    parser.add_argument(
+        '--async', 
+        dest='async_dispatch',
+        action='store_true',
+        default=None,
+        help='Usa o cliente assíncrono (httpx): --workers vira o número de requisições simultâneas'
+    )
+    
+    parser.add_argument(
+        '--resume', 
+        action='store_true',
+        help='Pula notas já concluídas segundo o checkpoint (sem requisição HTTP)'
+    )
+    
+    parser.add_argument(
+        '--checkpoint', 
+        type=str,
+        help='Arquivo de checkpoint (padrão: CHECKPOINT_FILE)'
+    )
+    
+    parser.add_argument(
+        '--preflight', 
+        action='store_true',
+        default=None,
+        help='Baixa as chaves já existentes no sistema novo e não reenvia essas notas'
+    )
+    
+    parser.add_argument(
+        '--archive', 
+        type=str,
+        metavar='DIR',
+        help='Guarda as respostas do scan (emitente e itens) comprimidas neste diretório, por chave (padrão: ARCHIVE_DIR ou desligado)'
+    )
+    
+    parser.add_argument(
+        '--from-archive', 
+        action='store_true',
+        help='Reimporta pelo /api/notas/salvar as notas que já estão no --archive, sem novo scrape; as demais passam pelo scan'
+    )
+    
+    parser.add_argument(
+        '--snapshot', 
+        type=str,
+        metavar='ARQUIVO',
+        help='Lê as notas de um snapshot exportado (python snapshot.py export) em vez do banco antigo (padrão: SNAPSHOT_FILE)'
+    )
+    
+    parser.add_argument(
+        '--follow', 
+        action='store_true',
+        help='Modo contínuo: migra e continua consultando notas novas (updatedAt), com a watermark gravada no checkpoint; notas já migradas são puladas e alterações nelas não são aplicadas'
+    )
+    
+    parser.add_argument(
+        '--follow-interval', 
+        type=float,
+        help='Segundos entre consultas quando não há novidades no --follow (padrão: FOLLOW_INTERVAL ou 30)'
+    )
+    
+    parser.add_argument(
+        '--sqlite-index', 
+        action='store_true',
+        help='Lê de uma cópia de trabalho do sqlite com os índices da migração (criada uma vez em SQLITE_WORKING_COPY ou <arquivo>.indexed.sqlite; o original não é alterado)'
+    )
+    
+    parser.add_argument(
+        '--explain', 
+        action='store_true',
+        help='Mostra o plano (EXPLAIN QUERY PLAN) das consultas de leitura no sqlite e sai; código 1 se alguma ordena em B-tree temporária'
+    )
+    
     parser.add_argument(
         '--dry-run', 
         action='store_true',
@@ -182,6 +149,30 @@ def main():
         help='Apenas testa conexões e sai'
     )
     
+    parser.add_argument(
+        '--shard', 
+        type=str,
+        help='Migra só a fatia i de N (id %% N == i). Use i/N em cada processo/máquina, ou a-b/N para o coordenador local subir um processo por shard'
+    )
+    
+    parser.add_argument(
+        '--log-mode', 
+        choices=['default', 'performance'],
+        help='performance: logs em fila com escrita em segundo plano, JSON lines no LOG_FILE, 1 linha a cada LOG_SAMPLE_EVERY notas e progresso agregado periódico (padrão: LOG_MODE ou default)'
+    )
+    
+    parser.add_argument(
+        '--metrics-port', 
+        type=int,
+        help='Expõe as métricas em http://METRICS_HOST:PORTA/metrics (Prometheus) e /metrics.json; com --shard, cada shard usa PORTA + índice (padrão: METRICS_PORT ou 0 = desligado)'
+    )
+    
+    parser.add_argument(
+        '--metrics-file', 
+        type=str,
+        help='Grava o snapshot JSON das métricas neste arquivo a cada METRICS_SNAPSHOT_INTERVAL segundos (padrão: METRICS_SNAPSHOT_FILE)'
+    )
+    
     parser.add_argument(
         '--config', 
         type=str,
@@ -194,8 +185,72 @@ def main():
     if args.config:
         os.environ['DOTENV_PATH'] = args.config
     
+    if args.log_mode:
+        # Reconfigura o logger (e o modo dos processos de shard, via ambiente)
+        os.environ['LOG_MODE'] = args.log_mode
+        Config.LOG_MODE = args.log_mode
+        setup_logger('migration')
+    
+    migration_options = dict(
+        workers=args.workers,
+        read_mode=args.read_mode,
+        prefetch=args.prefetch,
+        resume=args.resume,
+        checkpoint_file=args.checkpoint,
+        preflight=args.preflight,
+        async_dispatch=args.async_dispatch,
+        dispatch_batch=args.dispatch_batch,
+        mode=args.mode,
+        metrics_port=args.metrics_port,
+        metrics_file=args.metrics_file,
+        archive_dir=args.archive,
+        from_archive=args.from_archive,
+        snapshot=args.snapshot
+    )
+    
+    if args.from_archive and not (args.archive or Config.ARCHIVE_DIR):
+        parser.error("--from-archive requer --archive DIR (ou ARCHIVE_DIR)")
+    
+    if args.follow and (args.snapshot or Config.SNAPSHOT_FILE):
+        parser.error("--follow precisa do banco antigo: não combina com --snapshot")
+    
+    if args.sqlite_index:
+        if Config.OLD_DB_TYPE != 'sqlite':
+            parser.error("--sqlite-index só vale para OLD_DB_TYPE=sqlite")
+        if args.follow:
+            # A cópia é um retrato: não recebe as alterações que o --follow procura
+            parser.error("--sqlite-index não combina com --follow: crie os índices no próprio banco")
+        # Antes dos shards: os processos herdam o caminho pelo ambiente
+        working_copy = build_indexed_copy(Config.OLD_DB_FILE, Config.SQLITE_WORKING_COPY or None)
+        os.environ['OLD_DB_FILE'] = working_copy
+        Config.OLD_DB_FILE = working_copy
+    
+    shard = None
+    if args.shard:
+        try:
+            shard_indices, shard_count = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        
+        if len(shard_indices) > 1 and args.follow:
+            parser.error("--follow roda um shard por processo: use --shard i/N em cada um")
+        
+        if len(shard_indices) > 1 and not (args.test_connection or args.dry_run or args.explain):
+            # Coordenador local: um processo por shard, resumo único no fim
+            stats = run_sharded(shard_indices, shard_count, {
+                'migration': migration_options,
+                'limit': args.limit,
+                'offset': args.offset
+            })
+            print(stats.get_summary())
+            if stats.errors:
+                stats.save_errors_to_file()
+            return
+        
+        shard = (shard_indices[0], shard_count)
+    
     # Cria instância do migrador
-    migrator = NFCMigration()
+    migrator = MigrationEngine(shard=shard, **migration_options)
     
     try:
         if args.test_connection:
@@ -207,10 +262,35 @@ def main():
                 print("❌ Alguma conexão falhou!")
                 sys.exit(1)
         
+        elif args.explain:
+            # Plano das consultas de leitura, sem migrar nada
+            migrator.source.connect()
+            try:
+                plans = migrator.source.explain()
+            finally:
+                migrator.source.disconnect()
+            if not plans:
+                print(f"ℹ️ --explain só está disponível para sqlite (OLD_DB_TYPE={Config.OLD_DB_TYPE})")
+                sys.exit(0)
+            for name, steps in plans.items():
+                print(f"📋 {name}")
+                for step in steps:
+                    print(f"    {step}")
+            warnings = plan_warnings(plans)
+            if warnings:
+                print(f"⚠️ Ordenação em B-tree temporária em: {', '.join(warnings)} (use --sqlite-index ou crie os índices)")
+                sys.exit(1)
+            print("✅ Nenhuma consulta ordena em B-tree temporária")
+            sys.exit(0)
+        
         elif args.dry_run:
             # Modo dry run
             migrator.dry_run(limit=args.limit or 5)
         
+        elif args.follow:
+            # Migração contínua, até Ctrl+C
+            migrator.follow(interval=args.follow_interval)
+        
         else:
             # Migração normal
             migrator.migrate(limit=args.limit, offset=args.offset)
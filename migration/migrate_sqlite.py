@@ -4,33 +4,54 @@
 
 import sys
 import os
-import sqlite3
-import requests
-import time
 from pathlib import Path
-from tqdm import tqdm
 from colorama import init, Fore, Style
 
+# Adiciona o diretório atual ao path para imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from engine import MigrationEngine
+from sources import DatabaseSource
+
 # Inicializa colorama
 init(autoreset=True)
 
 class SQLiteMigrator:
-    """Migrador simplificado para SQLite"""
+    """Migrador simplificado para SQLite
+    
+    Só a interface de linha de comando: leitura, envio, novas tentativas,
+    checkpoint e estatísticas são do MigrationEngine, o mesmo do migrate.py,
+    com o database_old.sqlite como origem.
+    """
     
-    def __init__(self):
-        # Caminhos
-        self.old_db_path = Path(__file__).parent.parent / "database_old.sqlite"
-        #self.api_url = "https://teste.neurelix.com.br/api/scan/process"
-        self.api_url = "http://localhost:1425/api/scan/process"
+    def __init__(self, prefetch: int = 500, resume: bool = False, checkpoint_file: str = None,
+                 rate: float = None, db_path: str = None, api_base_url: str = None,
+                 workers: int = None, async_dispatch: bool = None):
+        # Caminhos (db_path/api_base_url permitem apontar para o banco e o servidor do benchmark)
+        self.old_db_path = Path(db_path) if db_path else Path(__file__).parent.parent / "database_old.sqlite"
+        #self.api_base_url = "https://teste.neurelix.com.br"
+        self.api_base_url = (api_base_url or "http://localhost:1425").rstrip('/')
+        self.api_url = f"{self.api_base_url}/api/scan/process"
         
-        # Estatísticas
-        self.stats = {
-            'total': 0,
-            'success': 0,
-            'failed': 0,
-            'duplicated': 0,
-            'errors': []
-        }
+        # Configuração própria desta execução, compartilhada pelo motor e pelos clientes
+        self.config = Config()
+        self.config.set_api_base_url(self.api_base_url)
+        if rate is not None:
+            # Teto de requisições/s (0 = sem limite; o ritmo é o da própria API)
+            self.config.RATE_LIMIT = rate
+        
+        # Cursor único no sqlite, `prefetch` linhas lidas por vez (memória constante)
+        source = DatabaseSource.sqlite(self.old_db_path, self.config, read_mode='stream', prefetch=prefetch)
+        self.engine = MigrationEngine(
+            workers=workers,
+            resume=resume,
+            checkpoint_file=checkpoint_file,
+            async_dispatch=async_dispatch,
+            config=self.config,
+            source=source
+        )
+        self.stats = self.engine.stats
     
     def print_header(self):
         """Imprime cabeçalho do programa"""
@@ -39,158 +60,47 @@ class SQLiteMigrator:
         print(f"{Fore.CYAN}{'='*60}")
         print(f"{Fore.WHITE}📁 Banco antigo: {self.old_db_path}")
         print(f"{Fore.WHITE}🌐 API destino: {self.api_url}")
+        print(f"{Fore.WHITE}⚡ Workers: {self.engine.workers}{' (assíncrono)' if self.engine.async_dispatch else ''}")
         print(f"{Fore.CYAN}{'='*60}\n")
     
     def validate_setup(self) -> bool:
         """Valida configuração antes de iniciar"""
         print(f"{Fore.YELLOW}🔍 Validando configuração...")
         
-        # Verifica se banco antigo existe
+        # Verifica se banco antigo existe (o sqlite criaria um arquivo vazio)
         if not self.old_db_path.exists():
             print(f"{Fore.RED}❌ Banco antigo não encontrado: {self.old_db_path}")
             return False
         
-        # Testa conexão com API
-        try:
-            #response = requests.get("https://teste.neurelix.com.br/api/status", timeout=5)
-            response = requests.get("http://localhost:1425/api/status", timeout=5)
-            if response.status_code == 200:
-                print(f"{Fore.GREEN}✅ API do sistema novo está funcionando")
-            else:
-                print(f"{Fore.RED}❌ API retornou status {response.status_code}")
-                return False
-        except Exception as e:
-            print(f"{Fore.RED}❌ Erro ao conectar com API: {e}")
+        # Banco e API, pelas mesmas verificações do migrate.py
+        if not self.engine.validate_config():
+            print(f"{Fore.RED}❌ Erro ao acessar o banco antigo ou a API")
             return False
         
-        # Conta registros no banco antigo
-        try:
-            conn = sqlite3.connect(self.old_db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT COUNT(*) FROM notas_fiscais
-                WHERE chave IS NOT NULL 
-                    AND versao IS NOT NULL 
-                    AND ambiente IS NOT NULL 
-                    AND cIdToken IS NOT NULL 
-                    AND vSig IS NOT NULL
-            """)
-            
-            self.stats['total'] = cursor.fetchone()[0]
-            conn.close()
-            
-            print(f"{Fore.GREEN}✅ Banco antigo: {self.stats['total']} notas válidas encontradas")
-            return True
-            
-        except Exception as e:
-            print(f"{Fore.RED}❌ Erro ao acessar banco antigo: {e}")
-            return False
-    
-    def build_qr_url(self, nota) -> str:
-        """Constrói URL do QR Code baseada na nota"""
-        chave = str(nota['chave']).strip()
-        versao = str(nota['versao']).strip()
-        ambiente = str(nota['ambiente']).strip()
-        cIdToken = str(nota['cIdToken']).strip()
-        vSig = str(nota['vSig']).strip()
-        
-        return f"https://www.sefaz.mt.gov.br/nfce/consultanfce?p={chave}|{versao}|{ambiente}|{cIdToken}|{vSig}"
-    
-    def process_nota(self, nota) -> bool:
-        """Processa uma nota individual"""
-        try:
-            # Constrói QR Code
-            qr_url = self.build_qr_url(nota)
-            
-            # Envia para API
-            payload = {"qrCode": qr_url}
-            response = requests.post(self.api_url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                if result.get('success'):
-                    salva = result.get('salva', {})
-                    if salva.get('status') == 'duplicada':
-                        self.stats['duplicated'] += 1
-                        print(f"{Fore.YELLOW}⚠️  Nota {nota['id']} duplicada")
-                        return True
-                    else:
-                        self.stats['success'] += 1
-                        print(f"{Fore.GREEN}✅ Nota {nota['id']} processada")
-                        return True
-                else:
-                    error = result.get('error', 'Erro desconhecido')
-                    self.stats['failed'] += 1
-                    self.stats['errors'].append(f"Nota {nota['id']}: {error}")
-                    print(f"{Fore.RED}❌ Nota {nota['id']} falhou: {error}")
-                    return False
-            else:
-                error = f"HTTP {response.status_code}: {response.text}"
-                self.stats['failed'] += 1
-                self.stats['errors'].append(f"Nota {nota['id']}: {error}")
-                print(f"{Fore.RED}❌ Nota {nota['id']} falhou: {error}")
-                return False
-                
-        except Exception as e:
-            error = str(e)
-            self.stats['failed'] += 1
-            self.stats['errors'].append(f"Nota {nota['id']}: {error}")
-            print(f"{Fore.RED}❌ Nota {nota['id']} erro: {error}")
-            return False
+        print(f"{Fore.GREEN}✅ API do sistema novo está funcionando")
+        print(f"{Fore.GREEN}✅ Banco antigo: {self.stats.total_notas} notas válidas encontradas")
+        return True
     
     def migrate(self, limit=None, dry_run=False):
         """Executa migração"""
         self.print_header()
         
-        if not self.validate_setup():
-            print(f"{Fore.RED}❌ Validação falhou. Abortando.")
+        if not self.old_db_path.exists():
+            print(f"{Fore.RED}❌ Banco antigo não encontrado: {self.old_db_path}. Abortando.")
             return
         
         if dry_run:
+            # Só confere banco e API, como sempre foi: nada é lido nem enviado
+            if not self.validate_setup():
+                print(f"{Fore.RED}❌ Validação falhou. Abortando.")
+                return
             print(f"{Fore.YELLOW}🧪 MODO DRY RUN - Nenhuma nota será processada realmente")
             return
         
         print(f"{Fore.GREEN}🚀 Iniciando migração...\n")
-        
         try:
-            # Conecta no banco antigo
-            conn = sqlite3.connect(self.old_db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Query para buscar notas
-            query = """
-            SELECT 
-                id, chave, versao, ambiente, cIdToken, vSig,
-                cnpjEmitente, nomeEmitente, ieEmitente, createdAt
-            FROM notas_fiscais
-            WHERE chave IS NOT NULL 
-                AND versao IS NOT NULL 
-                AND ambiente IS NOT NULL 
-                AND cIdToken IS NOT NULL 
-                AND vSig IS NOT NULL
-            ORDER BY createdAt DESC
-            """
-            
-            if limit:
-                query += f" LIMIT {limit}"
-            
-            cursor.execute(query)
-            notas = cursor.fetchall()
-            
-            # Processa com barra de progresso
-            with tqdm(total=len(notas), desc="Migrando", unit="nota") as pbar:
-                for nota in notas:
-                    self.process_nota(dict(nota))
-                    pbar.update(1)
-                    
-                    # Pequena pausa entre requisições
-                    time.sleep(0.5)
-            
-            conn.close()
-            
+            # O motor valida banco e API antes de começar
+            self.engine.migrate(limit=limit, report=False)
         except KeyboardInterrupt:
             print(f"\n{Fore.YELLOW}⚠️ Migração interrompida pelo usuário")
         except Exception as e:
@@ -203,21 +113,27 @@ class SQLiteMigrator:
         print(f"\n{Fore.CYAN}{'='*60}")
         print(f"{Fore.CYAN}📊 RESUMO DA MIGRAÇÃO")
         print(f"{Fore.CYAN}{'='*60}")
-        print(f"{Fore.WHITE}📈 Total de notas: {self.stats['total']}")
-        print(f"{Fore.GREEN}✅ Processadas com sucesso: {self.stats['success']}")
-        print(f"{Fore.RED}❌ Falharam: {self.stats['failed']}")
-        print(f"{Fore.YELLOW}⚠️  Duplicadas: {self.stats['duplicated']}")
+        print(f"{Fore.WHITE}📈 Total de notas: {self.stats.total_notas}")
+        print(f"{Fore.GREEN}✅ Processadas com sucesso: {self.stats.successful_notas}")
+        print(f"{Fore.RED}❌ Falharam: {self.stats.failed_notas}")
+        print(f"{Fore.YELLOW}⚠️  Duplicadas: {self.stats.duplicated_notas}")
+        print(f"{Fore.WHITE}⏭️  Puladas (checkpoint): {self.stats.skipped_notas}")
         
-        if self.stats['total'] > 0:
-            success_rate = (self.stats['success'] / self.stats['total']) * 100
+        if self.stats.total_notas > 0:
+            success_rate = (self.stats.successful_notas / self.stats.total_notas) * 100
             print(f"{Fore.CYAN}📊 Taxa de sucesso: {success_rate:.1f}%")
         
-        if self.stats['errors']:
+        sink = self.stats.error_sink
+        if sink.total:
+            print(f"\n{Fore.RED}❌ ERROS POR CLASSE:")
+            for classe, count in sink.counts.most_common():
+                print(f"{Fore.RED}  {classe}: {count}")
             print(f"\n{Fore.RED}❌ PRIMEIROS ERROS:")
-            for error in self.stats['errors'][:5]:
+            for error in sink.sample[:5]:
                 print(f"{Fore.RED}  • {error}")
-            if len(self.stats['errors']) > 5:
-                print(f"{Fore.RED}  ... e mais {len(self.stats['errors']) - 5} erros")
+            if sink.total > 5:
+                print(f"{Fore.RED}  ... e mais {sink.total - 5} erros")
+            print(f"{Fore.WHITE}📝 Erros salvos em: {sink.path}")
         
         print(f"{Fore.CYAN}{'='*60}")
 
@@ -229,10 +145,28 @@ def main():
     parser.add_argument('--limit', type=int, help='Limite de notas para processar')
     parser.add_argument('--dry-run', action='store_true', help='Modo de teste')
     parser.add_argument('--test', action='store_true', help='Apenas testa conexões')
+    parser.add_argument('--prefetch', type=int, default=500, help='Notas lidas do banco por vez')
+    parser.add_argument('--resume', action='store_true', help='Pula notas já concluídas segundo o checkpoint')
+    parser.add_argument('--checkpoint', type=str, help='Arquivo de checkpoint')
+    parser.add_argument('--rate', type=float, help='Máximo de requisições por segundo (0 = sem limite)')
+    parser.add_argument('--db', type=str, help='Banco antigo (padrão: ../database_old.sqlite)')
+    parser.add_argument('--api-url', type=str, help='URL base do sistema novo (padrão: http://localhost:1425)')
+    parser.add_argument('--workers', type=int, help='Requisições simultâneas (padrão: MIGRATION_WORKERS)')
+    parser.add_argument('--async', dest='async_dispatch', action='store_true', default=None,
+                        help='Envio assíncrono (httpx) em vez do pool de threads')
     
     args = parser.parse_args()
     
-    migrator = SQLiteMigrator()
+    migrator = SQLiteMigrator(
+        prefetch=args.prefetch,
+        resume=args.resume,
+        checkpoint_file=args.checkpoint,
+        rate=args.rate,
+        db_path=args.db,
+        api_base_url=args.api_url,
+        workers=args.workers,
+        async_dispatch=args.async_dispatch
+    )
     
     if args.test:
         migrator.print_header()
@@ -0,0 +1,201 @@
+# migration/pipeline.py
+import queue
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marca de fim de fluxo passada de um estágio para o seguinte
+_DONE = object()
+
+class MigrationPipeline:
+    """Estágios da migração em threads próprias, ligados por filas limitadas
+
+    leitura → preparo → envio → registro. Enquanto as requisições de um lote
+    estão em andamento, o leitor já busca os próximos no banco. Novas
+    tentativas voltam à fila de envio por `resubmit` e são despachadas pela
+    mesma thread de envio que as notas novas. Cada fila tem
+    tamanho máximo: um estágio lento segura os anteriores (backpressure) em
+    vez de acumular notas em memória. `queue_depths()` mostra onde o trabalho
+    se acumula; fila cheia na entrada de um estágio indica que ele é o gargalo.
+    """
+
+    def __init__(self, read: Callable[[], Iterator[List[Dict[str, Any]]]],
+                 prepare: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+                 dispatch: Callable[[List[Dict[str, Any]]], None],
+                 drain: Callable[[], bool],
+                 record: Callable[..., None],
+                 queue_size: int = 4, result_queue_size: int = 1000,
+                 on_stop: Optional[Callable[[], None]] = None):
+        self.read = read          # Gerador de lotes (roda na thread do leitor)
+        self.prepare = prepare    # Lote → notas prontas para envio
+        self.dispatch = dispatch  # Despacha o lote sem esperar as respostas
+        self.drain = drain        # Aguarda os envios em andamento; True se ainda há notas por voltar
+        self.record = record      # Grava um desfecho (nota_id, status, mensagem)
+        self.on_stop = on_stop    # Desbloqueia esperas fora do pipeline ao interromper
+
+        self.read_queue = queue.Queue(maxsize=max(1, queue_size))
+        self.dispatch_queue = queue.Queue(maxsize=max(1, queue_size))
+        self.result_queue = queue.Queue(maxsize=max(1, result_queue_size))
+
+        self.stop_event = threading.Event()
+        self.error = None
+        self.threads = []
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Itens aguardando na entrada de cada estágio"""
+        return {
+            'preparo': self.read_queue.qsize(),
+            'envio': self.dispatch_queue.qsize(),
+            'registro': self.result_queue.qsize()
+        }
+
+    def resubmit(self, notas: List[Dict[str, Any]]) -> bool:
+        """Devolve notas já preparadas à fila de envio (novas tentativas)
+
+        Bloqueia enquanto a fila estiver cheia; False se o pipeline foi
+        interrompido e as notas não entraram.
+        """
+        return self._put(self.dispatch_queue, notas)
+
+    def put_result(self, *item) -> None:
+        """Entrega um desfecho ao estágio de registro (chamado pelos workers)"""
+        if not self._put(self.result_queue, item):
+            # Pipeline parado: grava direto para não perder o desfecho
+            self.record(*item)
+
+    def _put(self, target: queue.Queue, item) -> bool:
+        """put bloqueante que desiste se o pipeline for interrompido"""
+        while not self.stop_event.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue):
+        """get bloqueante que devolve _DONE se o pipeline for interrompido"""
+        while True:
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return _DONE
+
+    def _reader(self) -> None:
+        batches = self.read()
+        try:
+            for notas in batches:
+                if not self._put(self.read_queue, notas):
+                    break
+        finally:
+            # Fecha o gerador aqui: a conexão do banco pertence a esta thread
+            batches.close()
+            self._put(self.read_queue, _DONE)
+
+    def _preparer(self) -> None:
+        try:
+            while True:
+                notas = self._get(self.read_queue)
+                if notas is _DONE:
+                    break
+                notas = self.prepare(notas)
+                if notas and not self._put(self.dispatch_queue, notas):
+                    break
+        finally:
+            self._put(self.dispatch_queue, _DONE)
+
+    def _dispatcher(self) -> None:
+        try:
+            while True:
+                notas = self._get(self.dispatch_queue)
+                if notas is _DONE:
+                    break
+                self.dispatch(notas)
+            # Leitura esgotada: novas tentativas ainda voltam por esta fila
+            while self.drain() or not self.dispatch_queue.empty():
+                notas = self._get(self.dispatch_queue)
+                if notas is _DONE:
+                    break
+                self.dispatch(notas)
+        finally:
+            # O registro só termina depois da última resposta
+            self.drain()
+            self._put(self.result_queue, _DONE)
+
+    def _recorder(self) -> None:
+        while True:
+            item = self._get(self.result_queue)
+            if item is _DONE:
+                break
+            self.record(*item)
+
+    def _run_stage(self, target: Callable[[], None]) -> None:
+        try:
+            target()
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+            logger.error(f"💥 Estágio {threading.current_thread().name} falhou: {e}")
+            self.stop()
+
+    def _drain_results(self) -> None:
+        """Grava desfechos que ficaram na fila após uma interrupção"""
+        while True:
+            try:
+                item = self.result_queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _DONE:
+                self.record(*item)
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    def stop(self) -> None:
+        """Interrompe os estágios; envios já em andamento são concluídos"""
+        self.stop_event.set()
+        if self.on_stop is not None:
+            self.on_stop()
+
+    def run(self, monitor: Optional[Callable[[Dict[str, int]], None]] = None,
+            interval: float = 0.5) -> None:
+        """Executa até o leitor esgotar e o último desfecho ser gravado
+
+        `monitor` é chamado na thread atual a cada `interval` segundos com a
+        profundidade das filas. Erros de qualquer estágio são relançados aqui.
+        """
+        stages = [
+            ('leitor', self._reader),
+            ('preparo', self._preparer),
+            ('envio', self._dispatcher),
+            ('registro', self._recorder)
+        ]
+        for name, target in stages:
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(target,),
+                name=f'pipeline-{name}',
+                daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+        try:
+            while any(thread.is_alive() for thread in self.threads):
+                self.threads[-1].join(interval)
+                if monitor is not None:
+                    monitor(self.queue_depths())
+        except BaseException:
+            self.stop()
+            for thread in self.threads:
+                thread.join()
+            raise
+        finally:
+            self._drain_results()
+
+        if self.error is not None:
+            raise self.error
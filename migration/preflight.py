@@ -0,0 +1,49 @@
+# migration/preflight.py
+import logging
+from typing import Any, Dict, List, Tuple, Union
+from api_client import APIClient
+
+logger = logging.getLogger(__name__)
+
+class DuplicateFilter:
+    """Pré-verificação de notas que já existem no sistema novo
+    
+    Baixa em lote as chaves já salvas (GET /api/notas/chaves) e descarta as notas
+    conhecidas antes do envio, evitando um /api/scan/process inteiro (com
+    busca da página da SEFAZ) só para receber "duplicada". As chaves de 44
+    dígitos são guardadas como inteiros, bem mais compactos que strings, e
+    o conjunto é exato: não há falsos positivos a confirmar.
+    """
+    
+    def __init__(self, api_client: APIClient):
+        self.api_client = api_client
+        self.chaves = set()
+    
+    @staticmethod
+    def _key(chave: Any) -> Union[int, str]:
+        """Normaliza a chave para a forma guardada no conjunto"""
+        chave = str(chave).strip()
+        return int(chave) if chave.isdigit() else chave
+    
+    def load(self) -> int:
+        """Carrega as chaves existentes no sistema novo; retorna quantas"""
+        self.chaves = set()
+        for chave in self.api_client.iter_existing_chaves():
+            self.chaves.add(self._key(chave))
+        return len(self.chaves)
+    
+    def __contains__(self, chave: Any) -> bool:
+        return chave is not None and self._key(chave) in self.chaves
+    
+    def __len__(self) -> int:
+        return len(self.chaves)
+    
+    def split(self, notas: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Separa o lote em (novas, já existentes no sistema novo)"""
+        novas, existentes = [], []
+        for nota in notas:
+            if nota.get('chave') in self:
+                existentes.append(nota)
+            else:
+                novas.append(nota)
+        return novas, existentes
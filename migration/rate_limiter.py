@@ -0,0 +1,109 @@
+# migration/rate_limiter.py
+import threading
+import time
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Limitador de taxa por token bucket (requisições por segundo)
+    
+    rate <= 0 desativa o limite. `reserve()` não bloqueia: devolve quantos
+    segundos esperar, o que permite usar o mesmo balde com time.sleep ou
+    asyncio.sleep.
+    """
+    
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def reserve(self) -> float:
+        """Reserva um token e retorna a espera necessária em segundos"""
+        if self.rate <= 0:
+            return 0.0
+        
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+    
+    def acquire(self) -> None:
+        """Bloqueia até haver um token disponível"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+class AdaptiveConcurrency:
+    """Limite de requisições simultâneas ajustado por AIMD
+    
+    Cada resposta saudável soma 1/limite ao limite, ou seja, +1 a cada
+    janela completa. 429, 5xx, timeouts e erros de conexão multiplicam o
+    limite por `decrease_factor`, no máximo uma vez por latência observada,
+    para não derrubar o limite várias vezes pela mesma rajada de erros.
+    
+    Com `latency_tolerance` > 0, uma resposta mais lenta que essa quantidade
+    de vezes a latência típica (média móvel exponencial das respostas
+    saudáveis) também conta como sobrecarga. O padrão 0 reage só a erros:
+    com latências curtas o jitter normal já passaria de um múltiplo pequeno.
+    """
+    
+    BASELINE_WEIGHT = 0.05  # Peso de cada amostra na média móvel da latência
+    
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 1,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 0.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.baseline = None  # Latência típica (média móvel exponencial)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+    
+    def try_acquire(self) -> bool:
+        """Ocupa uma vaga se houver, sem bloquear"""
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+    
+    def acquire(self) -> None:
+        """Bloqueia até haver vaga dentro do limite atual"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+    
+    def release(self, overloaded: bool, latency: float) -> None:
+        """Libera a vaga e ajusta o limite conforme o resultado"""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            
+            if not overloaded and self.latency_tolerance:
+                # Comparada com a média anterior: a própria amostra não disfarça o pico
+                overloaded = self.baseline is not None and latency > self.baseline * self.latency_tolerance
+                if self.baseline is None:
+                    self.baseline = latency
+                else:
+                    self.baseline += self.BASELINE_WEIGHT * (latency - self.baseline)
+            
+            if overloaded:
+                if now - self._last_decrease >= latency:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    logger.debug("📉 Concorrência reduzida para %d", int(self.limit))
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            
+            self._cond.notify_all()
@@ -0,0 +1,116 @@
+# migration/retry.py
+import heapq
+import itertools
+import random
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Backoff exponencial com jitter: metade fixa, metade aleatória
+
+    O jitter espalha as novas tentativas das notas que falharam juntas (ex.:
+    durante um 503), em vez de devolvê-las ao servidor todas no mesmo instante.
+    """
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class RetryScheduler:
+    """Fila de atraso para novas tentativas, sem ocupar workers no backoff
+
+    `schedule(nota)` guarda a nota até a hora da próxima tentativa e devolve
+    o controle na hora; uma thread própria entrega as notas vencidas a
+    `resubmit`, que as devolve à fila de envio (sem despachar nesta thread:
+    no modo serial o envio continua sendo um por vez). Quem decide
+    se a falha é transitória é o chamador (ver APIClient.is_retryable_failure).
+    """
+
+    def __init__(self, resubmit: Callable[[List[Dict[str, Any]]], None],
+                 max_retries: int, base_delay: float, max_delay: float):
+        self.resubmit = resubmit
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.scheduled = 0  # Total de novas tentativas agendadas
+        self._heap = []     # (vencimento, sequência, nota)
+        self._seq = itertools.count()
+        self._pending = 0   # Agendadas e ainda não despachadas de novo
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='retry-scheduler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return self._pending
+
+    def schedule(self, nota: Dict[str, Any], error: str = "") -> bool:
+        """Agenda nova tentativa; False se as tentativas acabaram ou a fila fechou"""
+        attempt = nota.get('tentativas', 0)
+        if attempt >= self.max_retries:
+            return False
+
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        with self._cond:
+            if self._closed:
+                return False
+            nota['tentativas'] = attempt + 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), nota))
+            self._pending += 1
+            self.scheduled += 1
+            self._cond.notify_all()
+
+        logger.debug("🔁 Nota %s: tentativa %d em %.1fs (%s)", nota.get('id'), attempt + 2, delay, error)
+        return True
+
+    def join(self, timeout: float = None) -> bool:
+        """Aguarda até não haver tentativas pendentes; False se estourar o timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self) -> None:
+        """Para a thread; notas ainda na fila não são registradas (ficam para o --resume)"""
+        with self._cond:
+            self._closed = True
+            self._heap.clear()
+            self._pending = 0
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._closed:
+                    return
+
+                # Todas as notas vencidas seguem juntas, como um lote
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+
+            try:
+                self.resubmit(due)
+            except Exception as e:
+                logger.error(f"💥 Erro ao reenviar {len(due)} notas: {e}")
+            finally:
+                with self._cond:
+                    self._pending = max(0, self._pending - len(due))
+                    self._cond.notify_all()
@@ -0,0 +1,68 @@
+# migration/sharding.py
+import os
+import multiprocessing
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+from logger import MigrationStats
+
+logger = logging.getLogger(__name__)
+
+def parse_shard(value: str) -> Tuple[List[int], int]:
+    """Interpreta "i/N", "a-b/N" ou "a,b,c/N" em (índices, total de shards)"""
+    try:
+        indices_part, count_part = value.split('/')
+        count = int(count_part)
+        indices = []
+        for part in indices_part.split(','):
+            if '-' in part:
+                start, end = part.split('-')
+                indices.extend(range(int(start), int(end) + 1))
+            else:
+                indices.append(int(part))
+    except ValueError:
+        raise ValueError(f"Shard inválido: {value!r} (use i/N, a-b/N ou a,b/N)")
+
+    if count < 1 or not indices or any(i < 0 or i >= count for i in indices):
+        raise ValueError(f"Shard inválido: {value!r} (índices devem estar entre 0 e {count - 1})")
+
+    return sorted(set(indices)), count
+
+def shard_checkpoint_file(path: str, index: int, count: int) -> str:
+    """Arquivo próprio de cada shard (checkpoint, falhas), para os processos não disputarem o arquivo"""
+    base, ext = os.path.splitext(path)
+    return f"{base}.shard{index}of{count}{ext}"
+
+def run_shard(index: int, count: int, options: Dict[str, Any]) -> dict:
+    """Executa um shard em um processo filho e devolve suas estatísticas"""
+    # Import tardio: o processo filho (spawn) só carrega o migrador aqui
+    from engine import MigrationEngine
+
+    migrator = MigrationEngine(shard=(index, count), **options['migration'])
+    migrator.migrate(limit=options.get('limit'), offset=options.get('offset', 0), report=False)
+    return migrator.stats.to_dict()
+
+def run_sharded(indices: List[int], count: int, options: Dict[str, Any]) -> MigrationStats:
+    """Coordenador local: um processo por shard, estatísticas somadas no fim
+
+    Para várias máquinas, cada uma roda a sua parte dos índices (ex.:
+    --shard 0-3/8 numa e --shard 4-7/8 na outra); as fatias são disjuntas.
+    """
+    stats = MigrationStats()
+    logger.info(f"🧩 Iniciando {len(indices)} shards de {count}: {indices}")
+
+    # spawn: cada filho abre as próprias conexões (nada herdado do pai)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=len(indices), mp_context=context) as executor:
+        futures = {
+            executor.submit(run_shard, index, count, options): index
+            for index in indices
+        }
+        for future, index in futures.items():
+            try:
+                stats.merge(future.result())
+                logger.info(f"🧩 Shard {index}/{count} concluído")
+            except Exception as e:
+                logger.error(f"💥 Shard {index}/{count} falhou: {e}")
+
+    return stats
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# migration/snapshot.py
+# Snapshot binário das notas válidas (e itens) do banco antigo: exportado uma
+# vez e lido por mmap nos hosts de envio, sem acesso ao banco
+
+import os
+import mmap
+import json
+import struct
+import argparse
+import threading
+import logging
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from database_connector import DatabaseConnector
+
+logger = logging.getLogger(__name__)
+
+# Formato (inteiros little-endian):
+#   cabeçalho  MAGIC | u32 tamanho | metadados JSON (colunas, itens, origem)
+#   registros  u32 tamanho | valores da nota [| u32 nº de itens | valores de cada item]
+#   índice     (i64 id da nota, u64 posição do registro) por nota, na ordem dos registros
+#   rodapé     u64 posição do índice | u64 nº de notas | MAGIC
+MAGIC = b'NFCESNP1'
+VERSION = 1
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+_INDEX_ENTRY = struct.Struct('<qQ')
+_FOOTER = struct.Struct('<QQ8s')
+
+# Colunas gravadas quando não há linha para copiar os nomes; as lidas pela migração
+NOTA_FIELDS = ('id', 'chave', 'versao', 'ambiente', 'cIdToken', 'vSig', 'cnpjEmitente',
+               'nomeEmitente', 'ieEmitente', 'createdAt', 'updatedAt')
+ITEM_FIELDS = ('id', 'codigo', 'descricao', 'quantidade', 'unidade', 'valorUnitario',
+               'valorTotal', 'notaFiscalId', 'createdAt', 'updatedAt')
+
+# Tipo de cada valor (1 byte antes do valor)
+_NONE, _INT, _FLOAT, _STR, _DECIMAL, _DATETIME, _DATE, _BYTES = range(8)
+
+def _encode_value(value: Any, out: bytearray) -> None:
+    """Anexa um valor com seu tipo: os tipos do driver (Decimal, datetime) voltam iguais na leitura"""
+    if value is None:
+        out.append(_NONE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        out += _I64.pack(value)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _F64.pack(value)
+    else:
+        if isinstance(value, str):
+            tag, data = _STR, value.encode('utf-8')
+        elif isinstance(value, Decimal):
+            tag, data = _DECIMAL, str(value).encode('ascii')
+        elif isinstance(value, datetime):
+            tag, data = _DATETIME, value.isoformat().encode('ascii')
+        elif isinstance(value, date):
+            tag, data = _DATE, value.isoformat().encode('ascii')
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            tag, data = _BYTES, bytes(value)
+        else:
+            raise TypeError(f"Tipo não suportado no snapshot: {type(value).__name__}")
+        out.append(tag)
+        out += _U32.pack(len(data))
+        out += data
+
+def _decode_value(buffer, pos: int) -> Tuple[Any, int]:
+    """(valor, próxima posição)"""
+    tag = buffer[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _INT:
+        return _I64.unpack_from(buffer, pos)[0], pos + 8
+    if tag == _FLOAT:
+        return _F64.unpack_from(buffer, pos)[0], pos + 8
+
+    length = _U32.unpack_from(buffer, pos)[0]
+    pos += 4
+    data = buffer[pos:pos + length]
+    pos += length
+    if tag == _STR:
+        return data.decode('utf-8'), pos
+    if tag == _DECIMAL:
+        return Decimal(data.decode('ascii')), pos
+    if tag == _DATETIME:
+        return datetime.fromisoformat(data.decode('ascii')), pos
+    if tag == _DATE:
+        return date.fromisoformat(data.decode('ascii')), pos
+    if tag == _BYTES:
+        return bytes(data), pos
+    raise ValueError(f"Snapshot corrompido: tipo {tag} desconhecido")
+
+class SnapshotWriter:
+    """Grava o snapshot registro a registro; o índice fica em memória até `close`
+
+    O arquivo é escrito em `<path>.tmp` e só substitui `path` quando o rodapé
+    está gravado: um export interrompido nunca deixa um snapshot truncado.
+    """
+
+    def __init__(self, path: str, fields: List[str], item_fields: Optional[List[str]] = None,
+                 metadata: Dict[str, Any] = None):
+        self.path = path
+        self.fields = list(fields)
+        self.item_fields = list(item_fields) if item_fields is not None else None
+        self._tmp = f"{path}.tmp"
+        self._file = open(self._tmp, 'wb')
+        self._index = bytearray()
+        self.count = 0
+
+        header = dict(metadata or {})
+        header.update(version=VERSION, fields=self.fields, item_fields=self.item_fields)
+        blob = json.dumps(header, ensure_ascii=False, default=str).encode('utf-8')
+        self._file.write(MAGIC + _U32.pack(len(blob)) + blob)
+        self._position = len(MAGIC) + 4 + len(blob)
+
+    def write(self, nota: Dict[str, Any], itens: Optional[List[Dict[str, Any]]] = None) -> None:
+        body = bytearray()
+        for field in self.fields:
+            _encode_value(nota.get(field), body)
+        if self.item_fields is not None:
+            itens = itens or []
+            body += _U32.pack(len(itens))
+            for item in itens:
+                for field in self.item_fields:
+                    _encode_value(item.get(field), body)
+
+        self._index += _INDEX_ENTRY.pack(nota['id'], self._position)
+        self._file.write(_U32.pack(len(body)))
+        self._file.write(body)
+        self._position += 4 + len(body)
+        self.count += 1
+
+    def close(self) -> None:
+        """Grava índice e rodapé e publica o arquivo"""
+        self._file.write(self._index)
+        self._file.write(_FOOTER.pack(self._position, self.count, MAGIC))
+        self._file.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+class SnapshotReader:
+    """Leitura do snapshot por mmap: só as páginas tocadas saem do disco
+
+    O índice (id e posição de cada registro) é lido inteiro na abertura;
+    os registros são decodificados sob demanda, então pular notas
+    (`offset`, shards) não custa leitura.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC or len(self._map) < len(MAGIC) + _FOOTER.size:
+            self.close()
+            raise ValueError(f"{path} não é um snapshot de NFC-e")
+        index_offset, count, magic = _FOOTER.unpack_from(self._map, len(self._map) - _FOOTER.size)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Snapshot incompleto (sem rodapé): {path}")
+
+        header_size = _U32.unpack_from(self._map, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        self.metadata = json.loads(self._map[start:start + header_size].decode('utf-8'))
+        self.fields = self.metadata['fields']
+        self.item_fields = self.metadata.get('item_fields')
+
+        self.ids = array('q')
+        self.offsets = array('Q')
+        for nota_id, offset in _INDEX_ENTRY.iter_unpack(self._map[index_offset:index_offset + count * _INDEX_ENTRY.size]):
+            self.ids.append(nota_id)
+            self.offsets.append(offset)
+        # Ids ordenados → posição, montado na primeira busca por id
+        self._sorted_ids = None
+        self._sorted_positions = None
+        self._lock = threading.Lock()
+
+    @property
+    def has_itens(self) -> bool:
+        return self.item_fields is not None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def record(self, position: int, with_itens: bool = True) -> Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]:
+        """(nota, itens) do registro na posição `position` (itens None se exportado sem itens ou `with_itens` falso)"""
+        pos = self.offsets[position] + 4
+        nota = {}
+        for field in self.fields:
+            nota[field], pos = _decode_value(self._map, pos)
+        if self.item_fields is None or not with_itens:
+            return nota, None
+
+        count = _U32.unpack_from(self._map, pos)[0]
+        pos += 4
+        itens = []
+        for _ in range(count):
+            item = {}
+            for field in self.item_fields:
+                item[field], pos = _decode_value(self._map, pos)
+            itens.append(item)
+        return nota, itens
+
+    def get(self, nota_id: int) -> Optional[Tuple[Dict[str, Any], Optional[List[Dict[str, Any]]]]]:
+        """(nota, itens) pelo id, ou None (busca binária em uma cópia ordenada do índice)"""
+        with self._lock:
+            if self._sorted_ids is None:
+                order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+                self._sorted_positions = array('Q', order)
+                self._sorted_ids = array('q', (self.ids[position] for position in order))
+        index = bisect_left(self._sorted_ids, nota_id)
+        if index == len(self._sorted_ids) or self._sorted_ids[index] != nota_id:
+            return None
+        return self.record(self._sorted_positions[index])
+
+    def positions(self, shard: Optional[Tuple[int, int]] = None) -> Iterator[int]:
+        """Posições dos registros em ordem, só as da fatia `shard` (id % N == i) se dada"""
+        if not shard:
+            return iter(range(len(self.offsets)))
+        index, count = shard
+        return (position for position, nota_id in enumerate(self.ids) if nota_id % count == index)
+
+    def close(self) -> None:
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+def export_snapshot(path: str, connector: DatabaseConnector, itens: bool = False,
+                    limit: Optional[int] = None, chunk_size: int = 500) -> int:
+    """Exporta as notas válidas (e, com `itens`, seus itens) do conector para `path`
+
+    Mesmas notas e mesma ordem que a migração lê (createdAt/id decrescentes,
+    fatia do shard do conector). As notas vêm do cursor de streaming e os
+    itens de uma consulta por bloco de `chunk_size` notas. Devolve o número
+    de notas gravadas.
+    """
+    metadata = {
+        'source': connector.config.OLD_DB_TYPE,
+        'shard': connector.shard,
+        'exported_at': datetime.now().isoformat(timespec='seconds')
+    }
+    connector.connect()
+    writer = None
+    try:
+        def write_chunk(chunk: List[Dict[str, Any]]) -> None:
+            itens_por_nota = connector.get_itens_notas([nota['id'] for nota in chunk]) if itens else {}
+            for nota in chunk:
+                writer.write(nota, itens_por_nota.get(nota['id']))
+
+        notas_iter = connector.iter_notas_fiscais(prefetch=chunk_size, limit=limit)
+        chunk = []
+        for nota in notas_iter:
+            if writer is None:
+                # Nomes das colunas como o driver devolve, para a leitura ser idêntica
+                writer = SnapshotWriter(path, list(nota), ITEM_FIELDS if itens else None, metadata)
+            chunk.append(nota)
+            if len(chunk) >= chunk_size:
+                write_chunk(chunk)
+                chunk = []
+                if writer.count % (chunk_size * 20) == 0:
+                    logger.info(f"📦 {writer.count} notas exportadas...")
+
+        if writer is None:
+            # Banco (ou fatia) sem notas: snapshot vazio, mas válido
+            writer = SnapshotWriter(path, NOTA_FIELDS, ITEM_FIELDS if itens else None, metadata)
+        if chunk:
+            write_chunk(chunk)
+        writer.close()
+        logger.info(f"📦 Snapshot {path}: {writer.count} notas ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+        return writer.count
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        connector.disconnect()
+
+def main():
+    from sharding import parse_shard
+    from logger import setup_logger
+
+    parser = argparse.ArgumentParser(description="Snapshot binário das notas do banco antigo")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='Exporta as notas válidas do banco antigo (OLD_DB_*)')
+    export.add_argument('path', help='Arquivo do snapshot (ex.: notas.snap)')
+    export.add_argument('--itens', action='store_true', help='Inclui os itens de cada nota (necessário para --mode direct)')
+    export.add_argument('--shard', help='Exporta só a fatia i/N (id %% N == i)')
+    export.add_argument('--limit', type=int, help='Limite de notas')
+
+    info = commands.add_parser('info', help='Resumo de um snapshot')
+    info.add_argument('path')
+    info.add_argument('--get', type=int, metavar='ID', help='Mostra uma nota (e seus itens) pelo id')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        setup_logger('snapshot')
+        shard = None
+        if args.shard:
+            try:
+                indices, count = parse_shard(args.shard)
+            except ValueError as e:
+                parser.error(str(e))
+            if len(indices) > 1:
+                parser.error("--shard do export aceita uma fatia só (i/N)")
+            shard = (indices[0], count)
+        total = export_snapshot(args.path, DatabaseConnector(shard=shard), itens=args.itens, limit=args.limit)
+        print(f"📦 {total} notas exportadas para {args.path}")
+        return
+
+    reader = SnapshotReader(args.path)
+    try:
+        if args.get is not None:
+            found = reader.get(args.get)
+            if found is None:
+                print(f"❌ Nota {args.get} não está no snapshot")
+            else:
+                nota, itens = found
+                print(json.dumps({'nota': nota, 'itens': itens}, ensure_ascii=False, indent=2, default=str))
+        else:
+            meta = reader.metadata
+            print(f"📦 {args.path}: {len(reader)} notas, "
+                  f"{'com' if reader.has_itens else 'sem'} itens, origem {meta.get('source')}"
+                  f"{', shard ' + '/'.join(map(str, meta['shard'])) if meta.get('shard') else ''}, "
+                  f"exportado em {meta.get('exported_at')} "
+                  f"({os.path.getsize(args.path) / 1024 / 1024:.1f} MB)")
+    finally:
+        reader.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# migration/sources.py
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from config import Config
+from database_connector import DatabaseConnector
+from snapshot import SnapshotReader
+
+class NotaSource:
+    """De onde o motor lê as notas
+
+    O motor só usa esta interface: connect/disconnect (na thread do leitor),
+    count, iter_batches, get_itens_notas (modo direct) e, opcional, explain. Outra origem (ex.:
+    um export ou um arquivo) só precisa implementar estes métodos.
+    """
+
+    def connect(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def iter_batches(self, batch_size: int, limit: Optional[int] = None,
+                     offset: int = 0) -> Iterator[List[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def iter_changes(self, batch_size: int, after: Optional[Tuple[Any, int]] = None,
+                     limit: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Notas novas ou alteradas depois da posição (updatedAt, id), em ordem (--follow)"""
+        raise NotImplementedError
+
+    def get_itens_notas(self, nota_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        raise NotImplementedError
+    
+    def explain(self) -> Dict[str, List[str]]:
+        """Plano de execução das consultas de leitura (nome → passos), se a origem tiver"""
+        return {}
+
+class DatabaseSource(NotaSource):
+    """Banco antigo (sqlite, MySQL ou PostgreSQL) via DatabaseConnector
+
+    `read_mode`: keyset (cursor em createdAt/id, padrão), offset ou stream
+    (um único cursor de servidor, `prefetch` linhas por fetch).
+    """
+
+    def __init__(self, connector: DatabaseConnector, read_mode: str = None, prefetch: int = None):
+        self.connector = connector
+        self.read_mode = read_mode or connector.config.READ_MODE
+        self.prefetch = prefetch or connector.config.STREAM_PREFETCH
+
+    @classmethod
+    def sqlite(cls, path: str, config: Config = None, **kwargs) -> 'DatabaseSource':
+        """Atalho para um arquivo sqlite específico (ex.: o database_old.sqlite)"""
+        config = config or Config()
+        config.OLD_DB_TYPE = 'sqlite'
+        config.OLD_DB_FILE = str(path)
+        return cls(DatabaseConnector(config=config), **kwargs)
+
+    def connect(self) -> None:
+        self.connector.connect()
+
+    def disconnect(self) -> None:
+        self.connector.disconnect()
+
+    def count(self) -> int:
+        return self.connector.get_total_notas()
+
+    def get_itens_notas(self, nota_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        return self.connector.get_itens_notas(nota_ids)
+    
+    def explain(self) -> Dict[str, List[str]]:
+        return self.connector.explain_plans()
+
+    def iter_changes(self, batch_size: int, after: Optional[Tuple[Any, int]] = None,
+                     limit: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        processed = 0
+        while True:
+            page_size = min(batch_size, limit - processed) if limit else batch_size
+            notas = self.connector.get_notas_alteradas(after=after, limit=page_size)
+            if not notas:
+                break
+
+            after = (notas[-1]['updatedAt'], notas[-1]['id'])
+            processed += len(notas)
+            yield notas
+
+            if len(notas) < page_size or (limit and processed >= limit):
+                break
+
+    def iter_batches(self, batch_size: int, limit: Optional[int] = None,
+                     offset: int = 0) -> Iterator[List[Dict[str, Any]]]:
+        """Lê as notas em lotes, conforme o modo de leitura"""
+        if self.read_mode == 'stream':
+            # Cursor de servidor único: memória limitada ao prefetch + um lote
+            notas_iter = self.connector.iter_notas_fiscais(
+                prefetch=self.prefetch, limit=limit, offset=offset
+            )
+            try:
+                while True:
+                    notas = list(islice(notas_iter, batch_size))
+                    if not notas:
+                        break
+                    yield notas
+            finally:
+                # Libera o cursor de servidor mesmo se a migração parar no meio
+                notas_iter.close()
+            return
+
+        processed = 0
+        # Cursor (createdAt, id) da última nota lida no modo keyset
+        after: Optional[Tuple[Any, int]] = None
+
+        while True:
+            page_size = min(batch_size, limit - processed) if limit else batch_size
+
+            # Busca próximo lote
+            if self.read_mode == 'keyset':
+                # --offset só é aplicado na primeira página; depois segue o cursor
+                notas = self.connector.get_notas_fiscais(
+                    limit=page_size,
+                    offset=offset if after is None else 0,
+                    after=after
+                )
+            else:
+                notas = self.connector.get_notas_fiscais(
+                    limit=page_size,
+                    offset=offset + processed
+                )
+
+            if not notas:
+                break
+
+            after = (notas[-1]['createdAt'], notas[-1]['id'])
+            processed += len(notas)
+            yield notas
+
+            # Para se atingiu o limite
+            if limit and processed >= limit:
+                break
+
+class SnapshotSource(NotaSource):
+    """Snapshot exportado (snapshot.py export), lido por mmap sem acesso ao banco
+
+    As notas saem na ordem do export; `offset` pula posições pelo índice e
+    `shard` (i, N) filtra id % N == i, então um único snapshot serve todos os
+    shards. Os itens (modo direct) vêm do próprio snapshot, se exportado com
+    --itens, buscados por id (o preparo os pede em outra thread).
+    """
+
+    def __init__(self, path: str, shard: Optional[Tuple[int, int]] = None):
+        self.path = path
+        self.shard = shard
+        self.reader = None
+
+    def connect(self) -> None:
+        if self.reader is None:
+            self.reader = SnapshotReader(self.path)
+
+    def disconnect(self) -> None:
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def count(self) -> int:
+        if not self.shard:
+            return len(self.reader)
+        return sum(1 for _ in self.reader.positions(self.shard))
+
+    def iter_batches(self, batch_size: int, limit: Optional[int] = None,
+                     offset: int = 0) -> Iterator[List[Dict[str, Any]]]:
+        positions = islice(self.reader.positions(self.shard), offset, offset + limit if limit else None)
+        while True:
+            notas = [self.reader.record(position, with_itens=False)[0] for position in islice(positions, batch_size)]
+            if not notas:
+                break
+            yield notas
+
+    def iter_changes(self, batch_size: int, after: Optional[Tuple[Any, int]] = None,
+                     limit: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        raise ValueError("Snapshot é um retrato do banco: --follow precisa do banco antigo")
+
+    def get_itens_notas(self, nota_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        if not self.reader.has_itens:
+            raise ValueError(f"Snapshot {self.path} exportado sem itens (use export --itens)")
+        itens_por_nota = {}
+        for nota_id in nota_ids:
+            found = self.reader.get(nota_id)
+            itens_por_nota[nota_id] = found[1] if found else []
+        return itens_por_nota
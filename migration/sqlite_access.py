@@ -0,0 +1,107 @@
+# migration/sqlite_access.py
+import os
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Índices que as consultas da migração usam (ver explain_plans)
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_notas_created ON notas_fiscais (createdAt, id)",
+    "CREATE INDEX IF NOT EXISTS idx_notas_updated ON notas_fiscais (updatedAt, id)",
+    "CREATE INDEX IF NOT EXISTS idx_itens_nota ON itens_nota (notaFiscalId, id)",
+)
+
+# Trechos do plano que indicam leitura cara: ordenação em B-tree temporária
+PLAN_WARNINGS = ('USE TEMP B-TREE',)
+
+def sqlite_uri(path: str, access: str) -> str:
+    """URI de abertura conforme SQLITE_ACCESS (ro: só leitura; immutable: sem travas)"""
+    uri = Path(path).resolve().as_uri()
+    if access == 'ro':
+        return f"{uri}?mode=ro"
+    if access == 'immutable':
+        # Sem travas nem checagem de alterações: só para arquivos que ninguém mais grava
+        return f"{uri}?mode=ro&immutable=1"
+    raise ValueError(f"SQLITE_ACCESS não suportado: {access} (use default, ro ou immutable)")
+
+def connect(path: str, config: Config = None, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Abre o banco antigo sqlite otimizado para leitura
+
+    Com SQLITE_ACCESS=ro/immutable o arquivo é aberto por URI (um caminho
+    errado falha em vez de criar um banco vazio) e com query_only. Em todos
+    os modos, mmap_size lê as páginas direto do cache do sistema operacional
+    (sem cópia para o cache do sqlite) e cache_size aumenta o cache próprio.
+    `check_same_thread=False` é para o pool, que fecha as conexões de outra thread.
+    """
+    config = config or Config()
+    access = config.SQLITE_ACCESS
+    if access == 'default':
+        connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+    else:
+        connection = sqlite3.connect(sqlite_uri(path, access), uri=True, check_same_thread=check_same_thread)
+        connection.execute("PRAGMA query_only = ON")
+
+    connection.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_MB) * 1024 * 1024}")
+    # Negativo: tamanho em KiB em vez de páginas
+    connection.execute(f"PRAGMA cache_size = {-int(config.SQLITE_CACHE_MB) * 1024}")
+    connection.execute("PRAGMA temp_store = MEMORY")
+    return connection
+
+def build_indexed_copy(path: str, target: str = None) -> str:
+    """Cópia de trabalho do banco antigo com os índices da migração (feita uma vez)
+
+    O original não é alterado: a cópia é feita pela API de backup do sqlite
+    (consistente mesmo com o arquivo em uso), recebe os INDEXES e ANALYZE e
+    só então substitui a anterior. Se a cópia já existe e é mais nova que o
+    original, é reaproveitada.
+    """
+    if not target:
+        base, ext = os.path.splitext(path)
+        target = f"{base}.indexed{ext or '.sqlite'}"
+
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        logger.info(f"📇 Cópia indexada reaproveitada: {target}")
+        return target
+
+    logger.info(f"📇 Criando cópia indexada de {path} em {target}...")
+    tmp = f"{target}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    source = sqlite3.connect(sqlite_uri(path, 'ro'), uri=True)
+    copy = sqlite3.connect(tmp)
+    try:
+        source.backup(copy)
+        for statement in INDEXES:
+            copy.execute(statement)
+        copy.execute("ANALYZE")
+        copy.commit()
+    finally:
+        copy.close()
+        source.close()
+
+    os.replace(tmp, target)
+    logger.info(f"📇 Cópia indexada pronta: {target} ({os.path.getsize(target) / 1024 / 1024:.1f} MB)")
+    return target
+
+def explain_plans(connection: sqlite3.Connection,
+                  queries: Dict[str, Tuple[str, List[Any]]]) -> Dict[str, List[str]]:
+    """EXPLAIN QUERY PLAN de cada consulta: nome → passos do plano"""
+    plans = {}
+    for name, (query, params) in queries.items():
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        # Colunas: id, parent, notused, detail
+        plans[name] = [row[3] for row in rows]
+    return plans
+
+def plan_warnings(plans: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Passos caros (ordenação em B-tree temporária) de cada consulta"""
+    return {
+        name: [step for step in steps if any(flag in step for flag in PLAN_WARNINGS)]
+        for name, steps in plans.items()
+        if any(flag in step for step in steps for flag in PLAN_WARNINGS)
+    }
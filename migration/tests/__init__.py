@@ -0,0 +1,9 @@
+# migration/tests/__init__.py
+# Os módulos da migração importam uns aos outros pelo nome (from config import
+# Config), como nos scripts: o diretório migration/ precisa estar no path
+import os
+import sys
+
+MIGRATION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if MIGRATION_DIR not in sys.path:
+    sys.path.insert(0, MIGRATION_DIR)
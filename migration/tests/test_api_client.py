@@ -0,0 +1,171 @@
+# migration/tests/test_api_client.py
+import json
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+import requests
+
+from api_client import APIClient, json_value
+from config import Config
+
+class FakeResponse:
+
+    def __init__(self, status_code: int, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+class FakeSession:
+    """Sessão HTTP simulada: rota → função(params) que devolve FakeResponse"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        path = urlsplit(url).path
+        self.calls.append((path, dict(params or {})))
+        handler = self.routes.get(path)
+        return handler(params) if handler else FakeResponse(404)
+
+def make_client(routes) -> APIClient:
+    config = Config()
+    config.set_api_base_url('http://servidor.teste')
+    config.CIRCUIT_BREAKER = False
+    client = APIClient(max_concurrency=1, config=config)
+    client._local.session = FakeSession(routes)
+    return client
+
+CHAVES = [f'{i:044d}' for i in range(1, 11)]
+
+def chaves_route(params):
+    # Posição na lista como id, como no servidor simulado
+    after, limit = int(params['after']), int(params['limit'])
+    page = CHAVES[after:after + limit]
+    return FakeResponse(200, {'chaves': page, 'next': after + limit if len(page) == limit else None})
+
+def notas_route(params):
+    page, limit = int(params['page']), int(params['limit'])
+    notas = [{'chave': chave} for chave in CHAVES[(page - 1) * limit:page * limit]]
+    return FakeResponse(200, {'notas': notas, 'pages': (len(CHAVES) + limit - 1) // limit})
+
+class IterExistingChavesTest(unittest.TestCase):
+
+    def test_pages_by_keyset(self):
+        client = make_client({'/api/notas/chaves': chaves_route, '/api/notas': notas_route})
+        self.assertEqual(list(client.iter_existing_chaves(page_size=4)), CHAVES)
+        self.assertEqual(
+            [(path, params['after']) for path, params in client.session.calls],
+            [('/api/notas/chaves', 0), ('/api/notas/chaves', 4), ('/api/notas/chaves', 8)]
+        )
+
+    def test_exact_multiple_of_page_size_ends_on_empty_page(self):
+        client = make_client({'/api/notas/chaves': chaves_route})
+        self.assertEqual(list(client.iter_existing_chaves(page_size=5)), CHAVES)
+        self.assertEqual(len(client.session.calls), 3)
+
+    def test_falls_back_to_paged_notas_without_the_route(self):
+        client = make_client({'/api/notas': notas_route})
+        self.assertEqual(list(client.iter_existing_chaves(page_size=4)), CHAVES)
+        self.assertEqual([path for path, _ in client.session.calls][1:], ['/api/notas'] * 3)
+
+    def test_server_errors_are_raised(self):
+        client = make_client({'/api/notas/chaves': lambda params: FakeResponse(500)})
+        with self.assertRaises(RuntimeError):
+            list(client.iter_existing_chaves(page_size=4))
+
+class BatchResponse(FakeResponse):
+
+    def __init__(self, qr_codes):
+        super().__init__(200, {'results': [
+            {'index': index, 'success': True, 'data': {'chave': qr_code}} for index, qr_code in enumerate(qr_codes)
+        ]})
+
+class ProcessBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_client({})
+        self.client.config.SCAN_BATCH_MAX = 100
+        self.client.config.SCAN_BATCH_TIMEOUT = 120
+        self.client.config.RETRY_DELAY = 0
+        self.requests = []  # (QR Codes, timeout) de cada POST
+
+    def post(self, stalled=()):
+        def _post(url, payload, timeout=30):
+            qr_codes = payload['qrCodes']
+            self.requests.append((qr_codes, timeout))
+            if any(qr_code in stalled for qr_code in qr_codes):
+                raise requests.exceptions.Timeout()
+            return BatchResponse(qr_codes)
+        self.client._post = _post
+
+    def test_timeout_is_capped(self):
+        self.post()
+        qr_codes = [f'qr{i}' for i in range(100)]
+        results = self.client.process_nfce_batch(qr_codes, max_retries=2)
+        self.assertEqual([r['data']['chave'] for r in results], qr_codes)
+        self.assertEqual(self.requests, [(qr_codes, 120)])
+
+    def test_timed_out_batch_is_split_not_repeated(self):
+        self.post(stalled={'qr5'})
+        qr_codes = [f'qr{i}' for i in range(8)]
+        results = self.client.process_nfce_batch(qr_codes, max_retries=1)
+
+        self.assertEqual([r['success'] for r in results], [True] * 5 + [False] + [True] * 2)
+        self.assertEqual(results[5]['error_class'], 'timeout')
+        sizes = [len(qr) for qr, _ in self.requests]
+        # 8 → 4 (ok) + 4 → 2 → 1 (ok) + 1 (travada, repetida) e então 2 (ok)
+        self.assertEqual(sizes, [8, 4, 4, 2, 1, 1, 1, 2])
+        self.assertEqual([timeout for qr, timeout in self.requests if len(qr) == 1], [30, 30, 30])
+
+class BuildSavePayloadTest(unittest.TestCase):
+
+    def test_driver_types_become_json(self):
+        # Como o MySQL/PostgreSQL (e um snapshot exportado deles) devolvem as colunas
+        nota = {'chave': ' ' + '1' * 44, 'versao': Decimal('2.00'), 'ambiente': 1, 'cIdToken': '000001',
+                'vSig': 'sig', 'cnpjEmitente': '12345678000190', 'nomeEmitente': 'Padaria', 'ieEmitente': None}
+        itens = [{'codigo': 7, 'descricao': 'Pão', 'quantidade': Decimal('0.3500'), 'unidade': 'KG',
+                  'valorUnitario': Decimal('12.90'), 'valorTotal': Decimal('4.52'),
+                  'createdAt': datetime(2024, 5, 1, 12, 0)}]
+
+        payload = make_client({}).build_save_payload(nota, itens)
+        decoded = json.loads(json.dumps(payload))
+
+        self.assertEqual(decoded['chave'], '1' * 44)
+        self.assertEqual(decoded['versao'], '2.00')
+        self.assertEqual(decoded['tpAmb'], '1')
+        self.assertEqual(decoded['itens'], [
+            {'codigo': 7, 'descricao': 'Pão', 'qtde': 0.35, 'un': 'KG', 'unitario': 12.9, 'total': 4.52}
+        ])
+
+    def test_json_value(self):
+        self.assertEqual(json_value(datetime(2024, 5, 1, 12, 30)), '2024-05-01T12:30:00')
+        self.assertEqual(json_value(Decimal('10.50')), 10.5)
+        self.assertEqual(json_value('texto'), 'texto')
+        self.assertIsNone(json_value(None))
+
+class CircuitBreakerConfigTest(unittest.TestCase):
+
+    def test_breaker_uses_the_client_config(self):
+        from async_api_client import AsyncAPIClient
+
+        config = Config()
+        config.CIRCUIT_BREAKER = True
+        config.CIRCUIT_ERROR_RATE = 0.25
+        config.CIRCUIT_HALF_OPEN_REQUESTS = 7
+
+        for client in (APIClient(max_concurrency=1, config=config), AsyncAPIClient(max_concurrency=1, config=config)):
+            with self.subTest(client=type(client).__name__):
+                self.assertEqual(client.circuit_breaker.error_rate, 0.25)
+                self.assertEqual(client.circuit_breaker.half_open_requests, 7)
+
+if __name__ == '__main__':
+    unittest.main()
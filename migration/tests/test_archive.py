@@ -0,0 +1,119 @@
+# migration/tests/test_archive.py
+import os
+import tempfile
+import unittest
+
+from archive import ScanArchive, is_complete, save_payload
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def scan_response(chave: str, itens: int = 2, **extra):
+    response = {
+        'success': True,
+        'data': {
+            'chave': chave, 'versao': '2.00', 'tpAmb': '1', 'cIdToken': '000001', 'vSig': 'abc',
+            'emitente': {'nome': 'Mercado Ação Ltda', 'cnpj': '12345678000190'},
+            'itens': [{'descricao': f'Item {i}', 'valor': 1.5 * i} for i in range(itens)],
+            'url': 'https://sefaz/qrcode'
+        }
+    }
+    response.update(extra)
+    return response
+
+class ScanArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'archive')
+
+    def open(self, **kwargs):
+        options = dict(max_bytes=0, segment_bytes=1024 * 1024, compression='gzip')
+        options.update(kwargs)
+        return ScanArchive(self.path, **options)
+
+    def test_round_trip_survives_reopen(self):
+        archive = self.open()
+        responses = {f'{i:044d}': scan_response(f'{i:044d}') for i in range(10)}
+        for chave, response in responses.items():
+            archive.put(chave, response)
+        self.assertEqual(archive.get('0' * 44), responses['0' * 44])
+        archive.close()
+
+        archive = self.open()
+        self.addCleanup(archive.close)
+        self.assertEqual(len(archive), 10)
+        for chave, response in responses.items():
+            self.assertIn(chave, archive)
+            self.assertEqual(archive.get(chave), response)
+        self.assertIsNone(archive.get('9' * 44))
+        self.assertNotIn('9' * 44, archive)
+
+    def test_put_again_points_to_latest_copy(self):
+        archive = self.open()
+        self.addCleanup(archive.close)
+        archive.put('1' * 44, scan_response('1' * 44, itens=1))
+        archive.put('1' * 44, scan_response('1' * 44, itens=3))
+        self.assertEqual(len(archive), 1)
+        self.assertEqual(len(archive.get('1' * 44)['data']['itens']), 3)
+
+    def test_iter_records_follows_write_order(self):
+        archive = self.open(segment_bytes=600)
+        self.addCleanup(archive.close)
+        chaves = [f'{i:044d}' for i in range(20)]
+        for chave in chaves:
+            archive.put(chave, scan_response(chave))
+        self.assertGreater(archive.segments, 1)
+        self.assertEqual([chave for chave, _ in archive.iter_records()], chaves)
+
+    def test_oldest_segments_are_evicted_over_max_bytes(self):
+        archive = self.open(max_bytes=4000, segment_bytes=1000)
+        self.addCleanup(archive.close)
+        chaves = [f'{i:044d}' for i in range(200)]
+        for chave in chaves:
+            archive.put(chave, scan_response(chave, itens=5))
+
+        self.assertGreater(archive.evicted, 0)
+        self.assertLessEqual(archive.size, 4000)
+        self.assertEqual(len(archive), 200 - archive.evicted)
+        self.assertIsNone(archive.get(chaves[0]))
+        self.assertEqual(archive.get(chaves[-1]), scan_response(chaves[-1], itens=5))
+
+    @unittest.skipIf(zstandard is None, "zstandard não instalado")
+    def test_reads_entries_written_with_another_codec(self):
+        archive = self.open()
+        archive.put('2' * 44, scan_response('2' * 44))
+        archive.close()
+
+        archive = self.open(compression='zstd')
+        self.addCleanup(archive.close)
+        archive.put('3' * 44, scan_response('3' * 44))
+        self.assertEqual(archive.get('2' * 44), scan_response('2' * 44))
+        self.assertEqual(archive.get('3' * 44), scan_response('3' * 44))
+
+    def test_unknown_compression_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.open(compression='lz4')
+
+class ScanResponseTest(unittest.TestCase):
+
+    def test_complete_response(self):
+        self.assertTrue(is_complete(scan_response('4' * 44)))
+
+    def test_degraded_responses_are_not_complete(self):
+        self.assertFalse(is_complete(scan_response('4' * 44, warning='SEFAZ indisponível')))
+        self.assertFalse(is_complete(scan_response('4' * 44, itens=0)))
+        self.assertFalse(is_complete({'success': True}))
+
+    def test_save_payload_keeps_only_save_fields(self):
+        payload = save_payload(scan_response('5' * 44, itens=1))
+        self.assertEqual(
+            sorted(payload), sorted(['chave', 'versao', 'tpAmb', 'cIdToken', 'vSig', 'emitente', 'itens'])
+        )
+        self.assertEqual(payload['chave'], '5' * 44)
+
+if __name__ == '__main__':
+    unittest.main()
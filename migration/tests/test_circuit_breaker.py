@@ -0,0 +1,137 @@
+# migration/tests/test_circuit_breaker.py
+import threading
+import unittest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+class Probe:
+    """/api/status simulado: responde conforme `healthy` e conta as consultas"""
+
+    def __init__(self, healthy: bool = True):
+        self.healthy = healthy
+        self.calls = 0
+
+    def __call__(self) -> bool:
+        self.calls += 1
+        return self.healthy
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def make(self, probe=None, **kwargs):
+        options = dict(window=60, min_requests=4, error_rate=0.5, open_seconds=0.01, half_open_requests=2)
+        options.update(kwargs)
+        breaker = CircuitBreaker(probe or Probe(), **options)
+        self.addCleanup(breaker.cancel)
+        return breaker
+
+    def trip(self, breaker):
+        for success in (True, False, True, False):
+            breaker.record(success)
+
+    def wait_state(self, breaker, state, timeout=2.0):
+        with breaker._cond:
+            return breaker._cond.wait_for(lambda: breaker.state == state, timeout)
+
+    def test_stays_closed_below_min_requests(self):
+        breaker = self.make(probe=Probe(healthy=False))
+        for _ in range(3):
+            breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.try_acquire())
+
+    def test_opens_at_error_rate_and_blocks(self):
+        breaker = self.make(probe=Probe(healthy=False))
+        self.trip(breaker)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.opened_count, 1)
+        self.assertFalse(breaker.try_acquire())
+
+    def test_probe_moves_to_half_open_and_successful_trials_close(self):
+        probe = Probe(healthy=False)
+        breaker = self.make(probe=probe)
+        self.trip(breaker)
+        self.assertFalse(self.wait_state(breaker, CircuitBreaker.HALF_OPEN, timeout=0.1))
+
+        probe.healthy = True
+        self.assertTrue(self.wait_state(breaker, CircuitBreaker.HALF_OPEN))
+        self.assertGreater(probe.calls, 1)
+
+        # Só half_open_requests requisições de teste por vez
+        self.assertTrue(breaker.try_acquire())
+        self.assertTrue(breaker.try_acquire())
+        self.assertFalse(breaker.try_acquire())
+
+        breaker.record(True)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.record(True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_opens_again(self):
+        breaker = self.make()
+        self.trip(breaker)
+        self.assertTrue(self.wait_state(breaker, CircuitBreaker.HALF_OPEN))
+        self.assertTrue(breaker.try_acquire())
+        breaker.record(False)
+        self.assertIn(breaker.state, (CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN))
+        self.assertEqual(breaker.opened_count, 2)
+
+    def test_late_responses_while_open_are_ignored(self):
+        breaker = self.make(probe=Probe(healthy=False))
+        self.trip(breaker)
+        breaker.record(True)
+        breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.opened_count, 1)
+
+    def test_acquire_blocks_until_half_open(self):
+        probe = Probe(healthy=False)
+        breaker = self.make(probe=probe)
+        self.trip(breaker)
+        released = threading.Event()
+
+        def worker():
+            breaker.acquire()
+            released.set()
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self.assertFalse(released.wait(0.1))
+        probe.healthy = True
+        self.assertTrue(released.wait(2))
+        thread.join()
+
+    def test_cancel_raises_in_blocked_acquire(self):
+        breaker = self.make(probe=Probe(healthy=False))
+        self.trip(breaker)
+        errors = []
+
+        def worker():
+            try:
+                breaker.acquire()
+            except CircuitOpenError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        breaker.cancel()
+        thread.join(2)
+        self.assertEqual(len(errors), 1)
+
+    def test_listeners_are_called_on_half_open(self):
+        probe = Probe(healthy=False)
+        breaker = self.make(probe=probe)
+        woken = threading.Event()
+        breaker.add_listener(woken.set)
+        self.trip(breaker)
+        self.assertFalse(woken.is_set())
+
+        probe.healthy = True
+        self.assertTrue(woken.wait(2))
+
+        breaker.remove_listener(woken.set)
+        woken.clear()
+        breaker.cancel()
+        self.assertFalse(woken.is_set())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+# migration/tests/test_connection_pool.py
+import sqlite3
+import threading
+import unittest
+
+from connection_pool import BoundedPool, PoolTimeoutError, ThreadLocalPool
+
+class Factory:
+    """Conexões sqlite em memória, guardando todas as abertas"""
+
+    def __init__(self):
+        self.opened = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        with self._lock:
+            self.opened.append(connection)
+        return connection
+
+def is_closed(connection) -> bool:
+    try:
+        connection.execute("SELECT 1")
+        return False
+    except sqlite3.ProgrammingError:
+        return True
+
+def closed_database(error: BaseException) -> bool:
+    return 'closed database' in str(error).lower()
+
+def run_in_thread(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(5)
+
+class ThreadLocalPoolTest(unittest.TestCase):
+
+    def make(self, **kwargs):
+        self.factory = Factory()
+        pool = ThreadLocalPool(self.factory, disconnect_errors=(sqlite3.OperationalError, sqlite3.ProgrammingError),
+                               disconnect_check=closed_database, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_one_connection_per_thread(self):
+        pool = self.make()
+        with pool.connection() as first:
+            pass
+        with pool.connection() as again:
+            self.assertIs(again, first)
+
+        seen = []
+
+        def other():
+            with pool.connection() as connection:
+                seen.append(connection)
+
+        run_in_thread(other)
+        self.assertIsNot(seen[0], first)
+        self.assertEqual(len(self.factory.opened), 2)
+
+    def test_query_errors_keep_the_connection(self):
+        pool = self.make()
+        with pool.connection() as first:
+            pass
+        with self.assertRaises(sqlite3.OperationalError):
+            with pool.connection() as connection:
+                connection.execute("SELECT coluna_inexistente FROM sqlite_master")
+        self.assertFalse(is_closed(first))
+        with pool.connection() as connection:
+            self.assertIs(connection, first)
+
+    def test_lost_connection_is_replaced(self):
+        pool = self.make()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            with pool.connection() as first:
+                first.close()
+                first.execute("SELECT 1")
+        with pool.connection() as connection:
+            self.assertIsNot(connection, first)
+            self.assertEqual(connection.execute("SELECT 1").fetchone(), (1,))
+
+    def test_stale_connection_failing_ping_is_replaced(self):
+        pool = self.make(ping_interval=0)
+        with pool.connection() as first:
+            pass
+        first.close()
+        with pool.connection() as connection:
+            self.assertIsNot(connection, first)
+        self.assertEqual(pool.reconnects, 1)
+
+    def test_close_waits_for_borrowed_connections(self):
+        pool = self.make()
+        borrowed = threading.Event()
+        closed = threading.Event()
+        results = []
+
+        def worker():
+            with pool.connection() as connection:
+                borrowed.set()
+                closed.wait(5)
+                results.append(connection.execute("SELECT 1").fetchone())
+            results.append(is_closed(connection))
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        borrowed.wait(5)
+        with pool.connection() as own:
+            pass
+
+        pool.close()
+        self.assertTrue(is_closed(own))
+        self.assertEqual(pool.size, 1)
+        closed.set()
+        thread.join(5)
+
+        self.assertEqual(results, [(1,), True])
+        self.assertEqual(pool.size, 0)
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+
+    def test_finished_threads_connections_are_closed(self):
+        pool = self.make()
+
+        def worker():
+            with pool.connection():
+                pass
+
+        run_in_thread(worker)
+        orphan = self.factory.opened[0]
+        with pool.connection():
+            pass
+        self.assertTrue(is_closed(orphan))
+        self.assertEqual(pool.size, 1)
+
+class BoundedPoolTest(unittest.TestCase):
+
+    def make(self, max_size=2, **kwargs):
+        self.factory = Factory()
+        pool = BoundedPool(self.factory, max_size=max_size,
+                           disconnect_errors=(sqlite3.OperationalError, sqlite3.ProgrammingError),
+                           disconnect_check=closed_database, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuses_most_recently_released(self):
+        pool = self.make()
+        first = pool.acquire()
+        second = pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        self.assertIs(pool.acquire(), second)
+        self.assertEqual(len(self.factory.opened), 2)
+
+    def test_times_out_when_exhausted(self):
+        pool = self.make(max_size=1)
+        pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire(timeout=0.05)
+
+    def test_waiter_gets_released_connection(self):
+        pool = self.make(max_size=1)
+        held = pool.acquire()
+        got = []
+        thread = threading.Thread(target=lambda: got.append(pool.acquire(timeout=5)), daemon=True)
+        thread.start()
+        pool.release(held)
+        thread.join(5)
+        self.assertEqual(got, [held])
+
+    def test_disconnect_frees_the_slot_but_query_errors_do_not(self):
+        pool = self.make(max_size=1)
+        with self.assertRaises(sqlite3.OperationalError):
+            with pool.connection() as connection:
+                connection.execute("SELECT * FROM tabela_inexistente")
+        self.assertEqual(pool.size, 1)
+        self.assertFalse(is_closed(connection))
+
+        with self.assertRaises(sqlite3.ProgrammingError):
+            with pool.connection() as connection:
+                connection.close()
+                connection.execute("SELECT 1")
+        self.assertEqual(pool.size, 0)
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, connection)
+
+    def test_close_closes_idle_and_later_released(self):
+        pool = self.make()
+        idle = pool.acquire()
+        busy = pool.acquire()
+        pool.release(idle)
+        pool.close()
+        self.assertTrue(is_closed(idle))
+        self.assertFalse(is_closed(busy))
+        pool.release(busy)
+        self.assertTrue(is_closed(busy))
+        self.assertEqual(pool.size, 0)
+
+    def test_reconnects_are_counted_across_threads(self):
+        pool = self.make(max_size=8, ping_interval=0)
+        connections = [pool.acquire() for _ in range(8)]
+        for connection in connections:
+            pool.release(connection)
+            connection.close()
+
+        # Cada thread segura a sua até todas pegarem uma: as 8 fechadas são trocadas
+        barrier = threading.Barrier(8)
+
+        def worker():
+            connection = pool.acquire()
+            barrier.wait(5)
+            pool.release(connection)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(pool.reconnects, 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# migration/tests/test_follow.py
+import os
+import tempfile
+import unittest
+
+from config import Config
+from engine import MigrationEngine
+from logger import MigrationStats
+from sources import DatabaseSource
+from tests.test_sources import create_db
+
+class FollowTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'old.sqlite')
+        create_db(path, 6)
+        config = Config()
+        config.ERROR_FILE = os.path.join(tmp.name, 'erros.jsonl')
+        config.FOLLOW_SAFETY_LAG = 0
+        self.engine = MigrationEngine(workers=1, config=config, source=DatabaseSource.sqlite(path, config=config))
+        self.engine.source.connect()
+        self.addCleanup(self.engine.source.disconnect)
+        self.engine.follow_pending = {}
+
+    def read_ids(self):
+        return [nota['id'] for notas in self.engine.read_changes(10, 100) for nota in notas]
+
+    def test_transient_failure_counted_once(self):
+        notas = {nota['id']: nota for nota in self.engine.source.connector.get_notas_alteradas(limit=10)}
+        self.assertEqual(self.read_ids(), [1, 2, 3, 4, 5, 6])
+
+        timeout = {'success': False, 'error': 'timeout', 'retryable': True}
+        self.engine.handle_result(notas[2], timeout)
+        # Volta no próximo ciclo sem contar como falha nem somar de novo no total
+        self.assertEqual(self.engine.stats.failed_notas, 0)
+        self.assertEqual(self.read_ids(), [2])
+        self.assertEqual(self.engine.stats.total_notas, 6)
+
+        self.engine.handle_result(notas[2], {'success': True, 'message': 'ok'})
+        self.assertEqual(self.engine.stats.successful_notas, 1)
+        self.assertEqual(self.engine.stats.failed_notas, 0)
+        self.assertNotIn(2, self.engine.follow_pending)
+
+    def test_skips_migrated_notas(self):
+        # Checkpoint de uma execução anterior: sucesso e duplicada não são reenviadas
+        self.engine.completed_ids = {1, 4}
+        self.assertEqual(self.read_ids(), [2, 3, 5, 6])
+
+        self.engine.store_result(2, MigrationStats.DUPLICATE, 'duplicada')
+        self.engine.store_result(3, MigrationStats.FAILURE, 'rejeitada')
+        self.engine.follow_position = None
+        self.engine.follow_done = {}
+        # Falha definitiva volta se a nota for relida; duplicada não, e 5 e 6
+        # seguem em andamento
+        self.assertEqual(self.read_ids(), [3])
+
+if __name__ == '__main__':
+    unittest.main()
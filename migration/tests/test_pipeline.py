@@ -0,0 +1,95 @@
+# migration/tests/test_pipeline.py
+import threading
+import unittest
+
+from pipeline import MigrationPipeline
+
+def make_batches(total: int, size: int):
+    notas = [{'id': i} for i in range(total)]
+    return lambda: (notas[i:i + size] for i in range(0, total, size))
+
+class SerialPipeline:
+    """Envio síncrono: cada nota vira um desfecho na hora do dispatch"""
+
+    def __init__(self, total: int = 50, size: int = 7, **kwargs):
+        self.recorded = []
+        self.pipeline = MigrationPipeline(
+            read=make_batches(total, size),
+            prepare=lambda notas: notas,
+            dispatch=self.dispatch,
+            drain=lambda: False,
+            record=lambda nota_id, status, message: self.recorded.append((nota_id, status)),
+            **kwargs
+        )
+
+    def dispatch(self, notas):
+        for nota in notas:
+            self.pipeline.put_result(nota['id'], 'success', '')
+
+class MigrationPipelineTest(unittest.TestCase):
+
+    def test_records_every_nota_in_read_order(self):
+        serial = SerialPipeline(total=50, size=7, queue_size=1, result_queue_size=1)
+        serial.pipeline.run(interval=0.01)
+        self.assertEqual([nota_id for nota_id, _ in serial.recorded], list(range(50)))
+
+    def test_prepare_can_drop_a_whole_batch(self):
+        serial = SerialPipeline(total=20, size=5)
+        serial.pipeline.prepare = lambda notas: [nota for nota in notas if nota['id'] >= 10]
+        serial.pipeline.run(interval=0.01)
+        self.assertEqual([nota_id for nota_id, _ in serial.recorded], list(range(10, 20)))
+
+    def test_resubmitted_notas_go_through_the_dispatch_thread(self):
+        pending = []          # Notas com nova tentativa marcada
+        dispatch_threads = set()
+        recorded = []
+        lock = threading.Lock()
+
+        def dispatch(notas):
+            dispatch_threads.add(threading.current_thread().name)
+            for nota in notas:
+                if nota.get('tentativas'):
+                    pipeline.put_result(nota['id'], 'success', '')
+                else:
+                    with lock:
+                        pending.append(dict(nota, tentativas=1))
+
+        def drain():
+            # Como o RetryScheduler: devolve as pendentes pela fila de envio
+            with lock:
+                due, pending[:] = list(pending), []
+            if due:
+                pipeline.resubmit(due)
+            return bool(due)
+
+        pipeline = MigrationPipeline(
+            read=make_batches(12, 4),
+            prepare=lambda notas: notas,
+            dispatch=dispatch,
+            drain=drain,
+            record=lambda nota_id, status, message: recorded.append(nota_id)
+        )
+        pipeline.run(interval=0.01)
+
+        self.assertEqual(sorted(recorded), list(range(12)))
+        self.assertEqual(dispatch_threads, {'pipeline-envio'})
+
+    def test_stage_error_is_raised_by_run(self):
+        serial = SerialPipeline()
+
+        def prepare(notas):
+            raise RuntimeError("falha no preparo")
+
+        serial.pipeline.prepare = prepare
+        with self.assertRaisesRegex(RuntimeError, "falha no preparo"):
+            serial.pipeline.run(interval=0.01)
+        self.assertTrue(serial.pipeline.stopped)
+
+    def test_put_result_after_stop_records_directly(self):
+        serial = SerialPipeline(total=10, size=10)
+        serial.pipeline.stop()
+        serial.pipeline.put_result(99, 'failed', 'interrompida')
+        self.assertEqual(serial.recorded, [(99, 'failed')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# migration/tests/test_rate_limiter.py
+import threading
+import unittest
+
+from rate_limiter import AdaptiveConcurrency, TokenBucket
+
+class AdaptiveConcurrencyTest(unittest.TestCase):
+
+    def respond(self, limiter, count, overloaded=False, latency=0.01):
+        for _ in range(count):
+            limiter.acquire()
+            limiter.release(overloaded, latency)
+
+    def test_additive_increase_is_one_per_window(self):
+        limiter = AdaptiveConcurrency(initial=4, maximum=100)
+        self.respond(limiter, 4)
+        self.assertAlmostEqual(limiter.limit, 5, delta=0.2)
+        self.respond(limiter, 5)
+        self.assertAlmostEqual(limiter.limit, 6, delta=0.2)
+
+    def test_increase_stops_at_maximum(self):
+        limiter = AdaptiveConcurrency(initial=2, maximum=3)
+        self.respond(limiter, 50)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_overload_halves_once_per_latency(self):
+        limiter = AdaptiveConcurrency(initial=16, maximum=16)
+        # Rajada de 503 dentro da mesma latência: uma redução só
+        self.respond(limiter, 5, overloaded=True, latency=60)
+        self.assertEqual(limiter.limit, 8)
+
+    def test_decrease_respects_minimum(self):
+        limiter = AdaptiveConcurrency(initial=4, minimum=3, maximum=16)
+        self.respond(limiter, 3, overloaded=True, latency=0)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_slow_responses_ignored_by_default(self):
+        limiter = AdaptiveConcurrency(initial=4, maximum=16)
+        self.respond(limiter, 10, latency=0.01)
+        self.respond(limiter, 1, latency=5.0)
+        self.assertGreater(limiter.limit, 4)
+        self.assertIsNone(limiter.baseline)
+
+    def test_latency_spike_counts_as_overload_with_tolerance(self):
+        limiter = AdaptiveConcurrency(initial=8, maximum=8, latency_tolerance=3)
+        self.respond(limiter, 20, latency=0.01)
+        self.assertEqual(limiter.limit, 8)
+        self.assertAlmostEqual(limiter.baseline, 0.01)
+
+        self.respond(limiter, 1, latency=0.1)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_jitter_within_tolerance_keeps_growing(self):
+        limiter = AdaptiveConcurrency(initial=4, maximum=100, latency_tolerance=3)
+        for latency in (0.010, 0.018, 0.006, 0.025, 0.012) * 4:
+            self.respond(limiter, 1, latency=latency)
+        self.assertGreater(limiter.limit, 6)
+
+    def test_try_acquire_respects_limit(self):
+        limiter = AdaptiveConcurrency(initial=2, maximum=2)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release(False, 0.01)
+        self.assertTrue(limiter.try_acquire())
+
+    def test_acquire_waits_for_a_release(self):
+        limiter = AdaptiveConcurrency(initial=1, maximum=1)
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def worker():
+            limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        limiter.release(False, 0.01)
+        self.assertTrue(acquired.wait(2))
+        thread.join()
+        self.assertEqual(limiter.in_flight, 1)
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_zero_rate_never_waits(self):
+        bucket = TokenBucket(0)
+        self.assertEqual([bucket.reserve() for _ in range(100)], [0.0] * 100)
+
+    def test_burst_then_waits_one_interval_per_token(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0] * 3)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# migration/tests/test_retry.py
+import threading
+import unittest
+
+from api_client import APIClient
+from retry import RetryScheduler, backoff_delay
+
+class Resubmits:
+    """Coleta os lotes entregues pelo scheduler"""
+
+    def __init__(self):
+        self.batches = []
+        self.threads = set()
+        self.arrived = threading.Event()
+
+    def __call__(self, notas):
+        self.batches.append([nota['id'] for nota in notas])
+        self.threads.add(threading.current_thread().name)
+        self.arrived.set()
+
+class BackoffDelayTest(unittest.TestCase):
+
+    def test_stays_between_half_and_full_delay(self):
+        for attempt in range(6):
+            expected = min(8.0, 0.5 * 2 ** attempt)
+            for _ in range(50):
+                delay = backoff_delay(attempt, 0.5, 8.0)
+                self.assertGreaterEqual(delay, expected / 2)
+                self.assertLessEqual(delay, expected)
+
+    def test_is_capped(self):
+        self.assertLessEqual(backoff_delay(30, 1.0, 10.0), 10.0)
+
+class RetrySchedulerTest(unittest.TestCase):
+
+    def make(self, max_retries=3, base_delay=0.01, max_delay=0.05):
+        resubmits = Resubmits()
+        scheduler = RetryScheduler(resubmits, max_retries=max_retries,
+                                   base_delay=base_delay, max_delay=max_delay)
+        self.addCleanup(scheduler.close)
+        return scheduler, resubmits
+
+    def test_due_notas_are_resubmitted_on_the_scheduler_thread(self):
+        scheduler, resubmits = self.make()
+        scheduler.start()
+        for i in range(5):
+            self.assertTrue(scheduler.schedule({'id': i}, "503"))
+
+        self.assertTrue(scheduler.join(timeout=2))
+        self.assertEqual(sorted(sum(resubmits.batches, [])), list(range(5)))
+        self.assertEqual(resubmits.threads, {'retry-scheduler'})
+        self.assertEqual(scheduler.pending, 0)
+        self.assertEqual(scheduler.scheduled, 5)
+
+    def test_counts_attempts_and_stops_at_max_retries(self):
+        scheduler, _ = self.make(max_retries=2)
+        nota = {'id': 1}
+        self.assertTrue(scheduler.schedule(nota))
+        self.assertTrue(scheduler.schedule(nota))
+        self.assertEqual(nota['tentativas'], 2)
+        self.assertFalse(scheduler.schedule(nota))
+        self.assertEqual(scheduler.scheduled, 2)
+
+    def test_earlier_deadline_is_delivered_first(self):
+        scheduler, resubmits = self.make(base_delay=0.2, max_delay=0.2)
+        # Agendada primeiro, mas vence depois (0.1–0.2s contra até 0.01s)
+        scheduler.schedule({'id': 'tarde', 'tentativas': 0})
+        scheduler.base_delay = scheduler.max_delay = 0.01
+        scheduler.schedule({'id': 'cedo', 'tentativas': 0})
+        scheduler.start()
+
+        self.assertTrue(scheduler.join(timeout=2))
+        self.assertEqual(sum(resubmits.batches, []), ['cedo', 'tarde'])
+
+    def test_join_times_out_while_notas_are_waiting(self):
+        scheduler, _ = self.make(base_delay=5, max_delay=5)
+        scheduler.start()
+        scheduler.schedule({'id': 1})
+        self.assertFalse(scheduler.join(timeout=0.05))
+        self.assertEqual(scheduler.pending, 1)
+
+    def test_close_drops_pending_and_refuses_new_notas(self):
+        scheduler, resubmits = self.make(base_delay=5, max_delay=5)
+        scheduler.start()
+        scheduler.schedule({'id': 1})
+        scheduler.close()
+
+        self.assertEqual(scheduler.pending, 0)
+        self.assertTrue(scheduler.join(timeout=0.1))
+        self.assertFalse(scheduler.schedule({'id': 2}))
+        self.assertEqual(resubmits.batches, [])
+
+    def test_resubmit_error_does_not_stop_the_thread(self):
+        delivered = []
+
+        def resubmit(notas):
+            if not delivered:
+                delivered.append(None)
+                raise RuntimeError("fila cheia")
+            delivered.extend(nota['id'] for nota in notas)
+
+        scheduler = RetryScheduler(resubmit, max_retries=3, base_delay=0.01, max_delay=0.01)
+        self.addCleanup(scheduler.close)
+        scheduler.start()
+        scheduler.schedule({'id': 1})
+        self.assertTrue(scheduler.join(timeout=2))
+        scheduler.schedule({'id': 2})
+        self.assertTrue(scheduler.join(timeout=2))
+        self.assertEqual(delivered, [None, 2])
+
+class RetryableFailureTest(unittest.TestCase):
+
+    def test_transient_statuses_are_retried(self):
+        for status in (408, 429, 500, 502, 503):
+            self.assertTrue(APIClient.is_retryable_failure({'status_code': status}), status)
+
+    def test_rejections_are_final(self):
+        for status in (400, 401, 404, 409, 422):
+            self.assertFalse(APIClient.is_retryable_failure({'status_code': status}), status)
+
+    def test_without_status_uses_retryable_flag(self):
+        self.assertTrue(APIClient.is_retryable_failure({'retryable': True}))
+        self.assertFalse(APIClient.is_retryable_failure({'error': 'inesperado'}))
+
+if __name__ == '__main__':
+    unittest.main()
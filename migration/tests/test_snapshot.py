@@ -0,0 +1,140 @@
+# migration/tests/test_snapshot.py
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from snapshot import ITEM_FIELDS, NOTA_FIELDS, SnapshotReader, SnapshotWriter
+from sources import SnapshotSource
+
+def nota(nota_id: int):
+    return {
+        'id': nota_id, 'chave': f'{nota_id:044d}', 'versao': '2.00', 'ambiente': 1,
+        'cIdToken': '000001', 'vSig': 'assinatura', 'cnpjEmitente': '12345678000190',
+        'nomeEmitente': 'Padaria São João', 'ieEmitente': None,
+        'createdAt': datetime(2024, 5, 1, 12, 30, nota_id % 60), 'updatedAt': '2024-05-02 08:00:00'
+    }
+
+def itens(nota_id: int):
+    return [
+        {'id': nota_id * 10 + i, 'codigo': f'C{i}', 'descricao': 'Pão francês', 'quantidade': Decimal('0.350'),
+         'unidade': 'KG', 'valorUnitario': 12.9, 'valorTotal': Decimal('4.52'), 'notaFiscalId': nota_id,
+         'createdAt': date(2024, 5, 1), 'updatedAt': None}
+        for i in range(nota_id % 3)
+    ]
+
+class SnapshotCase(unittest.TestCase):
+    """Snapshot de teste num diretório temporário"""
+
+    IDS = [42, 7, 19, 3, 100, 58]  # Ordem do export, não a dos ids
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'notas.snap')
+
+    def export(self, with_itens: bool = True):
+        writer = SnapshotWriter(self.path, NOTA_FIELDS, ITEM_FIELDS if with_itens else None,
+                                metadata={'origem': 'teste'})
+        for nota_id in self.IDS:
+            writer.write(nota(nota_id), itens(nota_id))
+        writer.close()
+
+    def open(self):
+        reader = SnapshotReader(self.path)
+        self.addCleanup(reader.close)
+        return reader
+
+class SnapshotTest(SnapshotCase):
+
+    def test_records_round_trip_with_driver_types(self):
+        self.export()
+        reader = self.open()
+        self.assertEqual(len(reader), len(self.IDS))
+        self.assertEqual(reader.metadata['origem'], 'teste')
+        for position, nota_id in enumerate(self.IDS):
+            self.assertEqual(reader.record(position), (nota(nota_id), itens(nota_id)))
+        self.assertEqual(reader.record(0, with_itens=False), (nota(42), None))
+
+    def test_get_by_id(self):
+        self.export()
+        reader = self.open()
+        self.assertEqual(reader.get(19), (nota(19), itens(19)))
+        self.assertIsNone(reader.get(20))
+        self.assertIsNone(reader.get(1000))
+
+    def test_without_itens(self):
+        self.export(with_itens=False)
+        reader = self.open()
+        self.assertFalse(reader.has_itens)
+        self.assertEqual(reader.record(1), (nota(7), None))
+
+    def test_shard_positions(self):
+        self.export()
+        reader = self.open()
+        self.assertEqual(list(reader.positions()), list(range(len(self.IDS))))
+        shards = [[reader.ids[p] for p in reader.positions((i, 3))] for i in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(self.IDS))
+        for index, ids in enumerate(shards):
+            self.assertTrue(all(nota_id % 3 == index for nota_id in ids))
+
+    def test_truncated_file_is_rejected(self):
+        self.export()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 5)
+        with self.assertRaisesRegex(ValueError, "incompleto"):
+            SnapshotReader(self.path)
+
+    def test_other_files_are_rejected(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'SQLite format 3\x00' + bytes(100))
+        with self.assertRaisesRegex(ValueError, "não é um snapshot"):
+            SnapshotReader(self.path)
+
+    def test_abort_leaves_no_file(self):
+        writer = SnapshotWriter(self.path, NOTA_FIELDS)
+        writer.write(nota(1))
+        writer.abort()
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_unsupported_type(self):
+        writer = SnapshotWriter(self.path, ['id', 'extra'])
+        self.addCleanup(writer.abort)
+        with self.assertRaises(TypeError):
+            writer.write({'id': 1, 'extra': {'a': 1}})
+
+class SnapshotSourceTest(SnapshotCase):
+
+    def source(self, shard=None):
+        source = SnapshotSource(self.path, shard=shard)
+        source.connect()
+        self.addCleanup(source.disconnect)
+        return source
+
+    def test_batches_follow_export_order(self):
+        self.export()
+        source = self.source()
+        batches = list(source.iter_batches(4))
+        self.assertEqual([[n['id'] for n in batch] for batch in batches], [[42, 7, 19, 3], [100, 58]])
+        self.assertEqual(
+            [n['id'] for batch in source.iter_batches(2, limit=3, offset=1) for n in batch], [7, 19, 3]
+        )
+
+    def test_shard_count_and_itens(self):
+        self.export()
+        source = self.source(shard=(1, 2))
+        self.assertEqual(source.count(), 3)
+        self.assertEqual([n['id'] for batch in source.iter_batches(10) for n in batch], [7, 19, 3])
+        self.assertEqual(source.get_itens_notas([7, 8]), {7: itens(7), 8: []})
+
+    def test_follow_and_itens_errors(self):
+        self.export(with_itens=False)
+        source = self.source()
+        with self.assertRaises(ValueError):
+            source.iter_changes(10)
+        with self.assertRaisesRegex(ValueError, "sem itens"):
+            source.get_itens_notas([7])
+
+if __name__ == '__main__':
+    unittest.main()
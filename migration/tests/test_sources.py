@@ -0,0 +1,84 @@
+# migration/tests/test_sources.py
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from config import Config
+from sources import DatabaseSource
+
+def create_db(path: str, total: int) -> None:
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE notas_fiscais (
+            id INTEGER PRIMARY KEY, chave TEXT, versao TEXT, ambiente TEXT, cIdToken TEXT, vSig TEXT,
+            cnpjEmitente TEXT, nomeEmitente TEXT, ieEmitente TEXT, createdAt TEXT, updatedAt TEXT
+        )
+    """)
+    connection.executemany(
+        "INSERT INTO notas_fiscais VALUES (?, ?, '2.00', '1', '000001', 'sig', NULL, NULL, NULL, ?, ?)",
+        [
+            # Pares de notas com o mesmo createdAt: o id desempata
+            (i, f'{i:044d}', f'2024-01-01 00:00:{i // 2:02d}', f'2024-01-02 00:00:{i // 2:02d}')
+            for i in range(1, total + 1)
+        ]
+    )
+    connection.commit()
+    connection.close()
+
+class DatabaseSourceTest(unittest.TestCase):
+
+    TOTAL = 23
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'old.sqlite')
+        create_db(self.path, self.TOTAL)
+
+    def source(self, read_mode: str):
+        config = Config()
+        config.SQLITE_ACCESS = 'ro'
+        source = DatabaseSource.sqlite(self.path, config, read_mode=read_mode, prefetch=4)
+        source.connect()
+        self.addCleanup(source.disconnect)
+        return source
+
+    def read_ids(self, source, **kwargs):
+        return [nota['id'] for batch in source.iter_batches(5, **kwargs) for nota in batch]
+
+    def test_read_modes_return_the_same_notas(self):
+        expected = list(range(self.TOTAL, 0, -1))  # createdAt DESC, id DESC
+        for read_mode in ('keyset', 'offset', 'stream'):
+            with self.subTest(read_mode=read_mode):
+                source = self.source(read_mode)
+                self.assertEqual(self.read_ids(source), expected)
+                self.assertEqual(self.read_ids(source, limit=7, offset=3), expected[3:10])
+
+    def test_query_error_mid_read_is_raised(self):
+        for read_mode in ('keyset', 'offset'):
+            with self.subTest(read_mode=read_mode):
+                source = self.source(read_mode)
+                fetch = source.connector._fetch
+                pages = []
+
+                def failing_fetch(query, params=None):
+                    if pages:
+                        raise sqlite3.OperationalError("disk I/O error")
+                    pages.append(query)
+                    return fetch(query, params)
+
+                source.connector._fetch = failing_fetch
+                batches = source.iter_batches(5)
+                self.assertEqual(len(next(batches)), 5)
+                # Lista vazia aqui encerraria a leitura como se a tabela tivesse acabado
+                with self.assertRaises(sqlite3.OperationalError):
+                    next(batches)
+
+    def test_changes_in_updated_order(self):
+        source = self.source('keyset')
+        batches = list(source.iter_changes(10, after=('2024-01-02 00:00:05', 10)))
+        self.assertEqual([nota['id'] for batch in batches for nota in batch], list(range(11, self.TOTAL + 1)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# migration/tests/test_validation.py
+import random
+import unittest
+
+from validation import dv_mod11, validate_batch, validate_chave, validate_nota
+
+def dv_reference(chave43: str) -> int:
+    """Módulo 11 do manual da NF-e, dígito a dígito (pesos 2..9 da direita)"""
+    soma = 0
+    peso = 2
+    for digito in reversed(chave43):
+        soma += int(digito) * peso
+        peso = 2 if peso == 9 else peso + 1
+    resto = soma % 11
+    return 0 if resto in (0, 1) else 11 - resto
+
+def chave_valida(rng: random.Random) -> str:
+    base = ''.join(rng.choice('0123456789') for _ in range(43))
+    return base + str(dv_reference(base))
+
+class DvMod11Test(unittest.TestCase):
+
+    def test_matches_reference_implementation(self):
+        rng = random.Random(42)
+        for _ in range(2000):
+            base = ''.join(rng.choice('0123456789') for _ in range(43))
+            self.assertEqual(dv_mod11(base), dv_reference(base), base)
+
+    def test_remainders_zero_and_one_give_zero(self):
+        self.assertEqual(dv_mod11('0' * 43), 0)
+        # soma 12 (6 × peso 2): resto 1
+        self.assertEqual(dv_mod11('0' * 42 + '6'), 0)
+
+class ValidateChaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.chave = chave_valida(random.Random(7))
+
+    def test_valid_chave(self):
+        self.assertIsNone(validate_chave(self.chave))
+
+    def test_wrong_dv(self):
+        errado = str((int(self.chave[43]) + 1) % 10)
+        motivo = validate_chave(self.chave[:43] + errado)
+        self.assertIn("DV não confere", motivo)
+
+    def test_wrong_length_or_characters(self):
+        for chave in (self.chave[:43], self.chave + '0', self.chave[:43] + 'X', ''):
+            self.assertIn("formato", validate_chave(chave), chave)
+
+    def test_non_ascii_digits_are_rejected(self):
+        # '٣' é dígito para str.isdigit, mas não para o servidor
+        self.assertIn("formato", validate_chave(self.chave[:10] + '٣' + self.chave[11:]))
+
+    def test_only_format_and_dv_are_checked(self):
+        # UF, modelo e série fora do usual: o servidor aceita, a validação também
+        base = '99' + '0' * 18 + '77' + '0' * 21
+        self.assertIsNone(validate_chave(base + str(dv_reference(base))))
+
+class ValidateBatchTest(unittest.TestCase):
+
+    def test_splits_valid_and_invalid(self):
+        rng = random.Random(3)
+        boa = {'id': 1, 'chave': ' ' + chave_valida(rng) + '\n'}
+        sem_chave = {'id': 2}
+        curta = {'id': 3, 'chave': '123'}
+
+        validas, invalidas = validate_batch([boa, sem_chave, curta])
+
+        self.assertEqual(validas, [boa])
+        self.assertEqual([nota['id'] for nota, _ in invalidas], [2, 3])
+        self.assertIsNone(validate_nota(boa))
+
+if __name__ == '__main__':
+    unittest.main()
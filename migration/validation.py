@@ -0,0 +1,47 @@
+# migration/validation.py
+import re
+from operator import mul
+from typing import Any, Dict, List, Optional, Tuple
+
+# Mesmas regras do decodeChave do servidor (44 dígitos e DV): a validação
+# local só adianta recusas que o scan faria, nunca recusa algo que ele aceita
+_CHAVE_RE = re.compile(r'\d{44}', re.ASCII)
+
+# Pesos do módulo 11 (2..9 da direita para a esquerda) para os 43 primeiros
+# dígitos. Somando os bytes ASCII direto, o deslocamento de '0' (48) é
+# descontado uma vez só no fim, sem converter dígito a dígito.
+_PESOS_DV = tuple((2, 3, 4, 5, 6, 7, 8, 9)[(42 - i) % 8] for i in range(43))
+_DESLOCAMENTO_ASCII = ord('0') * sum(_PESOS_DV)
+
+def dv_mod11(chave43: str) -> int:
+    """Dígito verificador da chave de acesso (mesma regra do dvMod11 do servidor)"""
+    soma = sum(map(mul, chave43.encode('ascii'), _PESOS_DV)) - _DESLOCAMENTO_ASCII
+    dv = 11 - soma % 11
+    return 0 if dv >= 10 else dv
+
+def validate_chave(chave: str) -> Optional[str]:
+    """Retorna o motivo da rejeição da chave, ou None se for válida"""
+    if not _CHAVE_RE.fullmatch(chave):
+        return f"Chave inválida (formato): esperado 44 dígitos, recebido {len(chave)} caracteres"
+
+    dv = dv_mod11(chave[:43])
+    if int(chave[43]) != dv:
+        return f"Chave inválida: DV não confere (calculado {dv}, informado {chave[43]})"
+
+    return None
+
+def validate_nota(nota: Dict[str, Any]) -> Optional[str]:
+    """Valida a chave do QR Code da nota; retorna o motivo ou None"""
+    return validate_chave(str(nota.get('chave', '')).strip())
+
+def validate_batch(notas: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], str]]]:
+    """Separa o lote em (válidas, [(inválida, motivo), ...]) sem nenhuma requisição"""
+    validas = []
+    invalidas = []
+    for nota in notas:
+        motivo = validate_nota(nota)
+        if motivo:
+            invalidas.append((nota, motivo))
+        else:
+            validas.append(nota)
+    return validas, invalidas
@@ -117,6 +117,33 @@ router.get('/', async (req, res) => {
   }
 });
 
+// Rota para listar só as chaves salvas, paginadas por id (keyset)
+// Usada pela pré-verificação da migração, que percorre a tabela inteira: sem
+// contagem de itens, COUNT(*) nem OFFSET, cada página custa o mesmo que a primeira
+router.get('/chaves', async (req, res) => {
+  try {
+    const after = parseInt(req.query.after) || 0;
+    const limit = Math.min(parseInt(req.query.limit) || 1000, 5000);
+
+    const rows = await NotaFiscal.findAll({
+      attributes: ['id', 'chave'],
+      where: { id: { [Op.gt]: after } },
+      order: [['id', 'ASC']],
+      limit,
+      raw: true
+    });
+
+    res.json({
+      chaves: rows.map(row => row.chave).filter(Boolean),
+      // id da última linha: passado em ?after= para a próxima página (null no fim)
+      next: rows.length === limit ? rows[rows.length - 1].id : null
+    });
+  } catch (error) {
+    console.error('Erro ao listar chaves:', error);
+    res.status(500).json({ message: 'Erro interno ao listar chaves.', error: error.message });
+  }
+});
+
 // Rota para buscar itens por nome (para a nova tela de busca)
 router.get('/itens/buscar', async (req, res) => {
   try {
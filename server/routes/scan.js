@@ -154,16 +154,15 @@ function parseNfceText(text) {
     return out;
 }
 
-// Rota para processar QR Code e buscar detalhes
-router.post('/process', async (req, res) => {
+// Processa um QR Code (parse, busca de detalhes e salvamento) e devolve
+// { status, body } com o status HTTP e o corpo da resposta
+async function processarQrCode(qrCode) {
     try {
-        const { qrCode } = req.body;
-
         if (!qrCode) {
-            return res.status(400).json({ 
+            return { status: 400, body: { 
                 success: false, 
                 message: 'QR Code é obrigatório' 
-            });
+            } };
         }
 
         console.log("QR Code recebido para processamento:", qrCode);
@@ -171,10 +170,10 @@ router.post('/process', async (req, res) => {
         // Parse do QR Code
         const nfceData = parseQrNfce(qrCode);
         if (!nfceData) {
-            return res.status(400).json({ 
+            return { status: 400, body: { 
                 success: false, 
                 message: 'QR Code não é uma NFC-e válida' 
-            });
+            } };
         }
 
         console.log("Dados básicos da NFC-e extraídos:", nfceData);
@@ -231,22 +230,22 @@ router.post('/process', async (req, res) => {
                     }, 0);
                 }
                 
-                res.json({
+                return { status: 200, body: {
                     success: true,
                     data: nfceData,
                     message: 'NFC-e processada e salva com sucesso',
                     salva: resultadoSalvamento
-                });
+                } };
             } catch (salvamentoError) {
                 console.error("Erro ao salvar NFC-e automaticamente:", salvamentoError);
                 // Mesmo com erro de salvamento, retorna os dados processados
-                res.json({
+                return { status: 200, body: {
                     success: true,
                     data: nfceData,
                     message: 'NFC-e processada com sucesso (erro ao salvar)',
                     warning: 'Dados processados mas não salvos no banco',
                     error: salvamentoError.message
-                });
+                } };
             }
 
         } catch (fetchError) {
@@ -276,33 +275,85 @@ router.post('/process', async (req, res) => {
                     }, 0);
                 }
                 
-                res.json({
+                return { status: 200, body: {
                     success: true,
                     data: nfceData,
                     message: 'NFC-e processada e salva (dados básicos do QR Code)',
                     warning: 'Detalhes adicionais não disponíveis (CORS/UF)',
                     salva: resultadoSalvamento
-                });
+                } };
             } catch (salvamentoError) {
                 console.error("Erro ao salvar NFC-e automaticamente (dados básicos):", salvamentoError);
-                res.json({
+                return { status: 200, body: {
                     success: true,
                     data: nfceData,
                     message: 'NFC-e processada (dados básicos do QR Code)',
                     warning: 'Detalhes adicionais não disponíveis (CORS/UF)',
                     error: 'Dados processados mas não salvos no banco'
-                });
+                } };
             }
         }
 
     } catch (error) {
         console.error('Erro ao processar QR Code:', error);
-        res.status(500).json({ 
+        return { status: 500, body: { 
             success: false, 
             message: 'Erro interno ao processar QR Code', 
             error: error.message 
+        } };
+    }
+}
+
+// Rota para processar QR Code e buscar detalhes
+router.post('/process', async (req, res) => {
+    const { qrCode } = req.body;
+    const { status, body } = await processarQrCode(qrCode);
+    res.status(status).json(body);
+});
+
+// Máximo de QR Codes por chamada de /process-batch e quantos são processados ao mesmo tempo
+const SCAN_BATCH_MAX = parseInt(process.env.SCAN_BATCH_MAX) || 100;
+const SCAN_BATCH_CONCURRENCY = parseInt(process.env.SCAN_BATCH_CONCURRENCY) || 4;
+
+// Rota para processar vários QR Codes em uma única requisição (migração em lote).
+// Cada item recebe o mesmo resultado que teria em /process, na ordem de envio.
+router.post('/process-batch', async (req, res) => {
+    const { qrCodes } = req.body;
+
+    if (!Array.isArray(qrCodes) || qrCodes.length === 0) {
+        return res.status(400).json({ 
+            success: false, 
+            message: 'qrCodes deve ser uma lista não vazia' 
+        });
+    }
+
+    if (qrCodes.length > SCAN_BATCH_MAX) {
+        return res.status(413).json({ 
+            success: false, 
+            message: `Máximo de ${SCAN_BATCH_MAX} QR Codes por lote` 
         });
     }
+
+    const results = new Array(qrCodes.length);
+    let proximo = 0;
+
+    // Pequeno pool de workers: cada um pega o próximo índice livre
+    async function worker() {
+        while (proximo < qrCodes.length) {
+            const index = proximo++;
+            const { status, body } = await processarQrCode(qrCodes[index]);
+            results[index] = { index, status, ...body };
+        }
+    }
+
+    const workers = Array.from({ length: Math.min(SCAN_BATCH_CONCURRENCY, qrCodes.length) }, worker);
+    await Promise.all(workers);
+
+    res.json({
+        success: true,
+        total: results.length,
+        results
+    });
 });
 
 // Função para buscar dados de CNPJ existente no banco